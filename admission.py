@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Admission control for the write endpoints.
+
+POSTs to order creation and the contact / reservation forms end in SQLite
+writes and synchronous SMTP. Each request must get a token from two token
+buckets, one for the client IP on that endpoint and one for the endpoint as a
+whole, and then a slot under a global cap on concurrent writers. Otherwise it
+is turned away at once with 429 and Retry-After instead of queueing behind
+the writers. Counters are kept per endpoint for tuning against load tests.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, request
+
+# endpoint -> ((per-IP rate/s, per-IP burst), (endpoint rate/s, endpoint burst)).
+# Venue kiosks and guests on the venue Wi-Fi share one IP, so per-IP limits
+# for orders are generous.
+ENDPOINT_LIMITS = {
+    'create_order': ((0.5, 10), (5.0, 30)),
+    'contact_page': ((1 / 60, 3), (0.5, 10)),
+    'reservations_page': ((1 / 60, 3), (0.5, 10)),
+}
+# Requests allowed inside writer endpoints at the same time
+MAX_CONCURRENT_WRITERS = int(os.environ.get('ADMISSION_MAX_WRITERS', '4'))
+# Retry-After sent when only the writer cap is exhausted
+BUSY_RETRY_AFTER = 1
+# Per-IP buckets kept in memory; the least recently used are dropped first
+MAX_TRACKED_CLIENTS = 10000
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def wait(self, now: float) -> float:
+        """Refill; return 0 if a token is available, else seconds until one is."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Take the token wait() found available."""
+        self.tokens -= 1
+
+
+class AdmissionController:
+    def __init__(self, limits=ENDPOINT_LIMITS, max_writers=MAX_CONCURRENT_WRITERS):
+        self.limits = limits
+        self.max_writers = max_writers
+        self.lock = threading.Lock()
+        self.client_buckets = OrderedDict()
+        self.endpoint_buckets = {endpoint: TokenBucket(*endpoint_limit)
+                                 for endpoint, (_client_limit, endpoint_limit) in limits.items()}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.counters = {endpoint: {'admitted': 0, 'rejected_client': 0, 'rejected_endpoint': 0,
+                                    'rejected_busy': 0} for endpoint in limits}
+
+    def admit(self, endpoint: str, client: str):
+        """Try to admit a request; returns None if admitted, else the Retry-After in seconds."""
+        now = time.monotonic()
+        with self.lock:
+            counters = self.counters[endpoint]
+            key = (client, endpoint)
+            bucket = self.client_buckets.get(key)
+            if bucket is None:
+                bucket = self.client_buckets[key] = TokenBucket(*self.limits[endpoint][0])
+                if len(self.client_buckets) > MAX_TRACKED_CLIENTS:
+                    self.client_buckets.popitem(last=False)
+            else:
+                self.client_buckets.move_to_end(key)
+
+            # Tokens are only taken once every check has passed, so a
+            # rejected request does not count against its client
+            endpoint_bucket = self.endpoint_buckets[endpoint]
+            wait = bucket.wait(now)
+            if wait:
+                counters['rejected_client'] += 1
+                return wait
+            wait = endpoint_bucket.wait(now)
+            if wait:
+                counters['rejected_endpoint'] += 1
+                return wait
+            if self.in_flight >= self.max_writers:
+                counters['rejected_busy'] += 1
+                return BUSY_RETRY_AFTER
+
+            bucket.take()
+            endpoint_bucket.take()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            counters['admitted'] += 1
+            return None
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        """Return admission counters."""
+        with self.lock:
+            return {
+                'max_writers': self.max_writers,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'tracked_clients': len(self.client_buckets),
+                'endpoints': {endpoint: dict(counters) for endpoint, counters in self.counters.items()},
+            }
+
+
+admission = AdmissionController()
+
+
+def client_address():
+    """The client IP, taken from X-Forwarded-For only when the request came through the local proxy."""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if forwarded and request.remote_addr in LOOPBACK_ADDRESSES:
+        # nginx appends the address it saw, so the last entry is the trustworthy one
+        return forwarded.split(',')[-1].strip()
+    return request.remote_addr or 'unknown'
+
+
+def admit_request():
+    """before_request hook: shed write requests once capacity is exhausted."""
+    if request.method != 'POST' or request.endpoint not in admission.limits:
+        return None
+
+    retry_after = admission.admit(request.endpoint, client_address())
+    if retry_after is None:
+        g.admission_slot = True
+        return None
+
+    retry_after = max(1, math.ceil(retry_after))
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': 'Too many requests, please retry shortly', 'retry_after': retry_after})
+    else:
+        response = current_app.response_class(
+            'Too many requests right now. Please try again in a moment.', mimetype='text/plain')
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def release_request(_exc=None):
+    """teardown_request hook: free the writer slot taken by admit_request."""
+    if g.pop('admission_slot', False):
+        admission.release()
+
+
+def init_admission(app):
+    """Install the admission hooks."""
+    app.before_request(admit_request)
+    app.teardown_request(release_request)
@@ -1,22 +1,33 @@
 from flask import Flask, render_template, request, session, redirect, url_for, jsonify, send_file, flash
-from database import MenuDatabase
-import qrcode
-from PIL import Image
+from database import MenuDatabase, IdempotencyKeyReused
+from compression import init_compression, compressed_cache
+from admission import init_admission, admission
+from css_bundles import init_css_bundles
+from image_resolver import get_image_index, init_image_resolver, negotiated_image_url
+from offline import init_offline
+from static_assets import init_static_assets
+from warmup import init_warmup
+from order_qr import InvalidOrderQR, ORDER_NUMBER_PATTERN, sign_order, verify_order
+from reservations import (AVAILABILITY_MAX_DAYS, DATE_FORMAT, InvalidReservation, RESERVATION_SLOTS,
+                          SlotFull, check_slot, parse_day, reservation_seats)
 import os
 from dotenv import load_dotenv
 import io
 import json
+import hashlib
 from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+import sqlite3
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY')
+init_compression(app)
+init_admission(app)
+init_css_bundles(app)
+init_image_resolver(app)
+init_static_assets(app)
+init_offline(app)
 
 # Email configuration
 EMAIL_ADDRESS = os.getenv('EMAIL_ADDRESS')  
@@ -26,9 +37,41 @@ SMTP_PORT = os.getenv('SMTP_PORT')
 
 # Initialize database
 db = MenuDatabase()
+compressed_cache.shared_cache = db.shared_cache
+
+# Locations with a database-driven menu
+MENU_LOCATIONS = ['okinawa', 'nikko', 'fuji']
+# Menu categories rendered with the page; the rest load on scroll
+INITIAL_MENU_CATEGORIES = 1
+MENU_API_MAX_AGE = 60
+# index.js fetches the gallery list on every page load
+GALLERY_API_MAX_AGE = 3600
+MENU_SEARCH_LIMIT = 20
+MENU_SEARCH_MAX_QUERY = 100
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+# Order QR codes are signed with QR_SIGNING_KEY (SECRET_KEY if unset); set one
+# of them in production or codes stop verifying after a restart
+QR_SIGNING_KEY = (os.getenv('QR_SIGNING_KEY') or app.secret_key or '').encode('utf-8')
+if not QR_SIGNING_KEY:
+    print("Warning: no QR_SIGNING_KEY or SECRET_KEY set, using a random QR signing key")
+    QR_SIGNING_KEY = os.urandom(32)
+# Accept scanned codes that hold only an order number (issued before signing)
+QR_ALLOW_UNSIGNED = os.getenv('QR_ALLOW_UNSIGNED', '0') == '1'
+# Item options shown to staff, in display order: (order item key, kind, label prefix)
+SCAN_ITEM_OPTIONS = (
+    ('selectedCurry', 'curry', ''),
+    ('selectedCurry2', 'curry', 'Curry 2: '),
+    ('spiceLevelText', 'spice', ''),
+    ('drinkText', 'drink', ''),
+)
 
 def send_email(to_email, subject, body, is_html=False):
     """Send email using Gmail SMTP"""
+    # Imported on first use to keep them out of app start-up
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
     try:
         msg = MIMEMultipart()
         msg['From'] = EMAIL_ADDRESS
@@ -241,6 +284,34 @@ def about_page():
     """About us page"""
     return render_template('about.html', content=get_content(), lang=get_language(), is_restaurant_page=False)
 
+# Reservation form fields stored in their own columns; the rest go to details
+RESERVATION_COLUMN_FIELDS = ('reservation_type', 'restaurant_location', 'reservation_date',
+                             'reservation_time', 'representative_name', 'email', 'phone')
+
+def book_reservation(form, reservation_type):
+    """Check a reservation form and book its seats; returns (reservation_id, error message)."""
+    restaurant_location = form.get('restaurant_location', '')
+    if restaurant_location not in MENU_LOCATIONS:
+        return None, 'Please choose one of our restaurants.'
+    try:
+        reservation_id = db.create_reservation({
+            'reservation_type': reservation_type,
+            'restaurant_location': restaurant_location,
+            'day': check_slot(form.get('reservation_date', ''), form.get('reservation_time', '')),
+            'slot': form.get('reservation_time', ''),
+            'seats': reservation_seats(form),
+            'representative_name': form.get('representative_name', ''),
+            'email': form.get('email', ''),
+            'phone': form.get('phone', ''),
+            'details': {key: value for key, value in form.items()
+                        if value and key not in RESERVATION_COLUMN_FIELDS}
+        })
+    except SlotFull as e:
+        return None, f"{e}. Please choose another time."
+    except InvalidReservation as e:
+        return None, str(e)
+    return reservation_id, None
+
 @app.route('/contact', methods=['GET', 'POST'])
 def contact_page():
     """Main contact page"""
@@ -298,6 +369,12 @@ Submitted on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             guide_meals = request.form.get('guide_meals', '')
             
             if email and restaurant_location and reservation_date and reservation_time:
+                # Book the seats first; a full slot is turned away before any email goes out
+                reservation_id, error = book_reservation(request.form, reservation_type)
+                if error:
+                    flash(error, 'error')
+                    return redirect(url_for('contact_page'))
+                
                 # Create reservation email
                 restaurant_names = {
                     'nikko': 'Taj Nikko (日光店)',
@@ -308,7 +385,7 @@ Submitted on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                 subject = f"New {reservation_type.replace('_', ' ').title()} Reservation - {restaurant_names.get(restaurant_location, restaurant_location)}"
                 
                 body = f"""
-New {reservation_type.replace('_', ' ').title()} Reservation:
+New {reservation_type.replace('_', ' ').title()} Reservation #{reservation_id}:
 
 Restaurant: {restaurant_names.get(restaurant_location, restaurant_location)}
 Date: {reservation_date}
@@ -342,10 +419,10 @@ Guide Meals: {guide_meals}
                 
                 body += f"Submitted on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                 
-                if send_email(EMAIL_ADDRESS, subject, body):
-                    flash('Thank you for your reservation! We will confirm your booking soon.', 'success')
-                else:
-                    flash('Sorry, there was an error processing your reservation. Please try again.', 'error')
+                # The reservation is already stored, so a failed email must not send the guest to book again
+                if not send_email(EMAIL_ADDRESS, subject, body):
+                    print(f"Reservation {reservation_id} was stored but its email could not be sent")
+                flash('Thank you for your reservation! We will confirm your booking soon.', 'success')
             else:
                 flash('Please fill in all required fields.', 'error')
         
@@ -384,6 +461,12 @@ def reservations_page():
         guide_meals = request.form.get('guide_meals', '')
         
         if email and restaurant_location and reservation_date and reservation_time:
+            # Book the seats first; a full slot is turned away before any email goes out
+            reservation_id, error = book_reservation(request.form, reservation_type)
+            if error:
+                flash(error, 'error')
+                return redirect(url_for('reservations_page'))
+            
             # Create reservation email
             restaurant_names = {
                 'nikko': 'Taj Nikko (日光店)',
@@ -394,7 +477,7 @@ def reservations_page():
             subject = f"New {reservation_type.replace('_', ' ').title()} Reservation - {restaurant_names.get(restaurant_location, restaurant_location)}"
             
             body = f"""
-New {reservation_type.replace('_', ' ').title()} Reservation:
+New {reservation_type.replace('_', ' ').title()} Reservation #{reservation_id}:
 
 Restaurant: {restaurant_names.get(restaurant_location, restaurant_location)}
 Date: {reservation_date}
@@ -430,10 +513,10 @@ Guide Meals: {guide_meals}
             
             body += f"Submitted on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
             
-            if send_email(EMAIL_ADDRESS, subject, body):
-                flash('Thank you for your reservation! We will confirm your booking soon.', 'success')
-            else:
-                flash('Sorry, there was an error processing your reservation. Please try again.', 'error')
+            # The reservation is already stored, so a failed email must not send the guest to book again
+            if not send_email(EMAIL_ADDRESS, subject, body):
+                print(f"Reservation {reservation_id} was stored but its email could not be sent")
+            flash('Thank you for your reservation! We will confirm your booking soon.', 'success')
         else:
             flash('Please fill in all required fields.', 'error')
         
@@ -492,10 +575,23 @@ def restaurant_menu(location):
     """Restaurant menu page"""
     restaurant_data = get_restaurant_data(location)
     
-    # Get menu data from database for okinawa, nikko and fuji
+    # Get menu data from database for okinawa, nikko and fuji. Only the first
+    # categories are rendered inline; the rest are fetched from
+    # /api/menu/<location>/categories/<id> as they scroll into view
     menu_data = None
-    if location in ['okinawa', 'nikko', 'fuji']:
-        menu_data = db.get_menu_by_location(location)
+    if location in MENU_LOCATIONS:
+        categories = []
+        for index, category in enumerate(db.get_menu_categories(location)):
+            category = dict(category)
+            if index < INITIAL_MENU_CATEGORIES:
+                category['items'] = db.get_category_items(location, category['id'])
+            else:
+                category['items'] = None
+            categories.append(category)
+        menu_data = {
+            'categories': categories,
+            'sets': db.get_set_menus_by_location(location)
+        }
     
     return render_template('food-menu.html', 
                          restaurant=restaurant_data, 
@@ -537,6 +633,9 @@ def restaurant_contact(location):
     restaurant_data = get_restaurant_data(location)
     return render_template('contact.html', restaurant=restaurant_data, content=get_content(), lang=get_language(), is_restaurant_page=True)
 
+# location -> (gallery folder mtime, images)
+gallery_listings = {}
+
 def get_gallery_images(location):
     """Get gallery images for a specific restaurant location"""
     import glob
@@ -558,6 +657,12 @@ def get_gallery_images(location):
     if not os.path.exists(gallery_path):
         return []
     
+    # Reuse the last listing until the folder changes
+    folder_mtime = os.path.getmtime(gallery_path)
+    cached = gallery_listings.get(location)
+    if cached and cached[0] == folder_mtime:
+        return cached[1]
+    
     # Get all webp, jpg, jpeg, png files
     image_extensions = ['*.webp', '*.jpg', '*.jpeg', '*.png']
     images = []
@@ -579,6 +684,7 @@ def get_gallery_images(location):
             'alt': f"{location.title()} Restaurant Gallery Image"
         })
     
+    gallery_listings[location] = (folder_mtime, gallery_images)
     return gallery_images
 
 def get_restaurant_data(location):
@@ -644,8 +750,9 @@ def update_menu_image(item_id):
         elif image_path.startswith('/static/'):
             image_path = image_path[8:]  # Remove '/static/' prefix
         
-        # Generate the proper Flask URL
-        image_url = url_for('static', filename=image_path)
+        # Store the extensionless /img/ URL when the image is indexed so the
+        # format is negotiated per client; otherwise the plain static URL
+        image_url = negotiated_image_url(url_for('static', filename=image_path))
         db.update_menu_item_image(item_id, image_url, image_alt)
     
     return redirect(url_for('admin_menu'))
@@ -660,45 +767,87 @@ def update_set_menu_location(set_id):
     
     return redirect(url_for('admin_set_menus'))
 
+def store_order(data, idempotency_key=None, default_location='unknown'):
+    """Validate, re-price and store an order; returns (response body, HTTP status).
+    
+    Shared by the create-order view and the async order server, which add
+    the QR code themselves.
+    """
+    # Validate required fields
+    if not data or 'items' not in data or 'total_amount' not in data:
+        return {'error': 'Invalid order data'}, 400
+    
+    if not isinstance(data['items'], list) or not data['items']:
+        return {'error': 'Invalid order data'}, 400
+    
+    # Add restaurant location from session or request
+    restaurant_location = data.get('restaurant_location', default_location)
+    # The location goes into the signed QR payload, so only known branches
+    # (or 'unknown' for orders placed off a branch page) are accepted
+    if restaurant_location not in MENU_LOCATIONS and restaurant_location != 'unknown':
+        return {'error': 'Unknown restaurant location'}, 400
+    
+    # Re-price the cart from the menu; the client's total is only recorded
+    total_amount, price_problems, unit_prices = db.get_price_index().price_cart(data['items'], restaurant_location)
+    if price_problems:
+        print(f"Order pricing problems ({restaurant_location}): {'; '.join(price_problems)}")
+    client_total = data['total_amount']
+    price_mismatch = bool(price_problems) or client_total != total_amount
+    if price_mismatch:
+        print(f"Order total mismatch ({restaurant_location}): client {client_total}, menu {total_amount}")
+    
+    # Each line keeps the unit price it was charged; the sales rollups count
+    # revenue at that price, whatever the menu says later
+    items = [dict(line, charged_price=price) if isinstance(line, dict) else line
+             for line, price in zip(data['items'], unit_prices)]
+    
+    order_data = {
+        'items': items,
+        'total_amount': total_amount,
+        'client_total': client_total,
+        'price_mismatch': price_mismatch,
+        'restaurant_location': restaurant_location,
+        'customer_info': data.get('customer_info', {})
+    }
+    
+    # A retried request carries the same key and gets the original order back
+    idempotency_key = (idempotency_key or '').strip() or None
+    if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return {'error': 'Idempotency-Key too long'}, 400
+    
+    # Create order in database
+    try:
+        order_number = db.create_order(order_data, idempotency_key)
+    except IdempotencyKeyReused:
+        return {'error': 'Idempotency-Key was already used for a different order'}, 422
+    
+    return {
+        'success': True,
+        'order_number': order_number,
+        'restaurant_location': restaurant_location,
+        'total_amount': total_amount
+    }, 200
+
 @app.route('/api/create-order', methods=['POST'])
 def create_order():
     """Create a new order and generate QR code"""
     try:
-        data = request.get_json()
-        
-        # Validate required fields
-        if not data or 'items' not in data or 'total_amount' not in data:
-            return jsonify({'error': 'Invalid order data'}), 400
-        
-        # Add restaurant location from session or request
-        restaurant_location = data.get('restaurant_location', session.get('current_restaurant', 'unknown'))
-        
-        order_data = {
-            'items': data['items'],
-            'total_amount': data['total_amount'],
-            'restaurant_location': restaurant_location,
-            'customer_info': data.get('customer_info', {})
-        }
-        
-        # Create order in database
-        order_number = db.create_order(order_data)
-        
-        # Generate QR code
-        qr_code_url = generate_qr_code(order_number)
-        
-        return jsonify({
-            'success': True,
-            'order_number': order_number,
-            'qr_code_url': qr_code_url
-        })
+        body, status = store_order(request.get_json(), request.headers.get('Idempotency-Key'),
+                                   session.get('current_restaurant', 'unknown'))
+        if status == 200:
+            body['qr_code_url'] = generate_qr_code(body['order_number'], body['restaurant_location'])
+        return jsonify(body), status
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def generate_qr_code(order_number):
+def generate_qr_code(order_number, restaurant_location=''):
     """Generate QR code for order (in-memory only, no file saving)"""
-    # Generate QR code data (just the order number)
-    qr_data = order_number
+    # qrcode pulls in PIL; only pay for it when an order is placed
+    import qrcode
+
+    # Signed order number + branch + time, checked by the scanner endpoint
+    qr_data = sign_order(QR_SIGNING_KEY, order_number, restaurant_location)
     
     # Create QR code
     qr = qrcode.QRCode(
@@ -786,6 +935,65 @@ def view_order(order_number):
         traceback.print_exc()
         return f"Error loading order: {str(e)}", 500
 
+@app.route('/api/admin/orders/scan', methods=['POST'])
+def scan_order():
+    """Compact order lookup for the QR scanner.
+    
+    Takes a scanned QR payload or a typed order number, plus the scanner's
+    branch. Signed payloads are checked before any lookup, and open orders
+    are read from the in-memory order board.
+    """
+    data = request.get_json(silent=True) or {}
+    location = data.get('restaurant_location') or None
+    payload = str(data.get('payload') or '').strip()
+    order_number = str(data.get('order_number') or '').strip()
+    
+    if payload:
+        try:
+            order_number = verify_order(QR_SIGNING_KEY, payload, location)[0]
+        except InvalidOrderQR as e:
+            if not (e.reason == 'malformed' and QR_ALLOW_UNSIGNED and ORDER_NUMBER_PATTERN.match(payload)):
+                return jsonify({'error': str(e), 'reason': e.reason}), 400 if e.reason == 'malformed' else 403
+            order_number = payload
+    elif not ORDER_NUMBER_PATTERN.match(order_number):
+        return jsonify({'error': 'Invalid order number', 'reason': 'malformed'}), 400
+    
+    order = db.get_open_order(order_number)
+    if not order:
+        return jsonify({'error': f"Order {order_number} not found or already processed", 'reason': 'not_found'}), 404
+    if location and order['restaurant_location'] != location:
+        return jsonify({'error': f"This order was placed at Taj {order['restaurant_location'].title()}",
+                        'reason': 'wrong_location'}), 403
+    
+    items = []
+    for item in order['items']:
+        options = [[kind, f"{prefix}{item[key]}"] for key, kind, prefix in SCAN_ITEM_OPTIONS if item.get(key)]
+        if item.get('portion'):
+            options.append(['portion', str(item['portion']).upper()])
+        items.append({
+            'name': db.get_english_name_for_item(item.get('id'), item.get('type', 'menu_item')) or item.get('name'),
+            'quantity': item.get('quantity', 1),
+            'price': item.get('price'),
+            'options': options
+        })
+    
+    return jsonify({
+        'order_number': order['order_number'],
+        'restaurant_location': order['restaurant_location'],
+        'status': order['status'],
+        'created_at': order['created_at'],
+        'total_amount': order['total_amount'],
+        'items': items
+    })
+
+@app.route('/api/order/<order_number>/status')
+def order_status(order_number):
+    """Current status of an order"""
+    status = db.get_order_status(order_number)
+    if status is None:
+        return jsonify({'error': 'Order not found'}), 404
+    return jsonify({'order_number': order_number, 'status': status})
+
 @app.route('/admin/order/<order_number>/complete', methods=['POST'])
 def complete_order(order_number):
     """Mark order as completed"""
@@ -798,6 +1006,94 @@ def complete_order_by_location(order_number, restaurant_location):
     db.update_order_status(order_number, 'completed')
     return redirect(url_for('admin_orders_by_location', restaurant_location=restaurant_location))
 
+@app.route('/admin/reports/sales')
+def admin_sales_report():
+    """Sales report for a day range, read from the rollup tables only"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    start_day = request.args.get('from', today)
+    end_day = request.args.get('to', start_day)
+    location = request.args.get('location')
+    
+    try:
+        for day in (start_day, end_day):
+            datetime.strptime(day, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if location and location not in MENU_LOCATIONS:
+        return jsonify({'error': 'Unknown location'}), 404
+    
+    return jsonify(db.get_sales_report(start_day, end_day, location))
+
+def reservation_range(default_days=1):
+    """Return (location, from, to) from the query string; raises InvalidReservation."""
+    from datetime import timedelta
+    
+    location = request.args.get('location', '')
+    if location not in MENU_LOCATIONS:
+        raise InvalidReservation('Unknown location')
+    start = parse_day(request.args.get('from') or datetime.now().strftime(DATE_FORMAT))
+    end = parse_day(request.args['to']) if request.args.get('to') else start + timedelta(days=default_days - 1)
+    if end < start or (end - start).days >= AVAILABILITY_MAX_DAYS:
+        raise InvalidReservation(f"The date range must be 1 to {AVAILABILITY_MAX_DAYS} days")
+    return location, start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+
+@app.route('/api/reservations/availability')
+def reservation_availability():
+    """Open reservation slots per day for a location and date range, read from the slot counters"""
+    try:
+        location, start_day, end_day = reservation_range(default_days=7)
+    except InvalidReservation as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        guests = max(int(request.args.get('guests', '1')), 1)
+    except ValueError:
+        return jsonify({'error': 'guests must be a number'}), 400
+    
+    return jsonify(db.get_availability(location, start_day, end_day, guests))
+
+@app.route('/admin/reservations')
+def admin_reservations():
+    """Booked reservations for a location and date range"""
+    try:
+        location, start_day, end_day = reservation_range()
+    except InvalidReservation as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'reservations': db.get_reservations(location, start_day, end_day)})
+
+@app.route('/admin/reservation/<int:reservation_id>/cancel', methods=['POST'])
+def cancel_reservation(reservation_id):
+    """Cancel a reservation and free its seats"""
+    if not db.cancel_reservation(reservation_id):
+        return jsonify({'error': 'Reservation not found or already cancelled'}), 404
+    return jsonify({'success': True, 'message': 'Reservation cancelled'})
+
+@app.route('/admin/reservations/capacity', methods=['POST'])
+def set_reservation_capacity():
+    """Set the seat capacity of one slot, e.g. 0 to close it"""
+    data = request.get_json(silent=True) or {}
+    location = data.get('restaurant_location')
+    try:
+        day = parse_day(data.get('date')).strftime(DATE_FORMAT)
+        capacity = int(data.get('capacity'))
+    except (InvalidReservation, TypeError, ValueError):
+        return jsonify({'error': 'date (YYYY-MM-DD) and capacity are required'}), 400
+    if location not in MENU_LOCATIONS or data.get('time') not in RESERVATION_SLOTS or capacity < 0:
+        return jsonify({'error': 'Unknown location or time, or negative capacity'}), 400
+    
+    db.set_slot_capacity(location, day, data['time'], capacity)
+    return jsonify({'success': True})
+
+@app.route('/admin/stats')
+def admin_stats():
+    """Admission, compression, group-commit, order-board and shared-cache counters for load-test tuning"""
+    return jsonify({
+        'admission': admission.stats(),
+        'compression_cache': compressed_cache.stats(),
+        'group_commit': db.writer_stats(),
+        'order_board': db.order_board.stats(),
+        'shared_cache': db.shared_cache.stats() if db.shared_cache else None
+    })
+
 @app.route('/admin/collect-order')
 def collect_order():
     """QR code scanner interface for collecting orders"""
@@ -839,10 +1135,126 @@ def api_gallery_images(location):
     """API endpoint to get gallery images for a specific location"""
     try:
         gallery_images = get_gallery_images(location)
-        return jsonify(gallery_images)
+        response = jsonify(gallery_images)
+        response.headers['Cache-Control'] = f'public, max-age={GALLERY_API_MAX_AGE}'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/menu/<location>/categories/<int:category_id>')
+def api_menu_category(location, category_id):
+    """API endpoint to get the items of one menu category at a location"""
+    if location not in MENU_LOCATIONS:
+        return jsonify({'error': 'Unknown location'}), 404
+
+    items = [menu_item_json(item) for item in db.get_category_items(location, category_id)]
+    response = jsonify({'category_id': category_id, 'items': items})
+    response.headers['Cache-Control'] = f'public, max-age={MENU_API_MAX_AGE}'
+    return response
+
+def menu_item_json(item):
+    """A menu item as the category API and the menu snapshot return it"""
+    return {
+        'id': item['id'],
+        'name_en': item['name_en'],
+        'name_jp': item['name_jp'],
+        'description_en': item['description_en'],
+        'description_jp': item['description_jp'],
+        'display_price': item['display_price'],
+        'price_2p': item['price_2p'],
+        'price_4p': item['price_4p'],
+        'image_url': negotiated_image_url(item['image_url']),
+        'image_alt': item['image_alt'],
+        'is_spicy': bool(item['is_spicy'])
+    }
+
+def menu_snapshot(location):
+    """A location's whole menu as compact JSON; returns (version, body), the version being a hash of the body"""
+    menu = {
+        'restaurant_location': location,
+        'categories': [{
+            'id': category['id'],
+            'name_en': category['name_en'],
+            'name_jp': category['name_jp'],
+            'items': [menu_item_json(item) for item in db.get_category_items(location, category['id'])]
+        } for category in db.get_menu_categories(location)],
+        'sets': [{
+            'id': set_menu['id'],
+            'name_en': set_menu['name_en'],
+            'name_jp': set_menu['name_jp'],
+            'description_en': set_menu['description_en'],
+            'description_jp': set_menu['description_jp'],
+            'price': set_menu['price'],
+            'image_url': negotiated_image_url(set_menu['image_url']),
+            'contents': set_menu['contents'],
+            'choices': set_menu['choices']
+        } for set_menu in db.get_set_menus_by_location(location)]
+    }
+    body = json.dumps(menu, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:16], body
+
+@app.route('/api/menu/<location>/snapshot')
+def api_menu_snapshot(location):
+    """Versioned menu snapshot for the service worker; revalidate with If-None-Match"""
+    if location not in MENU_LOCATIONS:
+        return jsonify({'error': 'Unknown location'}), 404
+    
+    version, body = menu_snapshot(location)
+    if request.if_none_match.contains(version):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/menu/search')
+def api_menu_search():
+    """API endpoint to search menu items and set menus by EN/JP name or description"""
+    query = request.args.get('q', '').strip()[:MENU_SEARCH_MAX_QUERY]
+    location = request.args.get('location') or None
+    if location and location not in MENU_LOCATIONS:
+        return jsonify({'error': 'Unknown location'}), 404
+    try:
+        limit = min(max(int(request.args.get('limit', MENU_SEARCH_LIMIT)), 1), MENU_SEARCH_LIMIT)
+    except ValueError:
+        limit = MENU_SEARCH_LIMIT
+
+    try:
+        matches = db.search_menu(query, location, limit)
+    except sqlite3.OperationalError as e:
+        print(f"Menu search failed: {e}")
+        return jsonify({'error': 'Search unavailable'}), 503
+
+    results = []
+    for match in matches:
+        result = {
+            'kind': match['kind'],
+            'id': match['id'],
+            'name_en': match['name_en'],
+            'name_jp': match['name_jp'],
+            'description_en': match['description_en'],
+            'description_jp': match['description_jp'],
+            'display_price': match['display_price'],
+            'image_url': negotiated_image_url(match['image_url']),
+        }
+        if match['kind'] == 'menu_item':
+            result.update({
+                'category_id': match['category_id'],
+                'price_2p': match['price_2p'],
+                'price_4p': match['price_4p'],
+                'image_alt': match['image_alt'],
+                'is_spicy': bool(match['is_spicy'])
+            })
+        else:
+            # Lets the cart open the curry modal without another request
+            result['choices'] = match.get('choices', [])
+        results.append(result)
+
+    response = jsonify({'query': query, 'location': location, 'results': results})
+    response.headers['Cache-Control'] = f'public, max-age={MENU_API_MAX_AGE}'
+    return response
+
 @app.route('/api/menu-items')
 def api_menu_items():
     """API endpoint to get menu items by category"""
@@ -883,6 +1295,47 @@ def api_menu_items():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+# Pages requested once at startup, so their rendered and gzipped bodies are cached
+WARMUP_PAGES = ['/'] + [f'/taj-{location}' for location in MENU_LOCATIONS] + \
+               [f'/taj-{location}/menu' for location in MENU_LOCATIONS]
+
+def warm_templates():
+    """Compile every template into the Jinja cache"""
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+def warm_menus():
+    """Fill the menu caches: each location's categories, items, sets and snapshot, and the price index"""
+    for location in MENU_LOCATIONS:
+        menu_snapshot(location)
+    db.get_price_index()
+    db.get_english_name_for_item(0)
+    return len(MENU_LOCATIONS)
+
+def warm_galleries():
+    """Build the image index and each location's gallery listing"""
+    get_image_index()
+    return sum(len(get_gallery_images(location)) for location in MENU_LOCATIONS)
+
+def warm_pages():
+    """Render the busiest pages once"""
+    client = app.test_client()
+    failed = [path for path in WARMUP_PAGES
+              if client.get(path, headers={'Accept-Encoding': 'gzip'}).status_code != 200]
+    if failed:
+        raise RuntimeError(f"pages failed to render: {', '.join(failed)}")
+    return len(WARMUP_PAGES)
+
+warmup = init_warmup(app, [
+    ('templates', warm_templates),
+    ('menus', warm_menus),
+    ('galleries', warm_galleries),
+    ('orders', db.warm_order_stores),
+    ('pages', warm_pages),
+], probe=db.ping)
+
 if __name__ == '__main__':
     localhost = '0.0.0.0'
     # For HTTPS with self-signed certificate 
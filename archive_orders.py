@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Move old finished orders out of the hot `orders` table.
+
+Completed and rejected orders older than --days are copied into the archive
+database (taj_menu_archive.db by default) and deleted from taj_menu.db in
+batches, one transaction per batch. MenuDatabase.get_order falls back to the
+archive, so old QR codes keep resolving. Safe to run from cron:
+
+    ORDER_ARCHIVE_DAYS=30 python3 archive_orders.py
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from database import MenuDatabase
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ORDER_ARCHIVE_DAYS", "30"))
+BATCH_SIZE = int(os.environ.get("ORDER_ARCHIVE_BATCH", "500"))
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Archive finished orders older than a given age")
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive orders finished more than this many days ago")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="orders moved per transaction")
+    parser.add_argument('--dry-run', action='store_true', help="only count what would be moved")
+    args = parser.parse_args()
+
+    db = MenuDatabase()
+    if args.dry_run:
+        count = db.archive_orders(args.days, dry_run=True)
+        print(f"{count} orders older than {args.days} days would be moved to {db.archive_path}")
+        return 0
+
+    try:
+        moved = db.archive_orders(args.days, batch_size=args.batch_size)
+    except sqlite3.IntegrityError as e:
+        print(f"Archiving stopped, an order is already in {db.archive_path}: {e}")
+        return 1
+    print(f"Moved {moved} orders older than {args.days} days to {db.archive_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Order-insert throughput with and without group commit.
+
+Copies taj_menu.db to a temporary directory, then for each thread count has
+every thread create --orders-per-thread orders through MenuDatabase, once
+with the group-commit writer and once with one transaction per order:
+
+    python3 bench_group_commit.py --threads 1 2 4 8 16 32
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from database import MenuDatabase
+
+DEFAULT_THREADS = [1, 2, 4, 8, 16, 32]
+ORDERS_PER_THREAD = 50
+SAMPLE_ORDER = {
+    'customer_info': {'name': 'Benchmark'},
+    'items': [{'id': 1, 'type': 'menu_item', 'quantity': 1, 'price': 1000}],
+    'total_amount': 1000,
+    'restaurant_location': 'okinawa',
+}
+
+
+def run(db_path: str, threads: int, per_thread: int, group_commit: bool):
+    """Create threads * per_thread orders; return (orders/sec, writer stats)."""
+    db = MenuDatabase(db_path=db_path)
+    db.group_commit = group_commit
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(per_thread):
+                db.create_order(SAMPLE_ORDER)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return threads * per_thread / elapsed, db.writer_stats()
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Benchmark group commit for order inserts")
+    parser.add_argument('--db', default='taj_menu.db', help="database to copy for the benchmark")
+    parser.add_argument('--threads', type=int, nargs='+', default=DEFAULT_THREADS,
+                        help="thread counts to measure")
+    parser.add_argument('--orders-per-thread', type=int, default=ORDERS_PER_THREAD)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(args.db, db_path)
+
+        print(f"{'threads':>7}  {'direct/s':>9}  {'grouped/s':>9}  {'speedup':>7}  {'avg batch':>9}")
+        for threads in args.threads:
+            direct, _ = run(db_path, threads, args.orders_per_thread, group_commit=False)
+            grouped, stats = run(db_path, threads, args.orders_per_thread, group_commit=True)
+            print(f"{threads:>7}  {direct:>9.0f}  {grouped:>9.0f}  {grouped / direct:>6.2f}x  "
+                  f"{stats['average_batch']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
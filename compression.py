@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Response compression for the Taj website.
+
+Static text assets are served from gzip-precompressed siblings written by
+precompress_static.py, dynamic HTML/JSON responses are gzipped on the fly.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from flask import request, send_from_directory
+
+# Responses smaller than this are not worth the gzip header overhead
+MIN_COMPRESS_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESSIBLE_MIMETYPES = ('text/html', 'application/json')
+# Number of compressed page bodies kept in memory
+COMPRESSED_CACHE_SIZE = 256
+
+
+def accepts_gzip():
+    """Check whether the current request accepts gzip encoding.
+
+    gzip must be listed, or covered by *, with a non-zero quality:
+    "gzip;q=0" and "identity, *;q=0" both refuse it.
+    """
+    return request.accept_encodings['gzip'] > 0
+
+
+def add_vary(response, header):
+    """Add a header name to the Vary header of a response."""
+    if header not in response.vary:
+        response.vary.add(header)
+    return response
+
+
+class CompressedBodyCache:
+    """Small LRU of compressed bodies keyed by a digest of the plain body."""
+
+    def __init__(self, max_entries: int = COMPRESSED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # SharedCache consulted before compressing, so each page body is
+        # gzipped once per host rather than once per worker
+        self.shared_cache = None
+
+    def get_or_compress(self, body: bytes) -> bytes:
+        """Return the gzipped body, compressing it only on a cache miss."""
+        key = hashlib.sha1(body).digest()
+        with self.lock:
+            compressed = self.entries.get(key)
+            if compressed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return compressed
+            self.misses += 1
+
+        shared = self.shared_cache
+        compressed = shared.get('gzip', key.hex()) if shared else None
+        if compressed is None:
+            compressed = gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+            if shared:
+                shared.put('gzip', key.hex(), compressed)
+
+        with self.lock:
+            self.entries[key] = compressed
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return compressed
+
+    def stats(self):
+        """Return cache counters."""
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+compressed_cache = CompressedBodyCache()
+
+
+def compress_response(response):
+    """Gzip an HTML/JSON response if the client accepts it and it is large enough."""
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    add_vary(response, 'Accept-Encoding')
+
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or not (200 <= response.status_code < 300)
+            or not accepts_gzip()):
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compressed_cache.get_or_compress(body))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def send_static_file(filename):
+    """Serve a static file, preferring its precompressed .gz sibling when accepted."""
+    from flask import current_app
+
+    static_folder = current_app.static_folder
+
+    if accepts_gzip():
+        gz_path = os.path.join(static_folder, filename + '.gz')
+        if os.path.isfile(gz_path):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(static_folder, filename + '.gz', mimetype=mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+            return add_vary(response, 'Accept-Encoding')
+
+    response = send_from_directory(static_folder, filename)
+    if os.path.isfile(os.path.join(static_folder, filename + '.gz')):
+        add_vary(response, 'Accept-Encoding')
+    return response
+
+
+def init_compression(app):
+    """Install precompressed static serving and dynamic response compression."""
+    app.view_functions['static'] = send_static_file
+    app.after_request(compress_response)
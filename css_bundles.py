@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Per-page CSS bundles for the Taj website.
+
+Build step: scans every template in templates/ (plus the templates it
+extends/includes and the JS it loads) for the class and id names it can
+produce, then writes a pruned copy of static/css/style.css per page and an
+inlinable critical-CSS block, together with a byte-size report. The
+critical block only covers the page's first screen; the build fails if one
+exceeds CRITICAL_MAX_BYTES, and a block that is most of its bundle is not
+inlined at all.
+
+Runtime: init_css_bundles(app) makes `css_bundle_url` and `critical_css`
+available to every rendered template so base.html can link the matching
+bundle. Pages without a built bundle fall back to the full style.css.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+
+from flask import before_render_template, url_for
+
+from static_assets import asset_url
+
+TEMPLATES_DIR = "templates"
+STATIC_DIR = "static"
+# URL the app serves STATIC_DIR under
+STATIC_URL_PATH = "/static"
+SOURCE_CSS = "css/style.css"
+BUNDLE_DIR = "css/bundles"
+MANIFEST_FILE = "manifest.json"
+# "Above the fold" for critical CSS: the layout before the content and the
+# page's first <section>, at most this much markup
+CRITICAL_MARKUP_CHARS = 6000
+# The build fails when a page's critical CSS is larger than this
+CRITICAL_MAX_BYTES = 14 * 1024
+# Critical CSS over this share of its bundle is not inlined; the page links the bundle
+CRITICAL_INLINE_MAX_SHARE = 0.5
+
+TOKEN_RE = re.compile(r'[A-Za-z0-9_-]+')
+EXTENDS_RE = re.compile(r'{%-?\s*extends\s+[\'"]([^\'"]+)[\'"]')
+INCLUDE_RE = re.compile(r'{%-?\s*include\s+[\'"]([^\'"]+)[\'"]')
+SCRIPT_RE = re.compile(r'filename=[\'"](js/[^\'"]+\.js)[\'"]')
+CONTENT_BLOCK_RE = re.compile(r'{%-?\s*block\s+content\s*-?%}')
+PSEUDO_RE = re.compile(r'::?[A-Za-z-]+(\([^)]*\))?')
+ATTRIBUTE_RE = re.compile(r'\[[^\]]*\]')
+CLASS_OR_ID_RE = re.compile(r'[.#](-?[A-Za-z_][\w-]*)')
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+KEYFRAMES_NAME_RE = re.compile(r'@(?:-webkit-)?keyframes\s+([\w-]+)')
+HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+SECTION_RE = re.compile(r'<section\b')
+# States the first paint never shows
+INTERACTIVE_RE = re.compile(r':(hover|focus|focus-within|focus-visible|active|visited)\b|::selection')
+
+
+# ---------------------------------------------------------------------------
+# CSS parsing
+# ---------------------------------------------------------------------------
+
+class CSSRule:
+    """A parsed CSS rule: a style rule, an at-rule block, or a nested group."""
+
+    def __init__(self, prelude: str, body: str = None, children: list = None):
+        self.prelude = prelude
+        self.body = body
+        self.children = children
+
+    @property
+    def is_group(self):
+        return self.children is not None
+
+    def render(self) -> str:
+        if self.body is None and self.children is None:
+            return self.prelude + ';\n'
+        if self.is_group:
+            inner = ''.join(child.render() for child in self.children)
+            return f"{self.prelude} {{\n{inner}}}\n"
+        return f"{self.prelude} {{{self.body}}}\n"
+
+
+def absolute_urls(css: str, css_path: str) -> str:
+    """Rewrite relative url()s in the stylesheet at css_path (relative to the
+    static folder) to absolute /static/ paths.
+
+    Bundles live in another folder than style.css, and critical CSS is inlined
+    into pages, so a relative url() would resolve against the wrong base.
+    """
+    base = posixpath.dirname(css_path)
+
+    def rewrite(match):
+        quote, url = match.group(1), match.group(2).strip()
+        if url.startswith(('/', '#', 'data:', 'http:', 'https:')):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(base, url))
+        return f"url({quote}{STATIC_URL_PATH}/{path}{quote})"
+
+    return CSS_URL_RE.sub(rewrite, css)
+
+
+def strip_comments(css: str) -> str:
+    return re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+
+
+def find_block_end(css: str, start: int) -> int:
+    """Return the index of the '}' matching the '{' at css[start]."""
+    depth = 0
+    quote = None
+    i = start
+    while i < len(css):
+        ch = css[i]
+        if quote:
+            if ch == '\\':
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in ('"', "'"):
+            quote = ch
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError("Unbalanced braces in stylesheet")
+
+
+def parse_css(css: str) -> list:
+    """Parse a stylesheet into a list of CSSRule objects."""
+    rules = []
+    i = 0
+    while i < len(css):
+        brace = css.find('{', i)
+        semi = css.find(';', i)
+        if brace == -1:
+            break
+        # Statement at-rules such as @import / @charset
+        if semi != -1 and semi < brace and css[i:semi].strip().startswith('@'):
+            rules.append(CSSRule(css[i:semi].strip()))
+            i = semi + 1
+            continue
+
+        prelude = css[i:brace].strip()
+        end = find_block_end(css, brace)
+        body = css[brace + 1:end]
+        if prelude.startswith(('@media', '@supports')):
+            rules.append(CSSRule(prelude, children=parse_css(body)))
+        elif prelude:
+            rules.append(CSSRule(prelude, body=body))
+        i = end + 1
+    return rules
+
+
+def split_selectors(prelude: str) -> list:
+    """Split a selector list on top-level commas."""
+    parts = []
+    depth = 0
+    current = ''
+    for ch in prelude:
+        if ch in '([':
+            depth += 1
+        elif ch in ')]':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def selector_names(selector: str) -> list:
+    """Return the class and id names a selector requires to match."""
+    selector = ATTRIBUTE_RE.sub('', PSEUDO_RE.sub('', selector))
+    return CLASS_OR_ID_RE.findall(selector)
+
+
+# ---------------------------------------------------------------------------
+# Pruning
+# ---------------------------------------------------------------------------
+
+class TokenSet:
+    """Words a page can produce, plus dynamic prefixes such as `flash-`."""
+
+    def __init__(self, text: str):
+        tokens = set(TOKEN_RE.findall(text))
+        self.tokens = tokens
+        self.prefixes = tuple(t for t in tokens if len(t) > 2 and t[-1] in '-_')
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tokens or name.startswith(self.prefixes)
+
+
+def prune_rules(rules: list, tokens: TokenSet, first_paint: bool = False) -> list:
+    """Keep the rules whose selectors can match markup built from tokens.
+
+    With first_paint, selectors for interactive states (:hover, :focus...)
+    are dropped as well.
+    """
+    kept = []
+    for rule in rules:
+        if rule.is_group:
+            children = prune_rules(rule.children, tokens, first_paint)
+            if children:
+                kept.append(CSSRule(rule.prelude, children=children))
+        elif rule.body is None or rule.prelude.startswith('@'):
+            kept.append(rule)
+        else:
+            selectors = [s for s in split_selectors(rule.prelude)
+                         if all(name in tokens for name in selector_names(s))
+                         and not (first_paint and INTERACTIVE_RE.search(s))]
+            if selectors:
+                kept.append(CSSRule(',\n'.join(selectors), body=rule.body))
+    return kept
+
+
+def used_animation_names(rules: list) -> set:
+    names = set()
+    for rule in rules:
+        if rule.is_group:
+            names |= used_animation_names(rule.children)
+        elif rule.body and 'animation' in rule.body:
+            names |= set(TOKEN_RE.findall(rule.body))
+    return names
+
+
+def drop_unused_keyframes(rules: list, used: set) -> list:
+    kept = []
+    for rule in rules:
+        match = KEYFRAMES_NAME_RE.match(rule.prelude)
+        if match and match.group(1) not in used:
+            continue
+        if rule.is_group:
+            children = drop_unused_keyframes(rule.children, used)
+            if children:
+                kept.append(CSSRule(rule.prelude, children=children))
+            continue
+        kept.append(rule)
+    return kept
+
+
+def render_rules(rules: list) -> str:
+    return ''.join(rule.render() for rule in rules)
+
+
+def build_bundle(rules: list, tokens: TokenSet, above_fold_tokens: TokenSet):
+    """Return (bundle_css, critical_css) for one page."""
+    bundle = prune_rules(rules, tokens)
+    bundle = drop_unused_keyframes(bundle, used_animation_names(bundle))
+
+    # Fonts and animations can arrive with the full bundle
+    critical = drop_unused_keyframes(prune_rules(bundle, above_fold_tokens, first_paint=True), set())
+    critical = [rule for rule in critical if not rule.prelude.startswith('@font-face')]
+    return render_rules(bundle), render_rules(critical)
+
+
+# ---------------------------------------------------------------------------
+# Template scanning
+# ---------------------------------------------------------------------------
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def template_sources(name, templates_dir=TEMPLATES_DIR, seen=None):
+    """Return the text of a template and every template it extends or includes."""
+    seen = seen if seen is not None else set()
+    if name in seen:
+        return []
+    seen.add(name)
+    path = os.path.join(templates_dir, name)
+    if not os.path.exists(path):
+        return []
+    text = read_text(path)
+    sources = [text]
+    for parent in EXTENDS_RE.findall(text) + INCLUDE_RE.findall(text):
+        sources.extend(template_sources(parent, templates_dir, seen))
+    return sources
+
+
+def page_markup(name, templates_dir=TEMPLATES_DIR):
+    """Return the markup of a page, with a child's content block placed inside its layout."""
+    text = read_text(os.path.join(templates_dir, name))
+    parent = EXTENDS_RE.search(text)
+    if not parent:
+        return text
+    layout = read_text(os.path.join(templates_dir, parent.group(1)))
+    content = CONTENT_BLOCK_RE.split(text, maxsplit=1)
+    layout_parts = CONTENT_BLOCK_RE.split(layout, maxsplit=1)
+    if len(content) < 2 or len(layout_parts) < 2:
+        return layout + text
+    return layout_parts[0] + content[1] + layout_parts[1]
+
+
+def page_tokens(name, templates_dir=TEMPLATES_DIR, static_dir=STATIC_DIR) -> TokenSet:
+    """Collect every word the page, its layout, includes and scripts can emit."""
+    sources = template_sources(name, templates_dir)
+    scripts = set()
+    for text in sources:
+        scripts.update(SCRIPT_RE.findall(text))
+    for script in sorted(scripts):
+        script_path = os.path.join(static_dir, script)
+        if os.path.exists(script_path):
+            sources.append(read_text(script_path))
+    return TokenSet('\n'.join(sources))
+
+
+def critical_tokens(name, templates_dir=TEMPLATES_DIR) -> TokenSet:
+    """Words of the page's first screen: from <body> up to its second <section>."""
+    markup = HTML_COMMENT_RE.sub('', page_markup(name, templates_dir))
+    body_start = markup.find('<body')
+    start = body_start if body_start != -1 else 0
+    end = start + CRITICAL_MARKUP_CHARS
+    sections = [match.start() for match in SECTION_RE.finditer(markup, start, end)]
+    if len(sections) > 1:
+        end = sections[1]
+    return TokenSet(markup[start:end])
+
+
+def pages_using_stylesheet(templates_dir=TEMPLATES_DIR):
+    """Templates that load style.css directly or through the layout they extend."""
+    pages = []
+    for filename in sorted(os.listdir(templates_dir)):
+        if not filename.endswith('.html') or filename == 'base.html':
+            continue
+        text = read_text(os.path.join(templates_dir, filename))
+        if EXTENDS_RE.search(text) or SOURCE_CSS in text or 'css_bundle_url' in text:
+            pages.append(filename)
+    return pages
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+def write_file(path, data: str):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def gzip_size(data: str) -> int:
+    return len(gzip.compress(data.encode('utf-8'), compresslevel=9, mtime=0))
+
+
+def build_css_bundles(templates_dir=TEMPLATES_DIR, static_dir=STATIC_DIR):
+    """Write one pruned bundle + critical block per page and a manifest with sizes."""
+    source = read_text(os.path.join(static_dir, SOURCE_CSS))
+    rules = parse_css(absolute_urls(strip_comments(source), SOURCE_CSS))
+    bundle_dir = os.path.join(static_dir, BUNDLE_DIR)
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    manifest = {
+        'source': {'path': SOURCE_CSS, 'bytes': len(source.encode('utf-8')), 'gzip_bytes': gzip_size(source)},
+        'pages': {},
+    }
+
+    # Everything is built and checked before anything is written, so a failed
+    # build leaves the previous bundles in place
+    built = []
+    for page in pages_using_stylesheet(templates_dir):
+        bundle_css, critical_css = build_bundle(rules, page_tokens(page, templates_dir, static_dir),
+                                                critical_tokens(page, templates_dir))
+        built.append((page, bundle_css, critical_css))
+    over_budget = [f"{page} ({len(critical_css.encode('utf-8')):,} bytes)"
+                   for page, _bundle_css, critical_css in built
+                   if len(critical_css.encode('utf-8')) > CRITICAL_MAX_BYTES]
+    if over_budget:
+        raise ValueError(f"Critical CSS over the {CRITICAL_MAX_BYTES:,} byte budget: {', '.join(over_budget)}")
+
+    for page, bundle_css, critical_css in built:
+        stem = os.path.splitext(page)[0]
+        bundle_bytes = len(bundle_css.encode('utf-8'))
+        critical_bytes = len(critical_css.encode('utf-8'))
+        # Inlining most of the bundle and then loading all of it again saves nothing
+        inline = critical_bytes <= bundle_bytes * CRITICAL_INLINE_MAX_SHARE
+        write_file(os.path.join(bundle_dir, f"{stem}.css"), bundle_css)
+        critical_path = os.path.join(bundle_dir, f"{stem}.critical.css")
+        if inline:
+            write_file(critical_path, critical_css)
+        elif os.path.exists(critical_path):
+            os.remove(critical_path)
+        manifest['pages'][page] = {
+            'css': f"{BUNDLE_DIR}/{stem}.css",
+            'critical': f"{BUNDLE_DIR}/{stem}.critical.css" if inline else None,
+            'hash': hashlib.sha1(bundle_css.encode('utf-8')).hexdigest()[:12],
+            'bytes': bundle_bytes,
+            'gzip_bytes': gzip_size(bundle_css),
+            'critical_bytes': critical_bytes,
+        }
+
+    write_file(os.path.join(bundle_dir, MANIFEST_FILE), json.dumps(manifest, indent=2))
+    return manifest
+
+
+def print_report(manifest):
+    source = manifest['source']
+    print(f"Source {source['path']}: {source['bytes']:,} bytes ({source['gzip_bytes']:,} gzip)")
+    print(f"{'page':32} {'bundle':>10} {'gzip':>9} {'critical':>10} {'saved':>7}")
+    for page, info in manifest['pages'].items():
+        saved = 100 - (info['bytes'] * 100 // source['bytes']) if source['bytes'] else 0
+        inlined = '' if info['critical'] else '  (linked, not inlined)'
+        print(f"{page:32} {info['bytes']:>10,} {info['gzip_bytes']:>9,} {info['critical_bytes']:>10,} {saved:>6}%{inlined}")
+
+
+# ---------------------------------------------------------------------------
+# Runtime
+# ---------------------------------------------------------------------------
+
+_manifest = None
+_critical_cache = {}
+
+
+def load_manifest(static_folder):
+    """Load the bundle manifest once per process; an empty one if not built."""
+    global _manifest
+    if _manifest is None:
+        path = os.path.join(static_folder, BUNDLE_DIR, MANIFEST_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {'pages': {}}
+    return _manifest
+
+
+def get_critical_css(static_folder, info):
+    path = info.get('critical')
+    if not path:
+        return ''
+    if path not in _critical_cache:
+        try:
+            _critical_cache[path] = read_text(os.path.join(static_folder, path))
+        except OSError:
+            _critical_cache[path] = ''
+    return _critical_cache[path]
+
+
+def init_css_bundles(app):
+    """Expose the matching CSS bundle to every template rendered by the app."""
+
+    def inject_bundle(sender, template, context, **extra):
+        info = load_manifest(sender.static_folder)['pages'].get(template.name)
+        if info:
+            context['css_bundle_url'] = url_for('static', filename=info['css'], v=info['hash'])
+            context['critical_css'] = get_critical_css(sender.static_folder, info)
+        else:
+            context['css_bundle_url'] = asset_url(SOURCE_CSS)
+            context['critical_css'] = ''
+
+    before_render_template.connect(inject_bundle, app, weak=False)
+
+
+def main():
+    """Main function"""
+    try:
+        manifest = build_css_bundles()
+    except ValueError as e:
+        print(f"CSS bundle build failed: {e}")
+        return 1
+    print_report(manifest)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,17 +5,188 @@ Database setup and management for Taj Restaurant Menu System
 
 import sqlite3
 import os
+import threading
+import time
+import unicodedata
 from typing import List, Dict, Optional, Tuple
 
+from group_commit import GroupCommitWriter, run_write
+from order_board import OrderBoard
+from pricing import PriceIndex
+from reservations import DATE_FORMAT, RESERVATION_SLOT_CAPACITY, RESERVATION_SLOTS, SlotFull
+from sales import order_item_rows, sales_bucket
+from shared_cache import SharedCache
+
+# Seconds a cached menu read stays valid; menu writes in this process
+# invalidate immediately, the TTL bounds staleness across processes
+MENU_CACHE_TTL = 60
+# Menu reads (and app.py's gzipped pages) are shared by the worker processes
+# of a host through one cache file; SHARED_CACHE=0 keeps them per process
+SHARED_CACHE = os.environ.get('SHARED_CACHE', '1') != '0'
+# Seconds a worker trusts its copy of the shared menu version before re-reading it
+MENU_VERSION_CHECK_INTERVAL = 1.0
+# Bump whenever init_database changes; databases already at this version
+# skip the DDL on startup
+SCHEMA_VERSION = 8
+# Order columns copied into the archive database
+ORDER_COLUMNS = ('id', 'order_number', 'customer_info', 'items', 'total_amount', 'status',
+                 'restaurant_location', 'created_at', 'completed_at', 'qr_code_path',
+                 'client_total', 'price_mismatch')
+# Only finished orders are ever archived
+ARCHIVABLE_STATUSES = ('completed', 'rejected')
+# menu_search kinds; a menu item n has rowid 2n, a set menu 2n + 1
+SEARCH_KIND_ITEM = 'menu_item'
+SEARCH_KIND_SET = 'set_menu'
+# bm25 column weights: kind, ref_id, name_en, name_jp, description_en, description_jp
+SEARCH_WEIGHTS = (0.0, 0.0, 10.0, 10.0, 1.0, 1.0)
+# The trigram tokenizer only indexes terms of three or more characters
+SEARCH_MIN_TERM = 3
+# How long a create-order Idempotency-Key is remembered
+IDEMPOTENCY_TTL = 24 * 3600
+# Order writes go through one group-commit writer thread per process;
+# GROUP_COMMIT=0 gives every write its own transaction instead
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '1') != '0'
+# Each branch's orders live in their own SQLite file so a rush at one branch
+# does not hold the write lock for the others; ORDER_SHARDING=0 keeps every
+# order in the menu database
+ORDER_SHARDING = os.environ.get('ORDER_SHARDING', '1') != '0'
+ORDER_SHARD_LOCATIONS = ('okinawa', 'nikko', 'fuji')
+# Set menus whose curries the customer picks, and how many; cart.js used to
+# hard-code these, and they are seeded into set_items once the sets exist
+LEGACY_SET_CURRY_PICKS = {1: 2, 3: 1, 10: 1, 11: 1, 12: 1, 13: 1, 14: 1, 15: 1, 16: 1, 21: 2, 23: 1}
+# Curry (nikko, fuji) and Indian Curries (okinawa); Pulao is rice, not a curry
+CURRY_CATEGORY_IDS = (11, 17)
+PULAO_ITEM_ID = 43
+
+
+class IdempotencyKeyReused(ValueError):
+    """An Idempotency-Key was sent again with a different order."""
+
 class MenuDatabase:
-    def __init__(self, db_path: str = "taj_menu.db"):
+    def __init__(self, db_path: str = "taj_menu.db", archive_path: str = None):
         """Initialize database connection and create tables if they don't exist."""
         self.db_path = db_path
+        # Old finished orders are moved here by archive_orders()
+        self.archive_path = archive_path or f"{os.path.splitext(db_path)[0]}_archive.db"
+        self._menu_cache = {}
+        self._menu_cache_lock = threading.Lock()
+        # Bumped by invalidate_menu_cache(); a read that spans a bump is not cached
+        self._menu_generation = 0
+        # location -> orders file; orders from other locations (and from before
+        # sharding, until split_orders() moves them) stay in db_path
+        base_path = os.path.splitext(db_path)[0]
+        # Second level behind _menu_cache, read by every worker on the host;
+        # SHARED_CACHE_PATH can point it at tmpfs
+        self.shared_cache = SharedCache(
+            os.environ.get('SHARED_CACHE_PATH') or f"{base_path}_cache.db") if SHARED_CACHE else None
+        # (menu version, when it was read); entries of older versions are stale
+        self._menu_version = (0, None)
+        self.order_shards = {location: f"{base_path}_orders_{location}.db"
+                             for location in ORDER_SHARD_LOCATIONS} if ORDER_SHARDING else {}
+        self.group_commit = GROUP_COMMIT
+        # One writer per database file, started on first use; a process
+        # forked after that starts its own (threads do not survive a fork)
+        self._writers = {}
+        self._writers_pid = os.getpid()
+        self._writer_lock = threading.Lock()
+        # 'new' and 'pending' orders for the order screens, loaded on first use
+        self.order_board = OrderBoard()
+        # Connections kept open only to read PRAGMA data_version for the board
+        self._version_conns = {}
+        for shard_path in self.order_shards.values():
+            self._init_order_store(shard_path)
         self.init_database()
 
+    def _cached_menu_read(self, key: Tuple, loader):
+        """Return a cached menu read: from this process, else from the shared
+        cache, else by calling loader() and sharing the result."""
+        now = time.time()
+        version = self._current_menu_version()
+        with self._menu_cache_lock:
+            entry = self._menu_cache.get(key)
+            if entry and entry[1] == version and now - entry[0] < MENU_CACHE_TTL:
+                return entry[2]
+            generation = self._menu_generation
+
+        value = None
+        if self.shared_cache:
+            value = self.shared_cache.get('menu', repr(key), version)
+        if value is None:
+            value = loader()
+            # The menu changed while loader() ran; its result may predate the change
+            if self._menu_generation != generation:
+                return value
+            if self.shared_cache:
+                self.shared_cache.put('menu', repr(key), value, version, MENU_CACHE_TTL)
+        with self._menu_cache_lock:
+            if self._menu_generation == generation:
+                self._menu_cache[key] = (now, version, value)
+        return value
+
+    def _current_menu_version(self) -> int:
+        """The shared menu version, re-read at most every MENU_VERSION_CHECK_INTERVAL."""
+        if not self.shared_cache:
+            return 0
+        version, checked_at = self._menu_version
+        now = time.monotonic()
+        if checked_at is None or now - checked_at >= MENU_VERSION_CHECK_INTERVAL:
+            version = self.shared_cache.version('menu')
+            self._menu_version = (version, now)
+        return version
+
+    def invalidate_menu_cache(self):
+        """Drop all cached menu reads, in every worker; call after any menu write."""
+        with self._menu_cache_lock:
+            self._menu_cache.clear()
+            self._menu_generation += 1
+        if self.shared_cache:
+            self.shared_cache.bump('menu')
+            # Re-read the version on the next read, in case the bump failed
+            self._menu_version = (0, None)
+
+    def _write(self, write, db_path: str = None):
+        """Run write(conn) in a write transaction on db_path (the menu database
+        by default) and return its result once committed."""
+        db_path = db_path or self.db_path
+        if not self.group_commit:
+            return run_write(db_path, write)
+        return self._writer(db_path).run(write)
+
+    def _writer(self, db_path: str) -> GroupCommitWriter:
+        """The group-commit writer of db_path, started on first use."""
+        if self._writers_pid != os.getpid():
+            with self._writer_lock:
+                if self._writers_pid != os.getpid():
+                    self._writers = {}
+                    self._writers_pid = os.getpid()
+        writer = self._writers.get(db_path)
+        if writer is None:
+            with self._writer_lock:
+                writer = self._writers.get(db_path)
+                if writer is None:
+                    writer = self._writers[db_path] = GroupCommitWriter(db_path)
+        return writer
+
+    def writer_stats(self) -> Dict:
+        """Return group-commit writer counters, in total and per database file."""
+        stores = {os.path.basename(path): writer.stats() for path, writer in list(self._writers.items())}
+        batches = sum(stats['batches'] for stats in stores.values())
+        writes = sum(stats['writes'] for stats in stores.values())
+        return {
+            'enabled': self.group_commit,
+            'batches': batches,
+            'writes': writes,
+            'queued': sum(stats['queued'] for stats in stores.values()),
+            'average_batch': round(writes / batches, 2) if batches else 0,
+            'stores': stores,
+        }
+
     def init_database(self):
         """Create database tables if they don't exist."""
         with sqlite3.connect(self.db_path) as conn:
+            schema_version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if schema_version >= SCHEMA_VERSION:
+                return
             cursor = conn.cursor()
             
             # Create categories table
@@ -103,23 +274,202 @@ class MenuDatabase:
                 )
             ''')
             
-            # Create orders table
+            self._create_order_tables(cursor)
+            
+            self._create_menu_search(cursor)
+            
+            self._create_reservation_tables(cursor)
+            
+            # Columns added after the first release
+            self._add_missing_columns(cursor, 'set_items', {
+                'choice_group': 'TEXT',  # options the customer picks from, e.g. 'curry'
+            })
+            # A fresh database has no sets yet; menu_io seeds it with
+            # seed_set_choices() once its menu is imported
+            if schema_version < 6:
+                self._seed_set_choices(cursor)
+            
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.commit()
+        
+        # Version 3 added the sales rollups; fill them from existing orders once
+        if schema_version < 3:
+            self.rebuild_sales_rollups()
+
+    def _create_order_tables(self, cursor):
+        """Create the orders table and the tables written alongside it."""
+        # Create orders table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_number TEXT UNIQUE NOT NULL,
+                customer_info TEXT,
+                items TEXT NOT NULL,
+                total_amount INTEGER NOT NULL,
+                status TEXT DEFAULT 'pending',
+                restaurant_location TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP,
+                qr_code_path TEXT
+            )
+        ''')
+        
+        # Sales rollups, maintained as orders complete (see sales.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_daily_items (
+                day TEXT NOT NULL,
+                restaurant_location TEXT NOT NULL,
+                item_type TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                item_name TEXT,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, restaurant_location, item_type, item_id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_hourly (
+                day TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                restaurant_location TEXT NOT NULL,
+                orders INTEGER NOT NULL DEFAULT 0,
+                revenue INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, hour, restaurant_location)
+            )
+        ''')
+        
+        # Idempotency-Key -> order, so client retries do not create duplicates
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idempotency_key TEXT PRIMARY KEY,
+                request_hash TEXT NOT NULL,
+                order_number TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at)')
+        
+        # The order board loads every 'new' and 'pending' order
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)')
+        
+        # Columns added after the first release
+        self._add_missing_columns(cursor, 'orders', {
+            'client_total': 'INTEGER',  # total the client submitted
+            'price_mismatch': 'BOOLEAN DEFAULT 0',  # server re-pricing disagreed
+        })
+
+    def _create_reservation_tables(self, cursor):
+        """Create the reservations table and its per-slot seat counters (see reservations.py)."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reservations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                reservation_type TEXT NOT NULL,
+                restaurant_location TEXT NOT NULL,
+                day TEXT NOT NULL,
+                slot TEXT NOT NULL,
+                seats INTEGER NOT NULL,
+                representative_name TEXT,
+                email TEXT NOT NULL,
+                phone TEXT,
+                details TEXT, -- JSON of the remaining form fields
+                status TEXT NOT NULL DEFAULT 'booked',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reservations_slot
+            ON reservations(restaurant_location, day, slot)
+        ''')
+        
+        # One row per slot that has been booked or given its own capacity;
+        # slots without a row have RESERVATION_SLOT_CAPACITY seats free
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reservation_slots (
+                restaurant_location TEXT NOT NULL,
+                day TEXT NOT NULL,
+                slot TEXT NOT NULL,
+                capacity INTEGER NOT NULL,
+                booked INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (restaurant_location, day, slot)
+            ) WITHOUT ROWID
+        ''')
+
+    def seed_set_choices(self):
+        """Seed the legacy set-menu curry choices, unless some set already has choice rows."""
+        return self._write(lambda conn: self._seed_set_choices(conn.cursor()))
+
+    def _seed_set_choices(self, cursor):
+        """Store the set-menu curry choices cart.js used to hard-code as set_items rows."""
+        if cursor.execute("SELECT 1 FROM set_items WHERE is_choice = 1 LIMIT 1").fetchone():
+            return
+        categories = ', '.join('?' * len(CURRY_CATEGORY_IDS))
+        for set_id, picks in LEGACY_SET_CURRY_PICKS.items():
+            # One row per option; quantity is how many the customer picks.
+            # Options not served at a location are filtered out when the menu loads.
+            cursor.execute(f'''
+                INSERT INTO set_items (set_id, menu_item_id, quantity, is_choice, choice_group)
+                SELECT ms.id, mi.id, ?, 1, 'curry'
+                FROM menu_sets ms, menu_items mi
+                WHERE ms.id = ? AND mi.category_id IN ({categories}) AND mi.id != ?
+                ORDER BY mi.sort_order, mi.id
+            ''', (picks, set_id, *CURRY_CATEGORY_IDS, PULAO_ITEM_ID))
+
+    def _init_order_store(self, db_path: str):
+        """Create the order tables in an order shard."""
+        with sqlite3.connect(db_path) as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                return
+            self._create_order_tables(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.commit()
+
+    def _create_menu_search(self, cursor):
+        """Create the menu_search FTS5 index and the triggers that keep it in sync."""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'menu_search'").fetchone()
+        try:
+            # trigram tokenizes by character, so Japanese substrings match
+            # without a word segmenter
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    order_number TEXT UNIQUE NOT NULL,
-                    customer_info TEXT,
-                    items TEXT NOT NULL,
-                    total_amount INTEGER NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    restaurant_location TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP,
-                    qr_code_path TEXT
+                CREATE VIRTUAL TABLE IF NOT EXISTS menu_search USING fts5(
+                    kind UNINDEXED, ref_id UNINDEXED,
+                    name_en, name_jp, description_en, description_jp,
+                    tokenize = 'trigram'
                 )
             ''')
-            
-            conn.commit()
+        except sqlite3.OperationalError as e:
+            print(f"Menu search disabled, SQLite lacks FTS5 trigram support: {e}")
+            return
+        
+        for table, kind, rowid in (('menu_items', SEARCH_KIND_ITEM, '2 * {row}.id'),
+                                   ('menu_sets', SEARCH_KIND_SET, '2 * {row}.id + 1')):
+            insert = f'''
+                INSERT INTO menu_search (rowid, kind, ref_id, name_en, name_jp, description_en, description_jp)
+                VALUES ({rowid.format(row='new')}, '{kind}', new.id,
+                        new.name_en, new.name_jp, new.description_en, new.description_jp);
+            '''
+            delete = f"DELETE FROM menu_search WHERE rowid = {rowid.format(row='old')};"
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END')
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_search_update
+                AFTER UPDATE OF id, name_en, name_jp, description_en, description_jp ON {table}
+                BEGIN {delete} {insert} END
+            ''')
+            if not exists:
+                cursor.execute(f'''
+                    INSERT INTO menu_search (rowid, kind, ref_id, name_en, name_jp, description_en, description_jp)
+                    SELECT {rowid.format(row=table)}, '{kind}', id, name_en, name_jp, description_en, description_jp
+                    FROM {table}
+                ''')
+    
+    def _add_missing_columns(self, cursor, table: str, columns: Dict[str, str]):
+        """ALTER TABLE ADD COLUMN for each column the table does not have yet."""
+        existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
 
     def insert_sample_data(self):
         """Insert sample data from the menu images."""
@@ -387,36 +737,53 @@ class MenuDatabase:
             ''', set_menus)
             
             conn.commit()
+            self.invalidate_menu_cache()
 
     def get_menu_by_location(self, location: str) -> Dict:
         """Get complete menu for a specific restaurant location."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Get categories with items
-            cursor.execute('''
-                SELECT DISTINCT c.id, c.name_en, c.name_jp, c.icon, c.sort_order
-                FROM categories c
-                JOIN menu_items mi ON c.id = mi.category_id
-                JOIN restaurant_menus rm ON mi.id = rm.menu_item_id
-                WHERE rm.restaurant_location = ? AND rm.location_availability = 1
-                ORDER BY c.sort_order
-            ''', (location,))
-            
-            categories = []
-            for cat_row in cursor.fetchall():
-                category = dict(cat_row)
-                
-                # Get items for this category
+        categories = []
+        for category in self.get_menu_categories(location):
+            category = dict(category)
+            category['items'] = self.get_category_items(location, category['id'])
+            categories.append(category)
+
+        return {
+            'categories': categories,
+            'sets': self.get_set_menus_by_location(location)
+        }
+
+    def get_menu_categories(self, location: str) -> List[Dict]:
+        """Get the categories that have available items at a location (cached)."""
+        def load():
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT DISTINCT c.id, c.name_en, c.name_jp, c.icon, c.sort_order
+                    FROM categories c
+                    JOIN menu_items mi ON c.id = mi.category_id
+                    JOIN restaurant_menus rm ON mi.id = rm.menu_item_id
+                    WHERE rm.restaurant_location = ? AND rm.location_availability = 1
+                    ORDER BY c.sort_order
+                ''', (location,))
+                return [dict(row) for row in cursor.fetchall()]
+
+        return self._cached_menu_read(('categories', location), load)
+
+    def get_category_items(self, location: str, category_id: int) -> List[Dict]:
+        """Get the available items of one category at a location (cached)."""
+        def load():
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
                 cursor.execute('''
                     SELECT mi.*, rm.location_price, rm.is_featured
                     FROM menu_items mi
                     JOIN restaurant_menus rm ON mi.id = rm.menu_item_id
                     WHERE mi.category_id = ? AND rm.restaurant_location = ? AND rm.location_availability = 1
                     ORDER BY mi.sort_order, mi.name_en
-                ''', (category['id'], location))
-                
+                ''', (category_id, location))
+
                 items = []
                 for item_row in cursor.fetchall():
                     item = dict(item_row)
@@ -426,36 +793,169 @@ class MenuDatabase:
                     else:
                         item['display_price'] = item['price']
                     items.append(item)
-                
-                category['items'] = items
-                categories.append(category)
-            
-            # Get set menus for this location
-            # Logic: 
-            # - 'all' sets show everywhere
-            # - 'nikko' and 'fuji' sets show in both nikko and fuji (but not okinawa)
-            # - 'okinawa' sets show only in okinawa
-            if location == 'okinawa':
-                cursor.execute('''
-                    SELECT * FROM menu_sets 
-                    WHERE is_available = 1 
-                    AND (restaurant_location = 'all' OR restaurant_location = 'okinawa')
-                    ORDER BY sort_order
-                ''')
-            else:  # nikko or fuji
-                cursor.execute('''
+                return items
+
+        return self._cached_menu_read(('items', location, category_id), load)
+
+    def get_set_menus_by_location(self, location: str) -> List[Dict]:
+        """Get the available set menus for a location, with their contents and choices (cached)."""
+        # Logic: 
+        # - 'all' sets show everywhere
+        # - 'nikko' and 'fuji' sets show in both nikko and fuji (but not okinawa)
+        # - 'okinawa' sets show only in okinawa
+        if location == 'okinawa':
+            set_locations = ('all', 'okinawa')
+        else:  # nikko or fuji
+            set_locations = ('all', 'nikko', 'fuji')
+        placeholders = ', '.join('?' * len(set_locations))
+        
+        def load():
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute(f'''
                     SELECT * FROM menu_sets 
-                    WHERE is_available = 1 
-                    AND (restaurant_location = 'all' OR restaurant_location = 'nikko' OR restaurant_location = 'fuji')
+                    WHERE is_available = 1 AND restaurant_location IN ({placeholders})
                     ORDER BY sort_order
-                ''')
-            
-            sets = [dict(row) for row in cursor.fetchall()]
-            
-            return {
-                'categories': categories,
-                'sets': sets
-            }
+                ''', set_locations)
+                sets = [dict(row) for row in cursor.fetchall()]
+                by_id = {}
+                for set_menu in sets:
+                    set_menu['contents'] = []
+                    set_menu['choices'] = []
+                    by_id[set_menu['id']] = set_menu
+                
+                # Contents of every set at once; choice options only where the
+                # location serves them
+                cursor.execute(f'''
+                    SELECT si.set_id, si.menu_item_id, si.quantity, si.is_choice, si.choice_group,
+                           COALESCE(mi.name_en, si.item_description_en) AS name_en,
+                           COALESCE(mi.name_jp, si.item_description_jp) AS name_jp
+                    FROM set_items si
+                    JOIN menu_sets ms ON ms.id = si.set_id
+                    LEFT JOIN menu_items mi ON mi.id = si.menu_item_id
+                    LEFT JOIN restaurant_menus rm
+                        ON rm.menu_item_id = si.menu_item_id AND rm.restaurant_location = ?
+                    WHERE ms.is_available = 1 AND ms.restaurant_location IN ({placeholders})
+                      AND (si.is_choice = 0 OR (mi.is_available = 1 AND rm.location_availability = 1))
+                    ORDER BY si.set_id, mi.sort_order, si.id
+                ''', (location, *set_locations))
+                for row in cursor.fetchall():
+                    set_menu = by_id[row['set_id']]
+                    if not row['is_choice']:
+                        set_menu['contents'].append({'menu_item_id': row['menu_item_id'], 'name_en': row['name_en'],
+                                                     'name_jp': row['name_jp'], 'quantity': row['quantity']})
+                        continue
+                    group = row['choice_group'] or 'choice'
+                    choice = next((c for c in set_menu['choices'] if c['group'] == group), None)
+                    if choice is None:
+                        choice = {'group': group, 'picks': 0, 'options': []}
+                        set_menu['choices'].append(choice)
+                    choice['picks'] = max(choice['picks'], row['quantity'] or 1)
+                    choice['options'].append({'id': row['menu_item_id'], 'name_en': row['name_en'],
+                                              'name_jp': row['name_jp']})
+                return sets
+
+        return self._cached_menu_read(('sets', location), load)
+
+    def _search_matches(self, terms: List[str]) -> List[Tuple[str, int]]:
+        """Return (kind, ref_id) of every menu_search row matching all terms, best first."""
+        with sqlite3.connect(self.db_path) as conn:
+            if all(len(term) >= SEARCH_MIN_TERM for term in terms):
+                # Each term is quoted so FTS5 syntax in user input is taken literally
+                match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+                weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+                return conn.execute(f'''
+                    SELECT kind, ref_id FROM menu_search
+                    WHERE menu_search MATCH ?
+                    ORDER BY bm25(menu_search, {weights})
+                ''', (match,)).fetchall()
+
+            # Short terms (two-character Japanese words are common) cannot use
+            # the trigram index; the menu is small enough to scan
+            like = "(name_en LIKE ? ESCAPE '!' OR name_jp LIKE ? ESCAPE '!' " \
+                   "OR description_en LIKE ? ESCAPE '!' OR description_jp LIKE ? ESCAPE '!')"
+            patterns = ['%' + term.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+                        for term in terms]
+            rows = conn.execute(
+                f"SELECT kind, ref_id, name_en, name_jp FROM menu_search WHERE {' AND '.join([like] * len(terms))}",
+                [pattern for pattern in patterns for _ in range(4)]).fetchall()
+
+        # Name matches before description-only matches
+        def in_name(row):
+            names = f"{row[2]} {row[3]}".lower()
+            return all(term.lower() in names for term in terms)
+        rows.sort(key=lambda row: not in_name(row))
+        return [(kind, ref_id) for kind, ref_id, _name_en, _name_jp in rows]
+
+    def search_menu(self, query: str, location: str = None, limit: int = 20) -> List[Dict]:
+        """Search menu item and set names and descriptions, EN or JP, best first.
+
+        With a location, only what that restaurant currently serves is returned.
+        """
+        # NFKC folds half-width katakana and full-width latin to the forms the menu uses
+        terms = unicodedata.normalize('NFKC', query).split()
+        if not terms:
+            return []
+        matches = self._search_matches(terms)
+        if not matches:
+            return []
+
+        item_ids = [ref_id for kind, ref_id in matches if kind == SEARCH_KIND_ITEM]
+        set_ids = [ref_id for kind, ref_id in matches if kind == SEARCH_KIND_SET]
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT mi.*, rm.location_price
+                FROM menu_items mi
+                LEFT JOIN restaurant_menus rm ON mi.id = rm.menu_item_id AND rm.restaurant_location = ?
+                WHERE mi.id IN ({', '.join('?' * len(item_ids))})
+                {'AND rm.location_availability = 1' if location else ''}
+            ''', (location, *item_ids))
+            items = {row['id']: dict(row) for row in cursor.fetchall()}
+
+            if location:
+                sets = {set_menu['id']: set_menu for set_menu in self.get_set_menus_by_location(location)}
+            else:
+                cursor.execute(f'''
+                    SELECT * FROM menu_sets WHERE is_available = 1 AND id IN ({', '.join('?' * len(set_ids))})
+                ''', set_ids)
+                sets = {row['id']: dict(row) for row in cursor.fetchall()}
+
+        results = []
+        for kind, ref_id in matches:
+            if kind == SEARCH_KIND_ITEM and ref_id in items:
+                result = dict(items[ref_id])
+                result['display_price'] = result['location_price'] or result['price']
+            elif kind == SEARCH_KIND_SET and ref_id in sets:
+                result = dict(sets[ref_id])
+                result['display_price'] = result['price']
+            else:
+                continue
+            result['kind'] = kind
+            results.append(result)
+            if len(results) >= limit:
+                break
+        return results
+
+    def get_price_index(self) -> PriceIndex:
+        """Get every item, location and set price in one index (cached)."""
+        def load():
+            index = PriceIndex()
+            with sqlite3.connect(self.db_path) as conn:
+                for item_id, price, price_2p, price_4p in conn.execute(
+                        'SELECT id, price, price_2p, price_4p FROM menu_items'):
+                    index.items[item_id] = {'price': price, 'price_2p': price_2p, 'price_4p': price_4p}
+                for location, item_id, location_price in conn.execute(
+                        'SELECT restaurant_location, menu_item_id, location_price FROM restaurant_menus '
+                        'WHERE location_price IS NOT NULL'):
+                    index.location_prices[(location, item_id)] = location_price
+                for set_id, price in conn.execute('SELECT id, price FROM menu_sets'):
+                    index.sets[set_id] = price
+            return index
+
+        return self._cached_menu_read(('prices',), load)
 
     def add_menu_item(self, category_id: int, name_en: str, name_jp: str, 
                       price: int, description_en: str = None, description_jp: str = None,
@@ -475,6 +975,7 @@ class MenuDatabase:
             
             item_id = cursor.lastrowid
             conn.commit()
+            self.invalidate_menu_cache()
             return item_id
 
     def update_menu_item_image(self, item_id: int, image_url: str, image_alt: str = None):
@@ -489,51 +990,296 @@ class MenuDatabase:
             ''', (image_url, image_alt, item_id))
             
             conn.commit()
+            self.invalidate_menu_cache()
+    
+    def _order_store(self, restaurant_location: str) -> str:
+        """The database file new orders for a location are written to."""
+        return self.order_shards.get(restaurant_location, self.db_path)
     
-    def create_order(self, order_data: Dict) -> str:
-        """Create a new order and return the order number."""
+    def _order_stores(self) -> List[str]:
+        """Every database file that can hold orders, shards first."""
+        return [*self.order_shards.values(), self.db_path]
+    
+    def _find_order_store(self, order_number: str) -> Optional[str]:
+        """The database file holding an order, or None."""
+        for db_path in self._order_stores():
+            with sqlite3.connect(db_path) as conn:
+                if conn.execute('SELECT 1 FROM orders WHERE order_number = ?', (order_number,)).fetchone():
+                    return db_path
+        return None
+    
+    def _attach_order_shards(self, conn, restaurant_location: str = None) -> List[str]:
+        """Attach the shards a cross-shard read needs to a connection on db_path.
+        
+        Returns the schema names to union over; 'main' is always included
+        since it holds orders from unknown locations and from before sharding.
+        """
+        schemas = ['main']
+        for location, shard_path in self.order_shards.items():
+            if restaurant_location in (None, location):
+                conn.execute(f'ATTACH DATABASE ? AS shard_{location}', (shard_path,))
+                schemas.append(f'shard_{location}')
+        return schemas
+    
+    def create_order(self, order_data: Dict, idempotency_key: str = None) -> str:
+        """Create a new order and return the order number.
+        
+        With an idempotency_key, a repeat of the same order within
+        IDEMPOTENCY_TTL returns the original order number instead of inserting
+        again; reusing the key for a different order raises IdempotencyKeyReused.
+        """
+        import hashlib
         import json
         import uuid
-        from datetime import datetime
+        from datetime import datetime, timezone
         
         # Generate unique order number
         order_number = f"TAJ-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+        request_hash = None
+        if idempotency_key:
+            # Hash what the client sent: a retry after a menu price change is still a replay
+            client_items = [{key: value for key, value in line.items() if key != 'charged_price'}
+                            if isinstance(line, dict) else line for line in order_data['items']]
+            request_hash = hashlib.sha256(json.dumps(
+                [client_items, order_data.get('restaurant_location', '')],
+                sort_keys=True).encode('utf-8')).hexdigest()
+        # Same format as CURRENT_TIMESTAMP, so board and database agree on ordering
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        order = {
+            'id': None,
+            'order_number': order_number,
+            'customer_info': order_data.get('customer_info', {}),
+            'items': order_data['items'],
+            'total_amount': order_data['total_amount'],
+            'status': 'new',
+            'restaurant_location': order_data.get('restaurant_location', ''),
+            'created_at': created_at,
+            'completed_at': None,
+            'qr_code_path': None,
+            'client_total': order_data.get('client_total'),
+            'price_mismatch': 1 if order_data.get('price_mismatch') else 0,
+        }
         
-        with sqlite3.connect(self.db_path) as conn:
+        def write(conn):
+            # Runs inside the write transaction, so two concurrent retries
+            # cannot both miss the key
             cursor = conn.cursor()
+            if idempotency_key:
+                now = time.time()
+                cursor.execute('''
+                    SELECT request_hash, order_number FROM idempotency_keys
+                    WHERE idempotency_key = ? AND expires_at > ?
+                ''', (idempotency_key, now))
+                row = cursor.fetchone()
+                if row:
+                    if row[0] != request_hash:
+                        raise IdempotencyKeyReused(idempotency_key)
+                    return row[1]
+                cursor.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (now,))
+                cursor.execute('''
+                    INSERT INTO idempotency_keys (idempotency_key, request_hash, order_number, expires_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (idempotency_key, request_hash, order_number, now + IDEMPOTENCY_TTL))
+            
             cursor.execute('''
                 INSERT INTO orders (
                     order_number, customer_info, items, total_amount, 
-                    restaurant_location, status
-                ) VALUES (?, ?, ?, ?, ?, ?)
+                    restaurant_location, status, client_total, price_mismatch, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 order_number,
-                json.dumps(order_data.get('customer_info', {})),
-                json.dumps(order_data['items']),
-                order_data['total_amount'],
-                order_data.get('restaurant_location', ''),
-                'new'
+                json.dumps(order['customer_info']),
+                json.dumps(order['items']),
+                order['total_amount'],
+                order['restaurant_location'],
+                order['status'],
+                order['client_total'],
+                order['price_mismatch'],
+                created_at
             ))
-            conn.commit()
+            order['id'] = cursor.lastrowid
+            return order_number
         
-        return order_number
+        result = self._write(write, self._order_store(order['restaurant_location']))
+        # A replayed Idempotency-Key returns an order the board already has
+        if result == order_number:
+            self.order_board.put(order)
+        return result
     
     def get_order(self, order_number: str) -> Optional[Dict]:
         """Get order details by order number."""
         import json
         
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM orders WHERE order_number = ?', (order_number,))
-            row = cursor.fetchone()
-            
+        row = None
+        for db_path in self._order_stores():
+            with sqlite3.connect(db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM orders WHERE order_number = ?', (order_number,))
+                row = cursor.fetchone()
             if row:
-                order = dict(row)
-                order['items'] = json.loads(order['items'])
-                order['customer_info'] = json.loads(order['customer_info']) if order['customer_info'] else {}
-                return order
-            return None
+                break
+        
+        # Old orders live in the archive; their QR codes must still resolve
+        if not row and os.path.exists(self.archive_path):
+            with sqlite3.connect(f"file:{self.archive_path}?mode=ro", uri=True) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM orders WHERE order_number = ?', (order_number,))
+                row = cursor.fetchone()
+        
+        if row:
+            order = dict(row)
+            order['items'] = json.loads(order['items'])
+            order['customer_info'] = json.loads(order['customer_info']) if order['customer_info'] else {}
+            return order
+        return None
+    
+    def get_order_status(self, order_number: str) -> Optional[str]:
+        """An order's status, or None if there is no such order."""
+        order = self.get_open_order(order_number)
+        if order:
+            return order['status']
+        
+        db_paths = self._order_stores()
+        if os.path.exists(self.archive_path):
+            db_paths.append(f"file:{self.archive_path}?mode=ro")
+        for db_path in db_paths:
+            with sqlite3.connect(db_path, uri=db_path.startswith('file:')) as conn:
+                row = conn.execute('SELECT status FROM orders WHERE order_number = ?', (order_number,)).fetchone()
+            if row:
+                return row[0]
+        return None
+    
+    def _attach_archive(self, conn):
+        """Attach the archive database as `archive`, creating its orders table if needed."""
+        conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive.orders (
+                id INTEGER PRIMARY KEY,
+                order_number TEXT UNIQUE NOT NULL,
+                customer_info TEXT,
+                items TEXT NOT NULL,
+                total_amount INTEGER NOT NULL,
+                status TEXT,
+                restaurant_location TEXT,
+                created_at TIMESTAMP,
+                completed_at TIMESTAMP,
+                qr_code_path TEXT,
+                client_total INTEGER,
+                price_mismatch BOOLEAN DEFAULT 0,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+    def archive_orders(self, older_than_days: int, batch_size: int = 500, dry_run: bool = False) -> int:
+        """Move finished orders older than older_than_days into the archive database.
+        
+        Each batch is copied and deleted in one transaction across both files,
+        so an interrupted run loses nothing. An order number already in the
+        archive aborts its batch (sqlite3.IntegrityError) rather than being
+        deleted uncopied. Returns the number of orders moved (or that would be
+        moved, for a dry run).
+        """
+        statuses = ', '.join('?' * len(ARCHIVABLE_STATUSES))
+        # Rejected orders have no completed_at
+        select_old = f'''
+            SELECT id FROM main.orders
+            WHERE status IN ({statuses})
+              AND COALESCE(completed_at, created_at) < datetime('now', ?)
+        '''
+        params = (*ARCHIVABLE_STATUSES, f'-{int(older_than_days)} days')
+        # Shards number their orders independently, so the archive assigns its own ids
+        columns = ', '.join(column for column in ORDER_COLUMNS if column != 'id')
+        
+        moved = 0
+        for db_path in self._order_stores():
+            conn = sqlite3.connect(db_path, isolation_level=None)
+            try:
+                if dry_run:
+                    moved += conn.execute(f'SELECT COUNT(*) FROM ({select_old})', params).fetchone()[0]
+                    continue
+                
+                self._attach_archive(conn)
+                while True:
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        ids = [row[0] for row in conn.execute(f'{select_old} LIMIT ?', (*params, batch_size))]
+                        if ids:
+                            id_list = ', '.join('?' * len(ids))
+                            conn.execute(f'''
+                                INSERT INTO archive.orders ({columns})
+                                SELECT {columns} FROM main.orders WHERE id IN ({id_list})
+                            ''', ids)
+                            conn.execute(f'DELETE FROM main.orders WHERE id IN ({id_list})', ids)
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+                    moved += len(ids)
+                    if len(ids) < batch_size:
+                        break
+            finally:
+                conn.close()
+        return moved
+    
+    def split_orders(self, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+        """Move orders still in the menu database into their location's shard.
+        
+        Idempotency keys move with their orders. Each batch is copied and
+        deleted in one transaction across both files; an order number already
+        in the shard aborts its batch (sqlite3.IntegrityError) rather than
+        being deleted uncopied. Returns the number of orders moved (or that
+        would be moved) per location.
+        """
+        # Shards number their orders independently, so ids are not copied
+        columns = ', '.join(column for column in ORDER_COLUMNS if column != 'id')
+        moved = {}
+        
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            for location, shard_path in self.order_shards.items():
+                if dry_run:
+                    moved[location] = conn.execute(
+                        'SELECT COUNT(*) FROM orders WHERE restaurant_location = ?', (location,)).fetchone()[0]
+                    continue
+                
+                conn.execute('ATTACH DATABASE ? AS shard', (shard_path,))
+                moved[location] = 0
+                while True:
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        ids = [row[0] for row in conn.execute(
+                            'SELECT id FROM main.orders WHERE restaurant_location = ? LIMIT ?',
+                            (location, batch_size))]
+                        if ids:
+                            id_list = ', '.join('?' * len(ids))
+                            order_numbers = f'SELECT order_number FROM main.orders WHERE id IN ({id_list})'
+                            conn.execute(f'''
+                                INSERT INTO shard.orders ({columns})
+                                SELECT {columns} FROM main.orders WHERE id IN ({id_list})
+                            ''', ids)
+                            conn.execute(f'''
+                                INSERT OR IGNORE INTO shard.idempotency_keys
+                                SELECT * FROM main.idempotency_keys WHERE order_number IN ({order_numbers})
+                            ''', ids)
+                            conn.execute(f'DELETE FROM main.idempotency_keys WHERE order_number IN ({order_numbers})', ids)
+                            conn.execute(f'DELETE FROM main.orders WHERE id IN ({id_list})', ids)
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+                    moved[location] += len(ids)
+                    if len(ids) < batch_size:
+                        break
+                conn.execute('DETACH DATABASE shard')
+        finally:
+            conn.close()
+        
+        # Keep each file's rollups covering the orders it holds
+        if not dry_run and any(moved.values()):
+            self.rebuild_sales_rollups()
+        return moved
     
     def get_pending_orders(self) -> List[Dict]:
         """Get all pending orders."""
@@ -544,39 +1290,82 @@ class MenuDatabase:
         return self.get_orders_by_status_and_location('pending', restaurant_location)
     
     def get_orders_by_status(self, status: str) -> List[Dict]:
-        """Get all orders by status."""
-        import json
-        
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM orders 
-                WHERE status = ? 
-                ORDER BY created_at DESC
-            ''', (status,))
-            
-            orders = []
-            for row in cursor.fetchall():
-                order = dict(row)
-                order['items'] = json.loads(order['items'])
-                order['customer_info'] = json.loads(order['customer_info']) if order['customer_info'] else {}
-                orders.append(order)
-            
-            return orders
+        """Get all orders by status; order-screen statuses are served from the order board."""
+        if self.order_board.tracks(status):
+            return self._order_board().orders(status)
+        return self._query_orders('status = ?', (status,))
     
     def get_orders_by_status_and_location(self, status: str, restaurant_location: str) -> List[Dict]:
         """Get all orders by status and restaurant location."""
+        if self.order_board.tracks(status):
+            return self._order_board().orders(status, restaurant_location)
+        return self._query_orders('status = ? AND restaurant_location = ?', (status, restaurant_location),
+                                  restaurant_location)
+    
+    def get_open_order(self, order_number: str) -> Optional[Dict]:
+        """A 'new' or 'pending' order from the order board, or None. Callers must not modify it."""
+        return self._order_board().get(order_number)
+    
+    def _order_board(self) -> OrderBoard:
+        """The order board, (re)loaded from every order shard when missing or stale."""
+        statuses = self.order_board.statuses
+        self.order_board.refresh(lambda: self._query_orders(
+            f"status IN ({', '.join('?' * len(statuses))})", statuses), self._order_data_version)
+        return self.order_board
+    
+    def _order_data_version(self) -> Tuple[int, ...]:
+        """PRAGMA data_version of every order file; it changes whenever another
+        connection commits, including writers in other processes. With group
+        commit it is read on the writer's own connection, so this process's
+        order writes (already applied to the board) do not force a reload.
+        Called under the board lock."""
+        versions = []
+        for db_path in self._order_stores():
+            if self.group_commit:
+                versions.append(self._writer(db_path).data_version())
+                continue
+            conn = self._version_conns.get(db_path)
+            if conn is None:
+                conn = self._version_conns[db_path] = sqlite3.connect(db_path, check_same_thread=False)
+            versions.append(conn.execute('PRAGMA data_version').fetchone()[0])
+        return tuple(versions)
+    
+    def warm_order_stores(self) -> int:
+        """Read every order store's order index and rollup tables into the page cache and
+        load the order board; returns the number of orders seen."""
+        orders = 0
+        for db_path in self._order_stores():
+            with sqlite3.connect(db_path) as conn:
+                # Walks the order_number index without touching the rows
+                orders += conn.execute("SELECT COUNT(order_number) FROM orders WHERE order_number > ''").fetchone()[0]
+                for table in ('sales_daily_items', 'sales_hourly', 'idempotency_keys'):
+                    conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()
+        self._order_board()
+        return orders
+    
+    def ping(self) -> Dict[str, float]:
+        """Time a query round trip to the menu database and each order store, in milliseconds."""
+        latencies = {}
+        for db_path, query in [(self.db_path, 'SELECT 1 FROM menu_items LIMIT 1')] + [
+                (path, 'SELECT 1 FROM orders LIMIT 1') for path in self.order_shards.values()]:
+            start = time.perf_counter()
+            with sqlite3.connect(db_path) as conn:
+                conn.execute(query).fetchone()
+            latencies[os.path.basename(db_path)] = round((time.perf_counter() - start) * 1000, 2)
+        return latencies
+    
+    def _query_orders(self, where: str, params: Tuple, restaurant_location: str = None) -> List[Dict]:
+        """Orders matching where across the shards for a location (all by default), newest first."""
         import json
         
+        columns = ', '.join(ORDER_COLUMNS)
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
+            schemas = self._attach_order_shards(conn, restaurant_location)
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM orders 
-                WHERE status = ? AND restaurant_location = ?
-                ORDER BY created_at DESC
-            ''', (status, restaurant_location))
+            cursor.execute(' UNION ALL '.join(
+                f'SELECT {columns} FROM {schema}.orders WHERE {where}' for schema in schemas
+            ) + ' ORDER BY created_at DESC', params * len(schemas))
             
             orders = []
             for row in cursor.fetchall():
@@ -588,9 +1377,19 @@ class MenuDatabase:
             return orders
     
     def update_order_status(self, order_number: str, status: str):
-        """Update order status."""
-        with sqlite3.connect(self.db_path) as conn:
+        """Update order status, keeping the sales rollups in step with completions."""
+        db_path = self._find_order_store(order_number)
+        if not db_path:
+            return
+        def write(conn):
             cursor = conn.cursor()
+            cursor.execute('SELECT status FROM orders WHERE order_number = ?', (order_number,))
+            row = cursor.fetchone()
+            previous_status = row[0] if row else None
+            
+            # Leaving 'completed' takes the order back out of the rollups
+            if previous_status == 'completed' and status != 'completed':
+                self._rollup_order(cursor, order_number, -1)
             
             if status == 'completed':
                 cursor.execute('''
@@ -605,11 +1404,180 @@ class MenuDatabase:
                     WHERE order_number = ?
                 ''', (status, order_number))
             
-            conn.commit()
+            # Completing twice must not count the order twice
+            if status == 'completed' and previous_status not in (None, 'completed'):
+                self._rollup_order(cursor, order_number, 1)
+        
+        self._write(write, db_path)
+        
+        # Keep the order board in step; an order coming back onto it is read in full
+        if not self.order_board.set_status(order_number, status) and self.order_board.tracks(status):
+            order = self.get_order(order_number)
+            if order:
+                self.order_board.put(order)
+    
+    def _rollup_order(self, cursor, order_number: str, sign: int):
+        """Add (sign=1) or remove (sign=-1) one completed order from the sales rollups."""
+        import json
+        
+        cursor.execute('''
+            SELECT items, total_amount, restaurant_location, completed_at
+            FROM orders WHERE order_number = ?
+        ''', (order_number,))
+        items, total_amount, location, completed_at = cursor.fetchone()
+        location = location or ''
+        day, hour = sales_bucket(completed_at)
+        
+        cursor.executemany('''
+            INSERT INTO sales_daily_items
+                (day, restaurant_location, item_type, item_id, item_name, quantity, revenue)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, restaurant_location, item_type, item_id) DO UPDATE SET
+                item_name = excluded.item_name,
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue
+        ''', [(day, location, item_type, item_id, name, sign * quantity, sign * revenue)
+              for item_type, item_id, name, quantity, revenue
+              in order_item_rows(json.loads(items))])
+        
+        cursor.execute('''
+            INSERT INTO sales_hourly (day, hour, restaurant_location, orders, revenue)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (day, hour, restaurant_location) DO UPDATE SET
+                orders = orders + excluded.orders,
+                revenue = revenue + excluded.revenue
+        ''', (day, hour, location, sign, sign * (total_amount or 0)))
+    
+    def rebuild_sales_rollups(self) -> Tuple[int, int, int]:
+        """Recompute the sales rollups from every completed order.
+        
+        Each order store is read and rewritten inside one write transaction,
+        so an order completed meanwhile is either part of the rebuild or
+        rolled up after it, never lost. Archived orders are counted in the
+        store their location writes to.
+        
+        Returns (orders, day/item rows, hourly rows).
+        """
+        import json
+        
+        completed_orders = '''
+            SELECT items, total_amount, restaurant_location, completed_at
+            FROM orders WHERE status = 'completed' AND completed_at IS NOT NULL
+        '''
+        archive_uri = f"file:{self.archive_path}?mode=ro"
+        
+        def rebuild(db_path):
+            def write(conn):
+                daily_items = {}
+                hourly = {}
+                order_count = 0
+                sources = [conn.execute(completed_orders)]
+                archive = None
+                if os.path.exists(self.archive_path):
+                    # Archiving from this store needs its write lock, which this
+                    # transaction holds, so the archive cannot change under us
+                    archive = sqlite3.connect(archive_uri, uri=True)
+                    sources.append(row for row in archive.execute(completed_orders)
+                                   if self._order_store(row[2] or '') == db_path)
+                try:
+                    # Orders are streamed from the cursors; only the rollups are held in memory
+                    for rows in sources:
+                        for items, total_amount, location, completed_at in rows:
+                            location = location or ''
+                            day, hour = sales_bucket(completed_at)
+                            for item_type, item_id, name, quantity, revenue in order_item_rows(json.loads(items)):
+                                entry = daily_items.setdefault((day, location, item_type, item_id), [name, 0, 0])
+                                entry[0] = name
+                                entry[1] += quantity
+                                entry[2] += revenue
+                            entry = hourly.setdefault((day, hour, location), [0, 0])
+                            entry[0] += 1
+                            entry[1] += total_amount or 0
+                            order_count += 1
+                finally:
+                    if archive is not None:
+                        archive.close()
+                
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM sales_daily_items')
+                cursor.execute('DELETE FROM sales_hourly')
+                cursor.executemany('''
+                    INSERT INTO sales_daily_items
+                        (day, restaurant_location, item_type, item_id, item_name, quantity, revenue)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [key + tuple(values) for key, values in daily_items.items()])
+                cursor.executemany('''
+                    INSERT INTO sales_hourly (day, hour, restaurant_location, orders, revenue)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [key + tuple(values) for key, values in hourly.items()])
+                return order_count, len(daily_items), len(hourly)
+            return self._write(write, db_path)
+        
+        totals = [0, 0, 0]
+        for db_path in self._order_stores():
+            for index, count in enumerate(rebuild(db_path)):
+                totals[index] += count
+        return tuple(totals)
+    
+    def get_sales_report(self, start_day: str, end_day: str, restaurant_location: str = None) -> Dict:
+        """Sales between two local days (inclusive), read from the rollups only."""
+        where = 'day BETWEEN ? AND ?'
+        params = [start_day, end_day]
+        if restaurant_location:
+            where += ' AND restaurant_location = ?'
+            params.append(restaurant_location)
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            schemas = self._attach_order_shards(conn, restaurant_location)
+            params = params * len(schemas)
+            daily_items = ' UNION ALL '.join(
+                f'SELECT * FROM {schema}.sales_daily_items WHERE {where}' for schema in schemas)
+            hourly = ' UNION ALL '.join(
+                f'SELECT * FROM {schema}.sales_hourly WHERE {where}' for schema in schemas)
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT item_type, item_id, MAX(item_name) AS item_name,
+                       SUM(quantity) AS quantity, SUM(revenue) AS revenue
+                FROM ({daily_items})
+                GROUP BY item_type, item_id
+                HAVING SUM(quantity) != 0
+                ORDER BY quantity DESC, revenue DESC
+            ''', params)
+            items = [dict(row) for row in cursor.fetchall()]
+            
+            cursor.execute(f'''
+                SELECT day, SUM(orders) AS orders, SUM(revenue) AS revenue
+                FROM ({hourly})
+                GROUP BY day ORDER BY day
+            ''', params)
+            days = [dict(row) for row in cursor.fetchall()]
+            
+            cursor.execute(f'''
+                SELECT hour, SUM(orders) AS orders, SUM(revenue) AS revenue
+                FROM ({hourly})
+                GROUP BY hour ORDER BY hour
+            ''', params)
+            hours = [dict(row) for row in cursor.fetchall()]
+        
+        return {
+            'from': start_day,
+            'to': end_day,
+            'restaurant_location': restaurant_location or 'all',
+            'orders': sum(day['orders'] for day in days),
+            'revenue': sum(day['revenue'] for day in days),
+            'days': days,
+            'hours': hours,
+            'items': items,
+        }
     
     def update_order_qr_path(self, order_number: str, qr_path: str):
         """Update QR code path for an order."""
-        with sqlite3.connect(self.db_path) as conn:
+        db_path = self._find_order_store(order_number)
+        if not db_path:
+            return
+        with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE orders 
@@ -617,6 +1585,126 @@ class MenuDatabase:
                 WHERE order_number = ?
             ''', (qr_path, order_number))
             conn.commit()
+        
+        order = self.order_board.get(order_number)
+        if order:
+            self.order_board.put(dict(order, qr_code_path=qr_path))
+
+    def create_reservation(self, reservation: Dict) -> int:
+        """Book a reservation's seats in its slot and store it; returns its id.
+
+        Raises SlotFull, and stores nothing, if the slot has fewer seats left.
+        """
+        import json
+        
+        location = reservation['restaurant_location']
+        day = reservation['day']
+        slot = reservation['slot']
+        seats = reservation['seats']
+        
+        def write(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO reservation_slots (restaurant_location, day, slot, capacity)
+                VALUES (?, ?, ?, ?)
+            ''', (location, day, slot, RESERVATION_SLOT_CAPACITY))
+            cursor.execute('''
+                UPDATE reservation_slots SET booked = booked + ?
+                WHERE restaurant_location = ? AND day = ? AND slot = ? AND booked + ? <= capacity
+            ''', (seats, location, day, slot, seats))
+            if cursor.rowcount == 0:
+                capacity, booked = cursor.execute('''
+                    SELECT capacity, booked FROM reservation_slots
+                    WHERE restaurant_location = ? AND day = ? AND slot = ?
+                ''', (location, day, slot)).fetchone()
+                raise SlotFull(max(capacity - booked, 0))
+            cursor.execute('''
+                INSERT INTO reservations (reservation_type, restaurant_location, day, slot, seats,
+                                          representative_name, email, phone, details)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (reservation['reservation_type'], location, day, slot, seats,
+                  reservation.get('representative_name'), reservation['email'], reservation.get('phone'),
+                  json.dumps(reservation.get('details') or {}, ensure_ascii=False)))
+            return cursor.lastrowid
+        
+        return self._write(write)
+    
+    def cancel_reservation(self, reservation_id: int) -> bool:
+        """Cancel a booked reservation and free its seats; returns False if it was not booked."""
+        def write(conn):
+            cursor = conn.cursor()
+            row = cursor.execute('''
+                SELECT restaurant_location, day, slot, seats FROM reservations
+                WHERE id = ? AND status = 'booked'
+            ''', (reservation_id,)).fetchone()
+            if not row:
+                return False
+            cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE id = ?", (reservation_id,))
+            cursor.execute('''
+                UPDATE reservation_slots SET booked = MAX(booked - ?, 0)
+                WHERE restaurant_location = ? AND day = ? AND slot = ?
+            ''', (row[3], row[0], row[1], row[2]))
+            return True
+        
+        return self._write(write)
+    
+    def set_slot_capacity(self, restaurant_location: str, day: str, slot: str, capacity: int):
+        """Set one slot's seat capacity; 0 closes it. Seats already booked stay booked."""
+        def write(conn):
+            conn.execute('''
+                INSERT INTO reservation_slots (restaurant_location, day, slot, capacity)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (restaurant_location, day, slot) DO UPDATE SET capacity = excluded.capacity
+            ''', (restaurant_location, day, slot, capacity))
+        
+        self._write(write)
+    
+    def get_availability(self, restaurant_location: str, start_day: str, end_day: str, seats: int = 1) -> Dict:
+        """Open slots with at least seats free on each day of a range, read from the slot counters."""
+        from datetime import datetime, timedelta
+        
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute('''
+                SELECT day, slot, capacity - booked FROM reservation_slots
+                WHERE restaurant_location = ? AND day BETWEEN ? AND ?
+            ''', (restaurant_location, start_day, end_day)).fetchall()
+        free = {(day, slot): available for day, slot, available in rows}
+        
+        days = []
+        day = datetime.strptime(start_day, DATE_FORMAT).date()
+        last = datetime.strptime(end_day, DATE_FORMAT).date()
+        while day <= last:
+            key = day.strftime(DATE_FORMAT)
+            slots = []
+            for slot in RESERVATION_SLOTS:
+                available = free.get((key, slot), RESERVATION_SLOT_CAPACITY)
+                if available >= seats:
+                    slots.append({'time': slot, 'available': available})
+            days.append({'date': key, 'slots': slots})
+            day += timedelta(days=1)
+        
+        return {
+            'restaurant_location': restaurant_location,
+            'from': start_day,
+            'to': end_day,
+            'seats': seats,
+            'days': days,
+        }
+    
+    def get_reservations(self, restaurant_location: str, start_day: str, end_day: str) -> List[Dict]:
+        """Booked reservations at a location for a day range, in slot order."""
+        import json
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('''
+                SELECT id, reservation_type, restaurant_location, day, slot, seats,
+                       representative_name, email, phone, details, created_at
+                FROM reservations
+                WHERE restaurant_location = ? AND day BETWEEN ? AND ? AND status = 'booked'
+                ORDER BY day, slot, id
+            ''', (restaurant_location, start_day, end_day)).fetchall()
+        return [dict(row, details=json.loads(row['details'] or '{}')) for row in rows]
 
     def get_items_without_images(self) -> List[Dict]:
         """Get all menu items that don't have images yet."""
@@ -634,6 +1722,47 @@ class MenuDatabase:
             
             return [dict(row) for row in cursor.fetchall()]
 
+    def get_menu_items_with_locations(self, only_without_images: bool = True) -> List[Dict]:
+        """Get menu items with the locations that serve them, for image matching."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            
+            where = "WHERE mi.image_url IS NULL OR mi.image_url = ''" if only_without_images else ""
+            cursor.execute(f'''
+                SELECT mi.id, mi.name_en, mi.name_jp, mi.image_url,
+                       GROUP_CONCAT(rm.restaurant_location) AS locations
+                FROM menu_items mi
+                LEFT JOIN restaurant_menus rm ON mi.id = rm.menu_item_id
+                {where}
+                GROUP BY mi.id
+                ORDER BY mi.id
+            ''')
+            
+            items = []
+            for row in cursor.fetchall():
+                item = dict(row)
+                item['locations'] = set(item['locations'].split(',')) if item['locations'] else set()
+                items.append(item)
+            return items
+
+    def get_image_references(self) -> List[Dict]:
+        """Get every menu item and set menu row that points at an image."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT 'menu_items' AS source, id, name_en, image_url FROM menu_items
+                WHERE image_url IS NOT NULL AND image_url != ''
+                UNION ALL
+                SELECT 'menu_sets' AS source, id, name_en, image_url FROM menu_sets
+                WHERE image_url IS NOT NULL AND image_url != ''
+                ORDER BY source, id
+            ''')
+            
+            return [dict(row) for row in cursor.fetchall()]
+
     def get_all_set_menus(self) -> List[Dict]:
         """Get all set menus for admin interface."""
         with sqlite3.connect(self.db_path) as conn:
@@ -659,19 +1788,24 @@ class MenuDatabase:
             ''', (restaurant_location, set_id))
             
             conn.commit()
+            self.invalidate_menu_cache()
 
     def get_english_name_for_item(self, item_id: int, item_type: str = 'menu_item') -> str:
         """Get English name for a menu item or set menu by ID."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            if item_type == 'set_menu':
-                cursor.execute('SELECT name_en FROM menu_sets WHERE id = ?', (item_id,))
-            else:
-                cursor.execute('SELECT name_en FROM menu_items WHERE id = ?', (item_id,))
-            
-            result = cursor.fetchone()
-            return result[0] if result else None
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        return self._english_names().get((item_type == 'set_menu', item_id))
+    
+    def _english_names(self) -> Dict[Tuple[bool, int], str]:
+        """(is_set_menu, id) -> English name for every menu item and set menu, cached."""
+        def load():
+            with sqlite3.connect(self.db_path) as conn:
+                names = {(False, item_id): name for item_id, name in conn.execute('SELECT id, name_en FROM menu_items')}
+                names.update({(True, set_id): name for set_id, name in conn.execute('SELECT id, name_en FROM menu_sets')})
+                return names
+        return self._cached_menu_read(('english_names',), load)
 
     def add_set_menu(self, name_en: str, name_jp: str, description_en: str = None, 
                     description_jp: str = None, price: int = 0, image_url: str = None,
@@ -691,6 +1825,7 @@ class MenuDatabase:
             
             set_id = cursor.lastrowid
             conn.commit()
+            self.invalidate_menu_cache()
             return set_id
 
 
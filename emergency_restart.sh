@@ -91,6 +91,18 @@ else
   echo "$(TIMESTAMP) No requirements.txt found; skipping pip install." | tee -a "$LOG"
 fi
 
+# 4b) Rebuild per-page CSS bundles and gzip-precompressed static assets
+if [ -x "${VENV_DIR}/bin/python" ]; then
+  echo "$(TIMESTAMP) Building per-page CSS bundles" | tee -a "$LOG"
+  "${VENV_DIR}/bin/python" css_bundles.py 2>&1 | tee -a "$LOG" || {
+    echo "$(TIMESTAMP) WARNING: CSS bundle build failed, keeping the previous bundles (or style.css)." | tee -a "$LOG"
+  }
+  echo "$(TIMESTAMP) Precompressing static assets" | tee -a "$LOG"
+  "${VENV_DIR}/bin/python" precompress_static.py 2>&1 | tee -a "$LOG" || {
+    echo "$(TIMESTAMP) WARNING: precompress failed, serving uncompressed assets." | tee -a "$LOG"
+  }
+fi
+
 # 5) Reload systemd (in case service file changed), restart taj
 echo "$(TIMESTAMP) Reloading systemd & restarting service: $SERVICE_NAME" | tee -a "$LOG"
 systemctl daemon-reload
@@ -98,6 +110,25 @@ systemctl restart "$SERVICE_NAME"
 sleep 1
 systemctl status "$SERVICE_NAME" --no-pager -l | tee -a "$LOG"
 
+# 5b) Wait until the app has warmed up (templates, menus, order indexes) and
+#     its database answers; /healthz/ready returns 503 until then
+READY_URL="${READY_URL:-https://127.0.0.1:5300/healthz/ready}"
+READY_TIMEOUT="${READY_TIMEOUT:-60}"
+echo "$(TIMESTAMP) Waiting up to ${READY_TIMEOUT}s for ${READY_URL}" | tee -a "$LOG"
+READY=0
+for _ in $(seq "$READY_TIMEOUT"); do
+  if READY_OUTPUT=$(curl -ksf --max-time 2 "$READY_URL"); then
+    READY=1
+    break
+  fi
+  sleep 1
+done
+if [ "$READY" -eq 1 ]; then
+  echo "$(TIMESTAMP) Service ready: ${READY_OUTPUT}" | tee -a "$LOG"
+else
+  echo "$(TIMESTAMP) WARNING: service not ready after ${READY_TIMEOUT}s; check $READY_URL" | tee -a "$LOG"
+fi
+
 # 6) Reload nginx to pick up config changes (if any)
 echo "$(TIMESTAMP) Testing nginx config and reloading" | tee -a "$LOG"
 if nginx -t 2>&1 | tee -a "$LOG"; then
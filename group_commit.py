@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Group commit for SQLite writes.
+
+SQLite has one writer at a time, and each commit pays for its own fsync.
+GroupCommitWriter runs the writes of many request threads on one dedicated
+connection: it takes the first queued write, collects whatever else arrives
+within GROUP_COMMIT_WINDOW (waiting only while writes arrive concurrently),
+runs them all in one transaction (each under its own savepoint, so one
+failing write does not undo the others) and commits once. A caller's future resolves only after that commit has returned, i.e.
+once its row is durable.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# How long the writer waits for more writes after the first one, in seconds
+GROUP_COMMIT_WINDOW = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', '2')) / 1000
+# Upper bound on writes per transaction
+GROUP_COMMIT_MAX_BATCH = 64
+BUSY_TIMEOUT_MS = 5000
+
+
+class GroupCommitWriter:
+    def __init__(self, db_path: str, window: float = GROUP_COMMIT_WINDOW,
+                 max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.db_path = db_path
+        self.window = window
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        self.batches = 0
+        self.writes = 0
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        # Held while a batch runs on conn
+        self.conn_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, write) -> Future:
+        """Queue write(conn) to run in the next group transaction."""
+        future = Future()
+        self.jobs.put((write, future))
+        return future
+
+    def run(self, write):
+        """Queue write(conn) and wait until it is committed; returns its result or raises its error."""
+        return self.submit(write).result()
+
+    def data_version(self) -> int:
+        """PRAGMA data_version of the writer's connection. It changes when another
+        connection commits, never on the writer's own commits."""
+        with self.conn_lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _collect(self, wait: bool):
+        batch = [self.jobs.get()]
+        deadline = time.monotonic() + (self.window if wait else 0)
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.jobs.get(timeout=remaining) if remaining > 0 else self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self.conn
+        # Only hold a write back for the window while writes are arriving
+        # concurrently; a lone writer commits straight away
+        concurrent = False
+        while True:
+            batch = self._collect(concurrent)
+            concurrent = len(batch) > 1 or not self.jobs.empty()
+            outcomes = []
+            with self.conn_lock:
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    for write, _future in batch:
+                        conn.execute('SAVEPOINT write')
+                        try:
+                            outcomes.append((True, write(conn)))
+                            conn.execute('RELEASE write')
+                        except Exception as e:
+                            conn.execute('ROLLBACK TO write')
+                            conn.execute('RELEASE write')
+                            outcomes.append((False, e))
+                    conn.execute('COMMIT')
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    for _write, future in batch:
+                        future.set_exception(e)
+                    continue
+
+            self.batches += 1
+            self.writes += len(batch)
+            for (_write, future), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def stats(self):
+        """Return writer counters."""
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'queued': self.jobs.qsize(),
+            'average_batch': round(self.writes / self.batches, 2) if self.batches else 0,
+        }
+
+
+def run_write(db_path: str, write):
+    """Run write(conn) in its own transaction; the path used without group commit."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = write(conn)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+    finally:
+        conn.close()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Find visually duplicate images across static/images.
+
+Computes a 64-bit difference hash (dHash) for every image with a process
+pool, clusters images whose hashes are within a small Hamming distance, and
+reports the bytes that keeping only the smallest file of each cluster would
+save, together with the menu_items / menu_sets rows that point into each
+cluster.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from database import MenuDatabase
+from image_resolver import IMAGE_ROUTE_PREFIX, strip_static_prefix
+
+STATIC_DIR = "static"
+IMAGE_DIR = os.path.join(STATIC_DIR, "images")
+IMAGE_EXTENSIONS = ('.avif', '.webp', '.jpg', '.jpeg', '.png')
+# Hashes this close (out of 64 bits) are treated as the same picture
+MAX_DISTANCE = 6
+HASH_SIZE = 8
+# The hash is split into this many bands for the candidate search; two hashes
+# within MAX_DISTANCE bits must agree exactly on at least one band
+BANDS = 8
+
+
+def dhash(path):
+    """Return (path, 64-bit dHash or None, error message or None)."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.draft('L', (HASH_SIZE * 4, HASH_SIZE * 4))
+            pixels = list(image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    except Exception as e:
+        return path, None, str(e)
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return path, value, None
+
+
+def list_images(image_dir=IMAGE_DIR):
+    images = []
+    for root, _dirs, files in os.walk(image_dir):
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(root, filename).replace('\\', '/'))
+    return sorted(images)
+
+
+def hash_images(paths, workers=None):
+    """Hash images in a process pool; returns ({path: hash}, [(path, error)])."""
+    hashes, errors = {}, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, value, error in pool.map(dhash, paths, chunksize=16):
+            if value is None:
+                errors.append((path, error))
+            else:
+                hashes[path] = value
+    return hashes, errors
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def cluster_hashes(hashes, max_distance=MAX_DISTANCE):
+    """Group paths whose hashes are within max_distance bits of each other.
+
+    Candidate pairs come from band buckets instead of comparing every pair.
+    """
+    if max_distance >= BANDS:
+        raise ValueError(f"max_distance must be below {BANDS} for band lookup to be exact")
+
+    band_bits = HASH_SIZE * HASH_SIZE // BANDS
+    mask = (1 << band_bits) - 1
+    buckets = {}
+    for path, value in hashes.items():
+        for band in range(BANDS):
+            key = (band, (value >> (band * band_bits)) & mask)
+            buckets.setdefault(key, []).append(path)
+
+    groups = UnionFind()
+    checked = set()
+    for paths in buckets.values():
+        for i, a in enumerate(paths):
+            for b in paths[i + 1:]:
+                pair = (a, b) if a < b else (b, a)
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                if bin(hashes[a] ^ hashes[b]).count('1') <= max_distance:
+                    groups.union(a, b)
+
+    clusters = {}
+    for path in hashes:
+        clusters.setdefault(groups.find(path), []).append(path)
+    return [sorted(members) for members in clusters.values() if len(members) > 1]
+
+
+def url_to_paths(image_url, known_paths):
+    """Map a stored image_url (static or negotiated /img/) to the files it can serve."""
+    if image_url.startswith(IMAGE_ROUTE_PREFIX):
+        base = f"{IMAGE_DIR}/{image_url[len(IMAGE_ROUTE_PREFIX):]}".replace('\\', '/')
+        return [path for path in known_paths if os.path.splitext(path)[0] == base]
+    path = f"{STATIC_DIR}/{strip_static_prefix(image_url)}"
+    return [path] if path in known_paths else []
+
+
+def build_report(clusters, references, sizes):
+    """Describe each cluster with its sizes, the file to keep, and the rows using it."""
+    path_to_cluster = {path: index for index, members in enumerate(clusters) for path in members}
+    known_paths = set(sizes)
+    cluster_refs = [[] for _ in clusters]
+    for ref in references:
+        ref_clusters = {path_to_cluster[path] for path in url_to_paths(ref['image_url'], known_paths)
+                        if path in path_to_cluster}
+        for index in ref_clusters:
+            cluster_refs[index].append({
+                'table': ref['source'], 'id': ref['id'],
+                'name_en': ref['name_en'], 'image_url': ref['image_url']
+            })
+
+    report = []
+    for index, members in enumerate(clusters):
+        keep = min(members, key=lambda path: sizes[path])
+        total = sum(sizes[path] for path in members)
+        report.append({
+            'keep': keep,
+            'files': [{'path': path, 'bytes': sizes[path]} for path in members],
+            'total_bytes': total,
+            'savable_bytes': total - sizes[keep],
+            'references': cluster_refs[index],
+        })
+    report.sort(key=lambda cluster: cluster['savable_bytes'], reverse=True)
+    return report
+
+
+def find_duplicates(image_dir=IMAGE_DIR, max_distance=MAX_DISTANCE, workers=None):
+    paths = list_images(image_dir)
+    hashes, errors = hash_images(paths, workers)
+    clusters = cluster_hashes(hashes, max_distance)
+    sizes = {path: os.path.getsize(path) for path in paths}
+    references = MenuDatabase().get_image_references()
+    return build_report(clusters, references, sizes), len(paths), errors
+
+
+def print_report(report, image_count, errors):
+    print(f"Hashed {image_count - len(errors)} of {image_count} images")
+    for path, error in errors:
+        print(f"  skipped {path}: {error}")
+
+    print(f"\n{len(report)} duplicate clusters")
+    for cluster in report:
+        print(f"\nkeep {cluster['keep']} (saves {cluster['savable_bytes']:,} bytes)")
+        for entry in cluster['files']:
+            marker = '*' if entry['path'] == cluster['keep'] else ' '
+            print(f"  {marker} {entry['path']} ({entry['bytes']:,} bytes)")
+        for ref in cluster['references']:
+            print(f"    used by {ref['table']} #{ref['id']} {ref['name_en']}: {ref['image_url']}")
+
+    total = sum(cluster['savable_bytes'] for cluster in report)
+    print(f"\nTotal savable: {total:,} bytes")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Find near-duplicate images under static/images")
+    parser.add_argument('--distance', type=int, default=MAX_DISTANCE,
+                        help=f"max Hamming distance between hashes (0-{BANDS - 1})")
+    parser.add_argument('--workers', type=int, default=None, help="hashing processes")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    report, image_count, errors = find_duplicates(max_distance=args.distance, workers=args.workers)
+    print_report(report, image_count, errors)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Wrote {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
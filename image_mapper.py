@@ -1,137 +1,304 @@
 #!/usr/bin/env python3
 """
 Utility to help map existing menu images to database items
+
+Builds normalized token and trigram indexes over menu item names (EN and JP)
+and image filenames, scores every item against every image in bulk through
+the indexes, and writes image_update_plan.json in the
+[item_id, url, fs_path] format update.py consumes.
 """
 
+import argparse
+import json
+import math
 import os
+import re
+import unicodedata
+from collections import defaultdict
+
 from database import MenuDatabase
+from image_resolver import ImageIndex
+
+STATIC_DIR = "static"
+PLAN_FILE = "image_update_plan.json"
+# Only folders whose name contains this are treated as menu photos
+MENU_IMAGE_DIR_MARKER = "menu_images"
+
+MATCH_THRESHOLD = 0.6
+# Weight of whole-token overlap vs. trigram (spelling-tolerant) overlap
+TOKEN_SCORE_SHARE = 0.6
+# Names sharing no token with the query are only scored if they share this
+# fraction of its trigrams
+MIN_GRAM_SHARE = 0.5
+# The best image must beat the runner-up by this much to be applied blindly
+AMBIGUITY_MARGIN = 0.05
+# Bonus for an image stored in the folder of a location that serves the item
+LOCATION_BONUS = 0.1
+LOCATIONS = ('okinawa', 'nikko', 'fuji')
 
-def list_menu_images():
-    """List all available menu images"""
-    image_dir = "static/images/taj_nikko_fuji_menu_images"
-    if not os.path.exists(image_dir):
-        print(f"Directory {image_dir} not found!")
+# Words that say nothing about the dish
+STOP_TOKENS = {'taj', 'the', 'and', 'with', 'img', 'image', 'photo', 'small', 'ai', 'menu', 'spe'} | set(LOCATIONS)
+# Common spelling variants in filenames and menu names
+SPELLING_VARIANTS = {
+    'naan': 'nan',
+    'kebab': 'kabab',
+    'seekh': 'sheek',
+    'tagri': 'tangri',
+    'karaage': 'karage',
+    'margherita': 'margrita',
+    'pakora': 'pakoda',
+    'biriyani': 'biryani',
+    'fries': 'fried',
+    'wings': 'wing',
+}
+
+
+def normalize_tokens(text):
+    """Lowercase, NFKC-normalize and split a name or filename into dish tokens."""
+    if not text:
         return []
-    
-    images = []
-    for filename in sorted(os.listdir(image_dir)):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.avif')):
-            images.append(filename)
-    
-    return images
-
-def suggest_image_mappings():
-    """Suggest image mappings based on filename patterns"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = []
+    for token in re.split(r'[\W_]+', text):
+        token = token.strip('0123456789') if token.isascii() else token
+        if not token or token in STOP_TOKENS:
+            continue
+        tokens.append(SPELLING_VARIANTS.get(token, token))
+    return tokens
+
+
+def trigrams(tokens):
+    """Padded character trigrams of each token."""
+    grams = set()
+    for token in tokens:
+        padded = f"  {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def dice(shared, size_a, size_b):
+    return 2.0 * shared / (size_a + size_b) if size_a + size_b else 0.0
+
+
+def token_weights(names):
+    """Inverse document frequency of every token across a corpus of names.
+
+    Generic words such as 'chicken' or 'curry' weigh little, distinctive
+    ones such as 'gappao' or 'tikka' decide the match.
+    """
+    document_frequency = defaultdict(int)
+    for name in names:
+        for token in set(normalize_tokens(name)):
+            document_frequency[token] += 1
+    total = max(len(names), 1)
+    return {token: math.log(1 + total / count) for token, count in document_frequency.items()}
+
+
+class NameIndex:
+    """Inverted token and trigram indexes over a set of named documents.
+
+    A document may have several names (EN and JP); a query scores each name
+    and keeps the best one per document.
+    """
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.default_weight = max(weights.values(), default=1.0)
+        self.token_postings = defaultdict(set)
+        self.trigram_postings = defaultdict(set)
+        self.name_tokens = {}
+        self.name_weights = {}
+        self.name_grams = {}
+        self.exact = defaultdict(set)
+
+    def weight(self, tokens):
+        return sum(self.weights.get(token, self.default_weight) for token in tokens)
+
+    def add(self, doc_id, names):
+        for field, name in enumerate(names):
+            tokens = normalize_tokens(name)
+            if not tokens:
+                continue
+            key = (doc_id, field)
+            grams = trigrams(tokens)
+            self.name_tokens[key] = frozenset(tokens)
+            self.name_weights[key] = self.weight(self.name_tokens[key])
+            self.name_grams[key] = frozenset(grams)
+            self.exact[' '.join(tokens)].add(doc_id)
+            for token in set(tokens):
+                self.token_postings[token].add(key)
+            for gram in grams:
+                self.trigram_postings[gram].add(key)
+
+    def candidates(self, query_tokens, query_grams):
+        """Keys sharing a token with the query, or at least MIN_GRAM_SHARE of its trigrams.
+
+        By pigeonhole, a name sharing that many trigrams must contain one of
+        the len - needed + 1 rarest query trigrams, so the very common ones
+        (word starts like '  c') never have to be walked.
+        """
+        keys = set()
+        for token in query_tokens:
+            keys |= self.token_postings.get(token, set())
+
+        needed = math.ceil(MIN_GRAM_SHARE * len(query_grams))
+        rarest = sorted(query_grams, key=lambda gram: len(self.trigram_postings.get(gram, ())))
+        for gram in rarest[:len(query_grams) - needed + 1]:
+            keys |= self.trigram_postings.get(gram, set())
+        return keys
+
+    def score(self, name):
+        """Return {doc_id: score in [0, 1]} for the documents worth scoring against name."""
+        tokens = normalize_tokens(name)
+        if not tokens:
+            return {}
+        query_tokens = set(tokens)
+        query_grams = trigrams(tokens)
+        query_weight = self.weight(query_tokens)
+
+        scores = {}
+        for key in self.candidates(query_tokens, query_grams):
+            name_grams = self.name_grams[key]
+            shared_weight = self.weight(query_tokens & self.name_tokens[key])
+            score = (TOKEN_SCORE_SHARE * dice(shared_weight, query_weight, self.name_weights[key])
+                     + (1 - TOKEN_SCORE_SHARE) * dice(len(query_grams & name_grams), len(query_grams), len(name_grams)))
+            doc_id = key[0]
+            if score > scores.get(doc_id, 0.0):
+                scores[doc_id] = score
+
+        for doc_id in self.exact.get(' '.join(tokens), ()):
+            scores[doc_id] = 1.0
+        return scores
+
+
+def folder_locations(path):
+    """Return the restaurant locations a menu image folder belongs to."""
+    folder = os.path.basename(os.path.dirname(path))
+    return {location for location in LOCATIONS if location in folder}
+
+
+def list_menu_images(static_dir=STATIC_DIR):
+    """List available menu images as {base path: smallest variant path}.
+
+    Format variants of the same image (x.png / x.webp) collapse into one
+    candidate that points at the smallest file.
+    """
+    index = ImageIndex(static_dir)
+    images = {}
+    for base, variants in index.formats.items():
+        if MENU_IMAGE_DIR_MARKER not in os.path.dirname(base):
+            continue
+        images[base] = f"{os.path.dirname(base)}/{variants[0][0]}"
+    return dict(sorted(images.items()))
+
+
+def build_image_plan(items, images, threshold=MATCH_THRESHOLD, margin=AMBIGUITY_MARGIN):
+    """Match items to images and return {'plan', 'ambiguous', 'no_match'}."""
+    image_bases = list(images)
+    weights = token_weights([os.path.basename(base) for base in image_bases]
+                            + [item['name_en'] for item in items])
+
+    image_index = NameIndex(weights)
+    for position, base in enumerate(image_bases):
+        image_index.add(position, [os.path.basename(base)])
+
+    item_index = NameIndex(weights)
+    for item in items:
+        item_index.add(item['id'], [item['name_en'], item['name_jp']])
+
+    plan = []
+    ambiguous = []
+    used_images = set()
+
+    image_locations = [folder_locations(base) for base in image_bases]
+
+    for item in items:
+        scores = {}
+        for name in (item['name_en'], item['name_jp']):
+            for position, score in image_index.score(name).items():
+                scores[position] = max(score, scores.get(position, 0.0))
+
+        # The threshold applies to the name score alone; the location bonus
+        # only breaks ties between equally good images
+        ranked = sorted(
+            ((position, score + (LOCATION_BONUS if image_locations[position] & item['locations'] else 0.0))
+             for position, score in scores.items() if score >= threshold),
+            key=lambda pair: pair[1], reverse=True)
+        if not ranked:
+            continue
+
+        best_position, best_score = ranked[0]
+        if len(ranked) > 1 and best_score - ranked[1][1] < margin:
+            ambiguous.append({
+                'item': {'id': item['id'], 'name_en': item['name_en']},
+                'candidates': [
+                    {'file': f"{STATIC_DIR}/{images[image_bases[position]]}", 'score': round(score, 3)}
+                    for position, score in ranked[:5] if best_score - score < margin
+                ]
+            })
+            continue
+
+        fs_path = f"{STATIC_DIR}/{images[image_bases[best_position]]}"
+        plan.append([item['id'], '/' + fs_path, fs_path])
+        used_images.add(best_position)
+
+    # Images no item matched well enough, for manual review
+    no_match = []
+    for position, base in enumerate(image_bases):
+        if position in used_images:
+            continue
+        scores = item_index.score(os.path.basename(base))
+        if not scores or max(scores.values()) < threshold:
+            no_match.append(f"{STATIC_DIR}/{images[base]}")
+
+    return {'plan': plan, 'ambiguous': ambiguous, 'no_match': no_match}
+
+
+def suggest_image_mappings(include_items_with_images=False, output=PLAN_FILE,
+                           threshold=MATCH_THRESHOLD):
+    """Suggest image mappings and write them as an update.py plan"""
     db = MenuDatabase()
-    items_without_images = db.get_items_without_images()
-    available_images = list_menu_images()
-    
+    items = db.get_menu_items_with_locations(only_without_images=not include_items_with_images)
+    images = list_menu_images()
+
     print("=== MENU IMAGE MAPPING SUGGESTIONS ===\n")
-    
-    # Create mapping suggestions
-    suggestions = []
-    
-    # Common mappings based on your image filenames
-    image_mappings = {
-        # Salads & Tandoori
-        "0 Salad Tandoori 1.png": ["Caesar Salad", "Taj Green Salad"],
-        "0 Salad Tandoori 2.png": ["Mini Salad", "Seekh Kabab"],
-        "0 Salad Tandoori 3.png": ["Tandoori Chicken", "Chicken Tikka"],
-        
-        # Snacks
-        "1 Snacks 1.png": ["Samosa", "Papad"],
-        "1 Snacks 2.png": ["Vegetable Pakoda", "Fried Potato"],
-        "1 Snacks 3.png": ["Fried Chicken (Karaage)", "Wing Fry"],
-        "1 Snacks 4.png": ["Prawn Crackers", "Prawn Aurora Sauce"],
-        "1 Snacks 5.png": ["Shrimp Toast", "Chicken with Eggplant"],
-        
-        # Set Menu
-        "2 Set Menu 1.png": ["Double Curry Set"],
-        "2 Set Menu 2.png": ["Vegetarian Set"],
-        "2 Set Menu 3.png": ["Tandoori Set"],
-        "2 Set Menu 4.png": ["Kids Set"],
-        
-        # Curries
-        "3 Curry 1.png": ["Chicken Butter Masala", "Chicken Curry"],
-        "3 Curry 2.png": ["Coconut Chicken Curry", "Chicken Kashmiri"],
-        "3 Curry 3.png": ["Chicken Do Piaza", "Sag Chicken"],
-        "3 Curry 4.png": ["Chicken Tikka Masala", "Mutton Curry"],
-        "3 Curry 5.png": ["Sag Mutton", "Keema Curry"],
-        "3 Curry 6.png": ["Prawn Masala", "Vegetable Curry"],
-        "3 Curry 7.png": ["Palak Paneer", "Sahi Paneer"],
-        "3 Curry 8.png": ["Chana Masala", "Pulao"],
-        
-        # Nan & Rice
-        "4 Nan & Rice 1.png": ["Nan", "Garlic Nan"],
-        "4 Nan & Rice 2.png": ["Garlic Cheese Nan", "Cheese Nan"],
-        "4 Nan & Rice 3.png": ["Kabuli Nan", "Rice"],
-        "4 Nan & Rice 4.png": ["Cumin Rice (Basmati)", "Salad Set"],
-        "4 Nan & Rice 5.png": ["Chicken Biryani", "Mutton Biryani"],
-        
-        # Fusion & Dessert
-        "6 Fusion & Dessert1.png": ["Pad Thai"],
-        "6 Fusion & Dessert2.png": ["Gappao Rice"],
-        "6 Fusion & Dessert3.png": ["Tomato Pizza with Basil Sauce"],
-        "6 Fusion & Dessert4.png": ["Margrita"],
-        "6 Fusion & Dessert5.png": ["Chicken Pizza"],
-        "6 Fusion & Dessert6.png": ["Mango Kulfi"],
-        "6 Fusion & Dessert7.png": ["Kheer"],
-        "6 Fusion & Dessert8.png": ["Vanilla ice cream", "Rasgula"],
-    }
-    
-    print("Available Images:")
-    for i, img in enumerate(available_images, 1):
-        print(f"{i:2d}. {img}")
-    
-    print(f"\nMenu Items Without Images ({len(items_without_images)}):")
-    for i, item in enumerate(items_without_images, 1):
-        print(f"{i:2d}. {item['name_en']} ({item['category_name']})")
-    
-    print("\n" + "="*60)
-    print("SUGGESTED MAPPINGS:")
-    print("="*60)
-    
-    for image_file, suggested_items in image_mappings.items():
-        if image_file in available_images:
-            print(f"\n📸 {image_file}")
-            for item_name in suggested_items:
-                # Find matching item
-                matching_item = None
-                for item in items_without_images:
-                    if item['name_en'] == item_name:
-                        matching_item = item
-                        break
-                
-                if matching_item:
-                    image_url = f"/static/images/taj_nikko_fuji_menu_images/{image_file}"
-                    print(f"   → {item_name} (ID: {matching_item['id']})")
-                    print(f"     URL: {image_url}")
-                else:
-                    print(f"   → {item_name} (not found in database)")
-    
+    print(f"Menu items considered: {len(items)}")
+    print(f"Menu images indexed:   {len(images)}")
+
+    result = build_image_plan(items, images, threshold=threshold)
+    names = {item['id']: item['name_en'] for item in items}
+
     print("\n" + "="*60)
-    print("COPY-PASTE READY COMMANDS:")
+    print(f"SUGGESTED MAPPINGS ({len(result['plan'])}):")
     print("="*60)
-    print("# You can copy these URLs to the admin interface at http://localhost:5000/admin/menu")
-    print()
-    
-    for image_file, suggested_items in image_mappings.items():
-        if image_file in available_images:
-            image_url = f"http://localhost:5000/static/images/taj_nikko_fuji_menu_images/{image_file}"
-            print(f"# For {image_file}:")
-            for item_name in suggested_items:
-                matching_item = None
-                for item in items_without_images:
-                    if item['name_en'] == item_name:
-                        matching_item = item
-                        break
-                if matching_item:
-                    print(f"# {item_name}: {image_url}")
-            print()
+    for item_id, url, _fs_path in result['plan']:
+        print(f"   {names[item_id]} (ID: {item_id})")
+        print(f"     URL: {url}")
+
+    if result['ambiguous']:
+        print(f"\nAmbiguous ({len(result['ambiguous'])}), review in {output}:")
+        for entry in result['ambiguous']:
+            files = ', '.join(candidate['file'] for candidate in entry['candidates'])
+            print(f"   {entry['item']['name_en']} (ID: {entry['item']['id']}): {files}")
+
+    print(f"\nImages without a match: {len(result['no_match'])}")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nWrote {output}. Review it, then apply with: APPLY=1 python3 update.py")
+    return result
 
 def main():
     """Main function"""
-    suggest_image_mappings()
+    parser = argparse.ArgumentParser(description="Match menu images to menu items")
+    parser.add_argument('--all', action='store_true',
+                        help="also re-match items that already have an image")
+    parser.add_argument('--output', default=PLAN_FILE, help="plan file to write")
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD,
+                        help="minimum match score (0-1)")
+    args = parser.parse_args()
+    suggest_image_mappings(args.all, args.output, args.threshold)
 
 if __name__ == "__main__":
     main()
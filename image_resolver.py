@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Accept-header format negotiation for menu images.
+
+The same dish is often stored in several formats (cheese_naan.png and
+cheese_naan.webp, ...). ImageIndex maps each extensionless image path under
+static/images to the formats available on disk, and /img/<base> serves the
+smallest one the client's Accept header allows, with Vary: Accept.
+
+The index is built when the app starts (the warm-up step), so a deploy
+picks up new files. A path missing from the index starts a background
+rescan, at most every RESCAN_INTERVAL seconds; the request itself is not
+held up by it.
+"""
+
+import os
+import threading
+import time
+
+from flask import Blueprint, abort, current_app, request, send_from_directory
+
+IMAGE_ROOT = "images"
+IMAGE_ROUTE_PREFIX = "/img/"
+IMAGE_MIMETYPES = {
+    '.avif': 'image/avif',
+    '.webp': 'image/webp',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+}
+# Formats a browser may not support. Older browsers send image/* without
+# decoding these, so they are only served when the Accept header names them
+NEGOTIATED_MIMETYPES = ('image/avif', 'image/webp')
+IMAGE_EXTENSIONS = tuple(IMAGE_MIMETYPES)
+# A miss only triggers a rescan when the index is at least this old
+RESCAN_INTERVAL = 30
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 3600
+
+
+class ImageIndex:
+    """Index of extensionless image path -> [(extension, size), ...] sorted smallest first."""
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self.formats = {}
+        self.built_at = 0
+        self.scanning = False
+        self.lock = threading.Lock()
+        self.build()
+
+    def build(self):
+        """Scan static/images once and rebuild the index."""
+        formats = {}
+        root = os.path.join(self.static_folder, IMAGE_ROOT)
+        for dirpath, _dirs, files in os.walk(root):
+            for filename in files:
+                base, ext = os.path.splitext(filename)
+                ext = ext.lower()
+                if ext not in IMAGE_EXTENSIONS:
+                    continue
+                rel_dir = os.path.relpath(dirpath, self.static_folder).replace('\\', '/')
+                size = os.path.getsize(os.path.join(dirpath, filename))
+                formats.setdefault(f"{rel_dir}/{base}", []).append((filename, ext, size))
+
+        for variants in formats.values():
+            variants.sort(key=lambda variant: variant[2])
+
+        with self.lock:
+            self.formats = formats
+            self.built_at = time.time()
+
+    def variants(self, base: str):
+        """Return the variants for base; a miss starts a background rescan."""
+        variants = self.formats.get(base)
+        if variants is None:
+            self.rescan_soon()
+        return variants
+
+    def rescan_soon(self):
+        """Rebuild on a background thread, unless one is running or the index is recent."""
+        with self.lock:
+            if self.scanning or time.time() - self.built_at <= RESCAN_INTERVAL:
+                return
+            self.scanning = True
+        threading.Thread(target=self._rescan, name='image-rescan', daemon=True).start()
+
+    def _rescan(self):
+        try:
+            self.build()
+        except OSError as e:
+            print(f"Image index rescan failed: {e}")
+        finally:
+            with self.lock:
+                self.scanning = False
+
+    def resolve(self, base: str, accept):
+        """Return the static-relative path of the best acceptable variant, or None.
+
+        accept is the request's MIMEAccept. The variant with the highest
+        quality wins, the smallest file among equals.
+        """
+        variants = self.variants(base)
+        if not variants:
+            return None
+
+        best, best_quality = None, 0
+        for filename, ext, _size in variants:
+            quality = variant_quality(accept, IMAGE_MIMETYPES[ext])
+            if quality > best_quality:
+                best, best_quality = filename, quality
+        if best is None:
+            # Nothing matched the Accept header; the smallest file every
+            # browser decodes beats a 404
+            fallback = [filename for filename, ext, _size in variants
+                        if IMAGE_MIMETYPES[ext] not in NEGOTIATED_MIMETYPES]
+            best = fallback[0] if fallback else variants[0][0]
+        return f"{os.path.dirname(base)}/{best}"
+
+
+def variant_quality(accept, mimetype: str) -> float:
+    """Quality the Accept header gives mimetype; no header accepts the common formats."""
+    if mimetype in NEGOTIATED_MIMETYPES:
+        return max((quality for value, quality in accept if value.lower() == mimetype), default=0)
+    if not accept:
+        return 1
+    return accept.quality(mimetype)
+
+
+def strip_static_prefix(path: str) -> str:
+    """Turn '/static/images/x.png' or 'static/images/x.png' into 'images/x.png'."""
+    path = path.lstrip('/')
+    if path.startswith('static/'):
+        path = path[len('static/'):]
+    return path
+
+
+def negotiated_image_url(image_url: str) -> str:
+    """Map a stored static image URL to its stable, extensionless /img/ URL.
+
+    URLs that are already negotiated, external, or not indexed are returned
+    unchanged.
+    """
+    if not image_url or image_url.startswith(IMAGE_ROUTE_PREFIX):
+        return image_url
+    path = strip_static_prefix(image_url)
+    if not path.startswith(IMAGE_ROOT + '/'):
+        return image_url
+    base = os.path.splitext(path)[0]
+    if get_image_index().variants(base) is None:
+        return image_url
+    return IMAGE_ROUTE_PREFIX + base[len(IMAGE_ROOT) + 1:]
+
+
+_image_index = None
+_image_index_lock = threading.Lock()
+
+
+def get_image_index() -> ImageIndex:
+    """Return the process-wide image index, building it on first use."""
+    global _image_index
+    if _image_index is None:
+        with _image_index_lock:
+            if _image_index is None:
+                _image_index = ImageIndex(current_app.static_folder)
+    return _image_index
+
+
+image_bp = Blueprint('images', __name__)
+
+
+@image_bp.route('/img/<path:image_path>')
+def serve_image(image_path):
+    """Serve the smallest format of an image that the client accepts."""
+    base = f"{IMAGE_ROOT}/{os.path.splitext(image_path)[0]}"
+    resolved = get_image_index().resolve(base, request.accept_mimetypes)
+    if resolved is None:
+        abort(404)
+
+    response = send_from_directory(current_app.static_folder, resolved, max_age=IMAGE_CACHE_MAX_AGE)
+    response.vary.add('Accept')
+    return response
+
+
+def init_image_resolver(app):
+    """Register the /img/ route and the `negotiated_image` template filter."""
+    app.register_blueprint(image_bp)
+    app.add_template_filter(negotiated_image_url, 'negotiated_image')
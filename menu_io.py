@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Bulk menu import/export.
+
+Exports categories, menu_items, restaurant_menus, menu_sets and set_items as
+one CSV file per table or as a single JSON Lines stream, and imports them
+back. Records flow through a generator pipeline (read -> normalize ->
+batch -> upsert), so neither direction holds the whole menu in memory. An
+import runs in one transaction: existing rows are compared batch by batch and
+written with executemany, and the run reports inserted / updated / unchanged
+counts per table. Rows are matched on id (restaurant_menus on location and
+item); a row with an empty id is always inserted as a new one.
+
+    python3 menu_io.py export menu_export/            # CSV, one file per table
+    python3 menu_io.py export menu.jsonl              # JSON Lines
+    python3 menu_io.py import menu_export/ --dry-run
+    python3 menu_io.py import menu.jsonl
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+from database import MenuDatabase
+
+# Columns exchanged per table (timestamps are left to the database) and the
+# columns that identify an existing row
+TABLES = {
+    'categories': {
+        'columns': ('id', 'name_en', 'name_jp', 'icon', 'sort_order'),
+        'key': ('id',),
+    },
+    'menu_items': {
+        'columns': ('id', 'category_id', 'name_en', 'name_jp', 'description_en', 'description_jp',
+                    'price', 'price_2p', 'price_4p', 'image_url', 'image_alt', 'is_available',
+                    'is_spicy', 'spice_levels', 'allergens', 'dietary_tags', 'sort_order'),
+        'key': ('id',),
+    },
+    'menu_sets': {
+        'columns': ('id', 'name_en', 'name_jp', 'description_en', 'description_jp', 'price',
+                    'image_url', 'restaurant_location', 'is_available', 'sort_order'),
+        'key': ('id',),
+    },
+    'set_items': {
+        'columns': ('id', 'set_id', 'menu_item_id', 'item_description_en', 'item_description_jp',
+                    'quantity', 'is_choice', 'choice_group'),
+        'key': ('id',),
+    },
+    'restaurant_menus': {
+        'columns': ('restaurant_location', 'menu_item_id', 'is_featured', 'location_price',
+                    'location_availability'),
+        'key': ('restaurant_location', 'menu_item_id'),
+    },
+}
+# Parents before children, so an export replays cleanly into an empty database
+TABLE_ORDER = ('categories', 'menu_items', 'menu_sets', 'set_items', 'restaurant_menus')
+INTEGER_COLUMNS = {
+    'id', 'category_id', 'menu_item_id', 'set_id', 'sort_order', 'price', 'price_2p', 'price_4p',
+    'location_price', 'quantity', 'is_available', 'is_spicy', 'is_featured',
+    'location_availability', 'is_choice',
+}
+BATCH_SIZE = 500
+# SQLite's default limit on bound parameters per statement
+MAX_VARIABLES = 999
+
+
+class MenuImportError(ValueError):
+    pass
+
+
+# --- export ---------------------------------------------------------------
+
+def iter_table(conn, table):
+    """Yield a table's rows as dicts, streaming from the cursor."""
+    spec = TABLES[table]
+    cursor = conn.execute(
+        f"SELECT {', '.join(spec['columns'])} FROM {table} ORDER BY {', '.join(spec['key'])}")
+    for row in cursor:
+        yield dict(zip(spec['columns'], row))
+
+
+def export_csv(conn, directory, tables):
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    for table in tables:
+        path = os.path.join(directory, f"{table}.csv")
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=TABLES[table]['columns'])
+            writer.writeheader()
+            counts[table] = 0
+            for row in iter_table(conn, table):
+                writer.writerow(row)
+                counts[table] += 1
+    return counts
+
+
+def export_jsonl(conn, f, tables):
+    counts = {}
+    for table in tables:
+        counts[table] = 0
+        for row in iter_table(conn, table):
+            f.write(json.dumps({'table': table, **row}, ensure_ascii=False) + '\n')
+            counts[table] += 1
+    return counts
+
+
+# --- import ---------------------------------------------------------------
+
+def read_csv(path, table):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            yield table, row, f"{path}:{line_no}"
+
+
+def read_jsonl(f, name):
+    for line_no, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        yield record.pop('table', None), record, f"{name}:{line_no}"
+
+
+def read_source(source):
+    """Yield (table, raw record, location) from a CSV directory, a CSV file or a JSON Lines file."""
+    if source == '-':
+        yield from read_jsonl(sys.stdin, '<stdin>')
+    elif os.path.isdir(source):
+        for table in TABLE_ORDER:
+            path = os.path.join(source, f"{table}.csv")
+            if os.path.exists(path):
+                yield from read_csv(path, table)
+    elif source.endswith('.csv'):
+        yield from read_csv(source, os.path.splitext(os.path.basename(source))[0])
+    else:
+        with open(source, encoding='utf-8') as f:
+            yield from read_jsonl(f, source)
+
+
+def normalize(records):
+    """Validate records and coerce them to the values SQLite will store."""
+    for table, record, where in records:
+        if table not in TABLES:
+            raise MenuImportError(f"{where}: unknown table {table!r}")
+        spec = TABLES[table]
+        unknown = set(record) - set(spec['columns'])
+        if unknown:
+            raise MenuImportError(f"{where}: unknown columns for {table}: {', '.join(sorted(unknown))}")
+
+        row = {}
+        for column in spec['columns']:
+            if column not in record:
+                continue
+            value = record[column]
+            if column in INTEGER_COLUMNS and value not in ('', None):
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise MenuImportError(f"{where}: {column} must be an integer, got {value!r}")
+            elif column in INTEGER_COLUMNS:
+                value = None
+            row[column] = value
+
+        if spec['key'] != ('id',) and any(row.get(column) in ('', None) for column in spec['key']):
+            raise MenuImportError(f"{where}: {table} rows need {', '.join(spec['key'])}")
+        yield table, row
+
+
+def batched(rows, size=BATCH_SIZE):
+    """Group consecutive rows of the same table into lists of at most size rows."""
+    batch, batch_table = [], None
+    for table, row in rows:
+        if batch and (table != batch_table or len(batch) >= size):
+            yield batch_table, batch
+            batch = []
+        batch_table = table
+        batch.append(row)
+    if batch:
+        yield batch_table, batch
+
+
+def same_value(new, current):
+    # CSV cannot tell an empty string from NULL, so neither counts as a change
+    return new == current or (new in ('', None) and current in ('', None))
+
+
+def fetch_existing(conn, table, keys):
+    """Return {key tuple: {column: value}} for the keys that already exist."""
+    spec = TABLES[table]
+    key_columns = spec['key']
+    existing = {}
+    step = MAX_VARIABLES // len(key_columns)
+    for start in range(0, len(keys), step):
+        chunk = keys[start:start + step]
+        if len(key_columns) == 1:
+            where = f"{key_columns[0]} IN ({', '.join('?' * len(chunk))})"
+            params = [key[0] for key in chunk]
+        else:
+            row_value = '(' + ', '.join('?' * len(key_columns)) + ')'
+            where = f"({', '.join(key_columns)}) IN (VALUES {', '.join([row_value] * len(chunk))})"
+            params = [value for key in chunk for value in key]
+        cursor = conn.execute(f"SELECT {', '.join(spec['columns'])} FROM {table} WHERE {where}", params)
+        for row in cursor:
+            values = dict(zip(spec['columns'], row))
+            existing[tuple(values[c] for c in key_columns)] = values
+    return existing
+
+
+def upsert_batch(conn, table, rows, counts):
+    """Insert new rows and update changed ones for a single table batch."""
+    spec = TABLES[table]
+    key_columns = spec['key']
+    keyed = [row for row in rows if all(row.get(c) is not None for c in key_columns)]
+    existing = fetch_existing(conn, table, [tuple(row[c] for c in key_columns) for row in keyed])
+
+    inserts, updates = {}, {}
+    for row in rows:
+        key = tuple(row.get(c) for c in key_columns)
+        current = existing.get(key)
+        if current is None:
+            columns = tuple(c for c in spec['columns'] if c in row)
+            inserts.setdefault(columns, []).append(tuple(row[c] for c in columns))
+            if None not in key:
+                # a repeat of this key later in the batch becomes an update
+                existing[key] = dict(row)
+            continue
+        changed = tuple(c for c in spec['columns'] if c in row and c not in key_columns
+                        and not same_value(row[c], current[c]))
+        if not changed:
+            counts['unchanged'] += 1
+            continue
+        updates.setdefault(changed, []).append(tuple(row[c] for c in changed) + key)
+        # later rows for the same key in this batch compare against this one
+        current.update(row)
+
+    # rows are grouped by their column set so each group is one executemany
+    for columns, params in inserts.items():
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", params)
+        counts['inserted'] += len(params)
+    for columns, params in updates.items():
+        assignments = ', '.join(f"{c} = ?" for c in columns)
+        if table == 'menu_items':
+            assignments += ', updated_at = CURRENT_TIMESTAMP'
+        conn.executemany(
+            f"UPDATE {table} SET {assignments} WHERE {' AND '.join(f'{c} = ?' for c in key_columns)}", params)
+        counts['updated'] += len(params)
+
+
+def import_records(db_path, records, dry_run=False):
+    """Load records in a single transaction; returns {table: {inserted, updated, unchanged}}."""
+    counts = {table: {'inserted': 0, 'updated': 0, 'unchanged': 0} for table in TABLE_ORDER}
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table, rows in batched(normalize(records)):
+                upsert_batch(conn, table, rows, counts[table])
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("ROLLBACK" if dry_run else "COMMIT")
+    finally:
+        conn.close()
+    return counts
+
+
+def print_counts(counts, verb):
+    for table, table_counts in counts.items():
+        if isinstance(table_counts, dict):
+            if any(table_counts.values()):
+                print(f"  {table}: {table_counts['inserted']} inserted, "
+                      f"{table_counts['updated']} updated, {table_counts['unchanged']} unchanged")
+        else:
+            print(f"  {table}: {table_counts} {verb}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Bulk menu import/export")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="write the menu tables out")
+    export_parser.add_argument('target', help="directory for CSV files, or a .jsonl file ('-' for stdout)")
+    export_parser.add_argument('--tables', nargs='+', choices=TABLE_ORDER, default=list(TABLE_ORDER))
+
+    import_parser = subparsers.add_parser('import', help="upsert menu rows from an export")
+    import_parser.add_argument('source', help="CSV directory, <table>.csv, or a .jsonl file ('-' for stdin)")
+    import_parser.add_argument('--dry-run', action='store_true', help="report counts, then roll back")
+    args = parser.parse_args()
+
+    db = MenuDatabase()
+
+    if args.command == 'export':
+        tables = [table for table in TABLE_ORDER if table in args.tables]
+        with sqlite3.connect(db.db_path) as conn:
+            if args.target == '-':
+                export_jsonl(conn, sys.stdout, tables)
+                return 0
+            if args.target.endswith('.jsonl'):
+                with open(args.target, 'w', encoding='utf-8') as f:
+                    counts = export_jsonl(conn, f, tables)
+            else:
+                counts = export_csv(conn, args.target, tables)
+        print(f"Exported to {args.target}:")
+        print_counts(counts, 'rows')
+        return 0
+
+    try:
+        counts = import_records(db.db_path, read_source(args.source), dry_run=args.dry_run)
+    except (MenuImportError, json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Import failed, nothing was written: {e}")
+        return 1
+    if counts['menu_sets']['inserted'] and not args.dry_run:
+        # Filling a fresh database: the set-menu choices are seeded once the sets exist
+        db.seed_set_choices()
+    # Bumps the shared menu version, so app workers pick the changes up
+    # within MENU_VERSION_CHECK_INTERVAL (MENU_CACHE_TTL with SHARED_CACHE=0)
+    db.invalidate_menu_cache()
+    print(f"{'Dry run of' if args.dry_run else 'Imported'} {args.source}:")
+    print_counts(counts, 'rows')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Offline support for the menu and cart pages.
+
+init_offline(app) adds /sw.js, the service worker, rendered from
+templates/sw.js with the list of hashed assets to precache (see
+static_assets.py). The list comes from the JS, the full stylesheet and the
+built CSS bundles. The cache name is derived from the list, so a new deploy
+replaces the old cache.
+
+The service worker also keeps each location's menu snapshot
+(/api/menu/<location>/snapshot). It revalidates the snapshot with its ETag,
+so the snapshot is only downloaded again after the menu changes.
+"""
+
+import hashlib
+
+from flask import make_response, render_template, url_for
+
+from css_bundles import load_manifest
+from static_assets import asset_url
+
+# Static files every page needs, precached by the service worker
+PRECACHE_ASSETS = ('css/style.css', 'js/index.js', 'js/cart.js')
+SERVICE_WORKER_TEMPLATE = 'sw.js'
+
+
+def precache_urls(app) -> list:
+    """Hashed URLs of the shared assets and every built CSS bundle."""
+    urls = [asset_url(filename) for filename in PRECACHE_ASSETS]
+    for info in load_manifest(app.static_folder)['pages'].values():
+        url = url_for('static', filename=info['css'], v=info['hash'])
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def init_offline(app):
+    """Register the /sw.js route."""
+
+    def service_worker():
+        urls = precache_urls(app)
+        version = hashlib.sha1('\n'.join(urls).encode('utf-8')).hexdigest()[:12]
+        response = make_response(render_template(
+            SERVICE_WORKER_TEMPLATE, precache_urls=urls, version=version))
+        response.mimetype = 'application/javascript'
+        # Browsers compare the worker byte for byte on each visit; never serve a stale one
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    app.add_url_rule('/sw.js', 'service_worker', service_worker)
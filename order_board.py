@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+In-memory board of the orders staff are working on.
+
+The staff and admin order screens only ever show 'new' and 'pending' orders
+and auto-refresh all day. OrderBoard holds those orders in memory, grouped by
+location and status, so a refresh does not query every order shard and decode
+the JSON of each order. MenuDatabase loads it once from the database and
+updates it synchronously after each order write commits. Before serving, it
+compares the order files' PRAGMA data_version with the one the board was
+loaded at, and reloads if anything (e.g. the async order server) committed
+since.
+"""
+
+import threading
+import time
+
+# Statuses shown on the order screens; orders leave the board on any other status
+BOARD_STATUSES = ('new', 'pending')
+# Column key holding a status across all locations
+ALL_LOCATIONS = None
+
+
+class OrderBoard:
+    def __init__(self, statuses=BOARD_STATUSES):
+        self.statuses = statuses
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.version = None
+        self.orders_by_number = {}
+        # (location, status) -> {order_number: order}; location None is every location
+        self.columns = {}
+        # (location, status) -> orders newest first, until the column changes
+        self.views = {}
+        self.hits = 0
+        self.reloads = 0
+
+    def tracks(self, status: str) -> bool:
+        return status in self.statuses
+
+    def refresh(self, loader, current_version):
+        """Reload from loader() (orders with a board status) unless loaded at current_version().
+
+        Runs under the lock, so a write that commits while the loader reads
+        is applied after the reload rather than lost to it.
+        """
+        with self.lock:
+            version = current_version()
+            if self.loaded_at is not None and version == self.version:
+                return
+            self.version = version
+            self.orders_by_number = {}
+            self.columns = {}
+            self.views = {}
+            for order in loader():
+                self._add(order)
+            self.loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def put(self, order: dict):
+        """Add or replace an order; an order whose status is not on the board is dropped."""
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            self._remove(order['order_number'])
+            if self.tracks(order['status']):
+                self._add(order)
+
+    def set_status(self, order_number: str, status: str) -> bool:
+        """Move an order to status; returns False if it was not on the board."""
+        with self.lock:
+            order = self._remove(order_number)
+            if order is None:
+                return False
+            if self.tracks(status):
+                self._add(dict(order, status=status))
+            return True
+
+    def get(self, order_number: str):
+        with self.lock:
+            return self.orders_by_number.get(order_number)
+
+    def orders(self, status: str, location: str = ALL_LOCATIONS) -> list:
+        """Orders with a board status, newest first. Callers must not modify them."""
+        key = (location, status)
+        with self.lock:
+            self.hits += 1
+            view = self.views.get(key)
+            if view is None:
+                view = self.views[key] = sorted(
+                    self.columns.get(key, {}).values(),
+                    key=lambda order: (order['created_at'] or '', order['order_number']), reverse=True)
+            return list(view)
+
+    def stats(self):
+        """Return board counters."""
+        with self.lock:
+            return {
+                'orders': len(self.orders_by_number),
+                'columns': {f"{location or 'all'}/{status}": len(column)
+                            for (location, status), column in self.columns.items() if column},
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'age_seconds': round(time.monotonic() - self.loaded_at, 1) if self.loaded_at else None,
+            }
+
+    def _add(self, order: dict):
+        self.orders_by_number[order['order_number']] = order
+        for key in ((order['restaurant_location'], order['status']), (ALL_LOCATIONS, order['status'])):
+            self.columns.setdefault(key, {})[order['order_number']] = order
+            self.views.pop(key, None)
+
+    def _remove(self, order_number: str):
+        order = self.orders_by_number.pop(order_number, None)
+        if order is not None:
+            for key in ((order['restaurant_location'], order['status']), (ALL_LOCATIONS, order['status'])):
+                self.columns[key].pop(order_number, None)
+                self.views.pop(key, None)
+        return order
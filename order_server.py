@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Asyncio server for the order endpoints.
+
+The Flask app gives every request a thread for its whole life, so slow
+SQLite writes, QR renders and clients waiting on an order's status each hold
+one. This server handles the order endpoints on one event loop instead:
+
+    POST /api/create-order
+    POST /admin/order/<order_number>/accept
+    POST /admin/order/<order_number>/reject
+    GET  /api/order/<order_number>/status
+    GET  /api/order/<order_number>/events    (server-sent events)
+
+Database calls and QR rendering run on two small bounded thread pools, so the
+number of threads stays fixed however many requests and event streams are
+open. The order logic itself is the Flask app's (store_order,
+generate_qr_code, MenuDatabase), imported from app.py. Run it next to the
+Flask app and route those paths to it in nginx (with proxy_buffering off
+for the event streams):
+
+    python3 order_server.py --port 5301
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from urllib.parse import unquote, urlsplit
+
+import app as web
+from admission import LOOPBACK_ADDRESSES, admission
+
+ORDER_SERVER_PORT = int(os.environ.get('ORDER_SERVER_PORT', '5301'))
+# Threads for MenuDatabase calls; group commit batches whatever they submit together
+DB_WORKERS = int(os.environ.get('ORDER_SERVER_DB_WORKERS', '16'))
+# Threads for QR rendering (PIL, CPU bound)
+QR_WORKERS = int(os.environ.get('ORDER_SERVER_QR_WORKERS', '2'))
+# Calls waiting for a pool thread; past this, callers wait on the event loop
+MAX_PENDING_CALLS = 256
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 256 * 1024
+# Idle seconds before a keep-alive connection is closed
+KEEP_ALIVE_TIMEOUT = 30
+# Event streams re-read the status this often, to see changes made by other processes
+EVENTS_POLL_SECONDS = 5
+EVENTS_MAX_SECONDS = 30 * 60
+FINAL_STATUSES = ('completed', 'rejected')
+
+
+class BoundedExecutor:
+    """A fixed thread pool that caps how many calls may wait for it."""
+
+    def __init__(self, name: str, max_workers: int, max_pending: int = MAX_PENDING_CALLS):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.slots = asyncio.Semaphore(max_pending)
+
+    async def run(self, fn, *args):
+        async with self.slots:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class Request:
+    def __init__(self, method, target, headers, body, peer):
+        url = urlsplit(target)
+        self.method = method
+        self.path = unquote(url.path)
+        self.headers = headers
+        self.body = body
+        self.peer = peer
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError:
+            return None
+
+    def client_address(self):
+        """Same rule as admission.client_address: trust X-Forwarded-For only from the local proxy."""
+        forwarded = self.headers.get('x-forwarded-for')
+        if forwarded and self.peer in LOOPBACK_ADDRESSES:
+            return forwarded.split(',')[-1].strip()
+        return self.peer or 'unknown'
+
+    def session_location(self):
+        """current_restaurant from the Flask session cookie, as the Flask view reads it."""
+        serializer = web.app.session_interface.get_signing_serializer(web.app)
+        cookie = SimpleCookie(self.headers.get('cookie', '')).get(web.app.config['SESSION_COOKIE_NAME'])
+        if serializer and cookie:
+            try:
+                max_age = int(web.app.permanent_session_lifetime.total_seconds())
+                return serializer.loads(cookie.value, max_age=max_age).get('current_restaurant', 'unknown')
+            except Exception:
+                pass
+        return 'unknown'
+
+
+def response(status, body=None, headers=None):
+    """Encode a JSON response."""
+    payload = json.dumps(body if body is not None else {}).encode('utf-8')
+    return status, payload, dict({'Content-Type': 'application/json'}, **(headers or {}))
+
+
+class OrderServer:
+    def __init__(self):
+        self.db_pool = None
+        self.qr_pool = None
+        # order_number -> events set when this process changes the order's status
+        self.watchers = {}
+        self.routes = [
+            ('POST', re.compile(r'^/api/create-order$'), self.create_order),
+            ('POST', re.compile(r'^/admin/order/(?P<order_number>[^/]+)/accept$'), self.accept_order),
+            ('POST', re.compile(r'^/admin/order/(?P<order_number>[^/]+)/reject$'), self.reject_order),
+            ('GET', re.compile(r'^/api/order/(?P<order_number>[^/]+)/status$'), self.order_status),
+            ('GET', re.compile(r'^/api/order/(?P<order_number>[^/]+)/events$'), self.order_events),
+        ]
+
+    async def start(self, host: str, port: int):
+        self.db_pool = BoundedExecutor('order-db', DB_WORKERS)
+        self.qr_pool = BoundedExecutor('order-qr', QR_WORKERS)
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        print(f"Order server listening on {host}:{port} "
+              f"({DB_WORKERS} database threads, {QR_WORKERS} QR threads)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.db_pool.shutdown()
+            self.qr_pool.shutdown()
+
+    # Endpoints
+
+    async def create_order(self, request):
+        client = request.client_address()
+        retry_after = admission.admit('create_order', client)
+        if retry_after is not None:
+            retry_after = max(1, math.ceil(retry_after))
+            return response(429, {'error': 'Too many requests, please retry shortly', 'retry_after': retry_after},
+                            {'Retry-After': str(retry_after)})
+        try:
+            body, status = await self.db_pool.run(
+                web.store_order, request.json(), request.headers.get('idempotency-key'),
+                request.session_location())
+            if status == 200:
+                body['qr_code_url'] = await self.qr_pool.run(
+                    web.generate_qr_code, body['order_number'], body['restaurant_location'])
+            return response(status, body)
+        except Exception as e:
+            return response(500, {'error': str(e)})
+        finally:
+            admission.release()
+
+    async def accept_order(self, request, order_number):
+        await self.set_status(order_number, 'pending')
+        return response(200, {'success': True, 'message': 'Order accepted'})
+
+    async def reject_order(self, request, order_number):
+        await self.set_status(order_number, 'rejected')
+        return response(200, {'success': True, 'message': 'Order rejected'})
+
+    async def set_status(self, order_number, status):
+        await self.db_pool.run(web.db.update_order_status, order_number, status)
+        for event in self.watchers.get(order_number, ()):
+            event.set()
+
+    async def order_status(self, request, order_number):
+        status = await self.db_pool.run(web.db.get_order_status, order_number)
+        if status is None:
+            return response(404, {'error': 'Order not found'})
+        return response(200, {'order_number': order_number, 'status': status})
+
+    async def order_events(self, request, order_number, writer):
+        """Stream the order's status until it is final; wakes at once for changes made here."""
+        status = await self.db_pool.run(web.db.get_order_status, order_number)
+        if status is None:
+            return response(404, {'error': 'Order not found'})
+
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'X-Accel-Buffering: no\r\nConnection: close\r\n\r\n'
+                     + f'retry: {EVENTS_POLL_SECONDS * 1000}\n\n'.encode('ascii'))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + EVENTS_MAX_SECONDS
+        changed = asyncio.Event()
+        self.watchers.setdefault(order_number, set()).add(changed)
+        sent = None
+        try:
+            while True:
+                if status != sent:
+                    data = json.dumps({'order_number': order_number, 'status': status})
+                    writer.write(f'event: status\ndata: {data}\n\n'.encode('utf-8'))
+                    sent = status
+                else:
+                    # Comment line: keeps proxies from timing out and detects closed clients
+                    writer.write(b': keep-alive\n\n')
+                await writer.drain()
+                if status in FINAL_STATUSES or status is None or loop.time() >= deadline:
+                    return None
+                changed.clear()
+                try:
+                    await asyncio.wait_for(changed.wait(), EVENTS_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                status = await self.db_pool.run(web.db.get_order_status, order_number)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # The 200 head is already out, so the error goes to the client as an event
+            print(f"ERROR in order_events for {order_number}: {e}")
+            import traceback
+            traceback.print_exc()
+            data = json.dumps({'order_number': order_number, 'error': str(e)})
+            writer.write(f'event: error\ndata: {data}\n\n'.encode('utf-8'))
+            await writer.drain()
+            return None
+        finally:
+            watchers = self.watchers.get(order_number)
+            watchers.discard(changed)
+            if not watchers:
+                del self.watchers[order_number]
+
+    # HTTP/1.1
+
+    async def handle_connection(self, reader, writer):
+        peer = (writer.get_extra_info('peername') or ('',))[0]
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, *response(431, {'error': 'Request headers too large'}), keep_alive=False)
+                    return
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self.send(writer, *response(400, {'error': 'Bad request'}), keep_alive=False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                if 'chunked' in headers.get('transfer-encoding', '').lower():
+                    await self.send(writer, *response(411, {'error': 'Content-Length required'}), keep_alive=False)
+                    return
+                try:
+                    length = int(headers.get('content-length', '0'))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    await self.send(writer, *response(413, {'error': 'Request body too large'}), keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              if version == 'HTTP/1.1' else headers.get('connection', '').lower() == 'keep-alive')
+                request = Request(method, target, headers, body, peer)
+                result = await self.dispatch(request, writer)
+                if result is None:
+                    # The handler streamed its own response and the connection ends with it
+                    return
+                await self.send(writer, *result, keep_alive=keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request, writer):
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            try:
+                if handler == self.order_events:
+                    return await handler(request, writer=writer, **match.groupdict())
+                return await handler(request, **match.groupdict())
+            except ConnectionError:
+                raise
+            except Exception as e:
+                print(f"ERROR in {request.method} {request.path}: {e}")
+                import traceback
+                traceback.print_exc()
+                return response(500, {'error': str(e)})
+        if allowed:
+            return response(405, {'error': 'Method not allowed'})
+        return response(404, {'error': 'Not found'})
+
+    async def send(self, writer, status, payload, headers, keep_alive=True):
+        head = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}',
+                f'Content-Length: {len(payload)}',
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Serve the order endpoints on an asyncio event loop")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=ORDER_SERVER_PORT)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(OrderServer().start(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
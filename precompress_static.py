@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Build step: write gzip-precompressed siblings for static text assets.
+
+Run after every deploy (emergency_restart.sh does this). Files that are
+already up to date, or that do not get smaller, are skipped.
+"""
+
+import gzip
+import os
+import sys
+
+STATIC_DIR = "static"
+TEXT_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.webmanifest')
+# Tiny files gain nothing from compression
+MIN_SIZE = 500
+
+
+def precompress_file(path):
+    """Write path + '.gz' if it is stale or missing. Returns (original, compressed) sizes or None."""
+    gz_path = path + '.gz'
+    if os.path.exists(gz_path) and os.path.getmtime(gz_path) >= os.path.getmtime(path):
+        return None
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < MIN_SIZE:
+        return None
+
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) >= len(data):
+        if os.path.exists(gz_path):
+            os.remove(gz_path)
+        return None
+
+    tmp_path = gz_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, gz_path)
+    return len(data), len(compressed)
+
+
+def precompress_static(static_dir=STATIC_DIR):
+    """Precompress every text asset under static_dir."""
+    written = 0
+    total_before = 0
+    total_after = 0
+
+    for root, _dirs, files in os.walk(static_dir):
+        for filename in sorted(files):
+            if not filename.lower().endswith(TEXT_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            sizes = precompress_file(path)
+            if sizes:
+                written += 1
+                total_before += sizes[0]
+                total_after += sizes[1]
+                print(f"  {path}: {sizes[0]:,} -> {sizes[1]:,} bytes")
+
+    print(f"Precompressed {written} files ({total_before:,} -> {total_after:,} bytes)")
+    return written
+
+
+def main():
+    """Main function"""
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR
+    precompress_static(static_dir)
+
+
+if __name__ == "__main__":
+    main()
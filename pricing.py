@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Server-side cart pricing.
+
+PriceIndex holds every sellable price in plain dicts: base and portion
+prices of menu items, per-location overrides from restaurant_menus, and set
+menu prices. MenuDatabase.get_price_index() builds it through the menu cache,
+so menu writes rebuild it, and pricing a cart is one dict lookup per line.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+PORTION_PRICE_KEYS = {'2p': 'price_2p', '4p': 'price_4p'}
+# Largest quantity accepted on a single cart line
+MAX_LINE_QUANTITY = 50
+
+
+class PriceIndex:
+    def __init__(self):
+        # menu item id -> {'price': int, 'price_2p': int|None, 'price_4p': int|None}
+        self.items = {}
+        # (location, menu item id) -> location price override
+        self.location_prices = {}
+        # set menu id -> price
+        self.sets = {}
+
+    def line_price(self, line: Dict, location: str) -> Optional[int]:
+        """Unit price of one cart line, or None if it names nothing on the menu."""
+        try:
+            item_id = int(line.get('id'))
+        except (TypeError, ValueError):
+            return None
+
+        if line.get('type') == 'set_menu':
+            return self.sets.get(item_id)
+
+        prices = self.items.get(item_id)
+        if prices is None:
+            return None
+        portion = line.get('portion')
+        if portion:
+            key = PORTION_PRICE_KEYS.get(portion)
+            return prices[key] if key else None
+        return self.location_prices.get((location, item_id)) or prices['price']
+
+    def price_cart(self, lines: List[Dict], location: str) -> Tuple[int, List[str], List[Optional[int]]]:
+        """Return (total, problems, unit prices) for a cart.
+
+        A line the index cannot price is listed in problems and counted at
+        the client's price, so the order still goes through but is flagged.
+        unit prices holds what each line was charged, None for lines left
+        out of the total.
+        """
+        total = 0
+        problems = []
+        unit_prices = []
+        for position, line in enumerate(lines):
+            unit_prices.append(None)
+            if not isinstance(line, dict):
+                problems.append(f"line {position + 1}: not an item")
+                continue
+            try:
+                quantity = int(line.get('quantity') or 1)
+            except (TypeError, ValueError):
+                quantity = 0
+            if not 1 <= quantity <= MAX_LINE_QUANTITY:
+                problems.append(f"line {position + 1}: bad quantity {line.get('quantity')!r}")
+                continue
+            price = self.line_price(line, location)
+            if price is None:
+                problems.append(f"line {position + 1}: unknown {line.get('type', 'item')} {line.get('id')!r}")
+                try:
+                    price = max(int(line.get('price') or 0), 0)
+                except (TypeError, ValueError):
+                    continue
+            unit_prices[-1] = price
+            total += price * quantity
+        return total, problems, unit_prices
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Table reservations.
+
+Reservations are stored in the menu database. Each (location, day, time slot)
+that has been booked gets one row in reservation_slots, which counts the seats
+booked against the slot's capacity:
+
+    reservation_slots   location x day x slot   -> capacity, booked
+
+MenuDatabase.create_reservation books the seats and stores the reservation in
+one write transaction. Two groups can therefore never both take a slot's last
+seats. Availability is read from the counters alone. This module holds the
+slot constants and the form checks.
+"""
+
+import os
+from datetime import date, datetime
+
+# Time slots the reservation forms offer, local time
+RESERVATION_SLOTS = ('11:00', '11:30', '12:00', '12:30', '13:00', '13:30', '14:00',
+                     '17:00', '17:30', '18:00', '18:30', '19:00', '19:30', '20:00')
+# Seats per slot unless staff set the slot's own capacity (0 closes it)
+RESERVATION_SLOT_CAPACITY = int(os.environ.get('RESERVATION_SLOT_CAPACITY', '60'))
+# Largest party the forms accept, drivers and guides not included
+RESERVATION_MAX_GUESTS = 50
+# Availability queries cover at most this many days
+AVAILABILITY_MAX_DAYS = 31
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class InvalidReservation(ValueError):
+    """A reservation form had a bad date, time or guest count."""
+
+
+class SlotFull(ValueError):
+    """A reservation asked for more seats than its slot has left."""
+
+    def __init__(self, available: int):
+        super().__init__(f"Only {available} seats are left at that time" if available
+                         else "That time is fully booked")
+        self.available = available
+
+
+def parse_day(value: str) -> date:
+    """Parse a YYYY-MM-DD date or raise InvalidReservation."""
+    try:
+        return datetime.strptime(value or '', DATE_FORMAT).date()
+    except ValueError:
+        raise InvalidReservation('Dates must be YYYY-MM-DD')
+
+
+def _count(value, maximum: int) -> int:
+    try:
+        count = int(value or 0)
+    except (TypeError, ValueError):
+        raise InvalidReservation('Please enter a valid number of guests')
+    if count < 0 or count > maximum:
+        raise InvalidReservation('Please enter a valid number of guests')
+    return count
+
+
+def reservation_seats(form) -> int:
+    """Seats a reservation form needs: its guests plus drivers and guides eating with them."""
+    seats = _count(form.get('guest_count'), RESERVATION_MAX_GUESTS)
+    if seats < 1:
+        raise InvalidReservation('Please enter a valid number of guests')
+    for count_field, meals_field in (('driver_count', 'driver_meals'), ('guide_count', 'guide_meals')):
+        if form.get(meals_field) == 'included':
+            seats += _count(form.get(count_field), RESERVATION_MAX_GUESTS)
+    return seats
+
+
+def check_slot(day: str, slot: str, today: date = None) -> str:
+    """Validate a reservation's date and time slot; returns the normalized date."""
+    reservation_day = parse_day(day)
+    if reservation_day < (today or date.today()):
+        raise InvalidReservation('Reservations cannot be made for past dates')
+    if slot not in RESERVATION_SLOTS:
+        raise InvalidReservation('Please choose one of the listed reservation times')
+    return reservation_day.strftime(DATE_FORMAT)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Sales rollups.
+
+Completed orders are folded into two summary tables as they complete:
+
+    sales_daily_items   day x location x item   -> quantity, revenue
+    sales_hourly        day x hour x location   -> orders, revenue
+
+so reports read a few hundred summary rows instead of decoding the items
+JSON of every order. MenuDatabase.update_order_status maintains them; this
+module holds the bucketing helpers and a CLI to rebuild them from history.
+
+    python3 sales.py rebuild
+    python3 sales.py report --from 2025-10-01 --to 2025-10-31 --location nikko
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+
+# Restaurants are in Japan; order timestamps are stored in UTC
+SALES_UTC_OFFSET_HOURS = 9
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def sales_bucket(completed_at: str):
+    """Return the local (day, hour) an order completed at."""
+    local = datetime.strptime(completed_at[:19], TIMESTAMP_FORMAT) + timedelta(hours=SALES_UTC_OFFSET_HOURS)
+    return local.strftime('%Y-%m-%d'), local.hour
+
+
+def order_item_rows(items):
+    """Yield (item_type, item_id, name, quantity, revenue) for each line of an order.
+
+    Revenue is counted at the price each line was charged (charged_price);
+    lines left out of the order's total are skipped. Orders stored before
+    lines carried it fall back to the price the cart showed.
+    """
+    for line in items:
+        if not isinstance(line, dict) or line.get('id') in (None, ''):
+            continue
+        if 'charged_price' in line and line['charged_price'] is None:
+            continue
+        try:
+            quantity = max(int(line.get('quantity') or 1), 1)
+        except (TypeError, ValueError):
+            quantity = 1
+        try:
+            unit_price = int(line.get('charged_price', line.get('price')) or 0)
+        except (TypeError, ValueError):
+            unit_price = 0
+        item_type = line.get('type') or 'menu_item'
+        name = line.get('name_en') or line.get('name') or ''
+        yield item_type, str(line['id']), name, quantity, unit_price * quantity
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Maintain and query the sales rollup tables")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help="recompute the rollups from all completed orders")
+    report_parser = subparsers.add_parser('report', help="print a report from the rollups")
+    report_parser.add_argument('--from', dest='start_day', required=True, help="first day, YYYY-MM-DD")
+    report_parser.add_argument('--to', dest='end_day', help="last day (defaults to --from)")
+    report_parser.add_argument('--location', help="okinawa, nikko or fuji (default: all)")
+    args = parser.parse_args()
+
+    # Imported here: database.py imports this module for the helpers above
+    from database import MenuDatabase
+    db = MenuDatabase()
+
+    if args.command == 'rebuild':
+        orders, item_rows, hour_rows = db.rebuild_sales_rollups()
+        print(f"Rebuilt rollups from {orders} completed orders: "
+              f"{item_rows} day/item rows, {hour_rows} hourly rows")
+        return 0
+
+    report = db.get_sales_report(args.start_day, args.end_day or args.start_day, args.location)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
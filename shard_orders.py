@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Split the orders table into per-location order shards.
+
+Orders for okinawa, nikko and fuji are moved from taj_menu.db into
+taj_menu_orders_<location>.db in batches, one transaction per batch, and the
+sales rollups are rebuilt so each file covers its own orders. Orders from
+other locations stay in taj_menu.db. MenuDatabase reads every shard plus
+taj_menu.db, so the site keeps working before, during and after a run:
+
+    python3 shard_orders.py --dry-run
+    python3 shard_orders.py
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from database import MenuDatabase
+
+BATCH_SIZE = int(os.environ.get("ORDER_SHARD_BATCH", "500"))
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Move orders into their location's order shard")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="orders moved per transaction")
+    parser.add_argument('--dry-run', action='store_true', help="only count what would be moved")
+    args = parser.parse_args()
+
+    db = MenuDatabase()
+    if not db.order_shards:
+        print("Order sharding is disabled (ORDER_SHARDING=0)")
+        return 1
+
+    try:
+        moved = db.split_orders(batch_size=args.batch_size, dry_run=args.dry_run)
+    except sqlite3.IntegrityError as e:
+        print(f"Splitting stopped, an order is already in its shard: {e}")
+        return 1
+    for location, count in moved.items():
+        verb = "would be moved" if args.dry_run else "moved"
+        print(f"{location}: {count} orders {verb} to {db.order_shards[location]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Cache shared by every worker process on a host.
+
+Each worker used to build its own copy of the menu reads and the gzipped
+page bodies. After every menu change, each worker then queried the database
+and compressed the pages again. SharedCache keeps those values in one local
+SQLite file that all workers read. The file uses WAL mode and memory-maps up
+to SHARED_CACHE_MMAP_BYTES, so reads do not block on writes.
+
+- Versions: entries belong to a namespace ('menu', 'gzip') and are stored
+  with the namespace's current version. bump(namespace) moves every worker
+  to a new version at once and drops the old entries. Invalidation
+  therefore reaches all workers, not only the one that wrote.
+- Eviction: entries expire after their TTL. When the file holds more than
+  max_bytes of values, the least recently used entries are dropped.
+  last_used is only rewritten every TOUCH_INTERVAL seconds, so most reads
+  do not write.
+- Stats: every worker counts its hits and misses per namespace and flushes
+  them to the cache_workers table every STATS_FLUSH_INTERVAL seconds.
+  stats() then reports every worker on the host.
+
+It is a cache: a locked or broken file counts as a miss and is never an
+error for the caller.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# Values kept before least-recently-used entries are evicted
+SHARED_CACHE_MAX_BYTES = int(os.environ.get('SHARED_CACHE_MAX_MB', '64')) * 1024 * 1024
+# Eviction trims the file to this share of max_bytes
+EVICT_TARGET = 0.9
+EVICT_CHUNK = 64
+SHARED_CACHE_MMAP_BYTES = 256 * 1024 * 1024
+# Seconds between last_used updates of an entry
+TOUCH_INTERVAL = 10
+# Seconds between flushes of this worker's counters to the file
+STATS_FLUSH_INTERVAL = 10
+# Workers that have not flushed for this long are dropped from the stats
+STALE_WORKER_SECONDS = 24 * 3600
+# A busy cache is a miss; do not wait long for it
+BUSY_TIMEOUT_MS = 100
+
+
+class SharedCache:
+    def __init__(self, path: str, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        # namespace -> [hits, misses, puts, evictions] since the last flush
+        self._pending = {}
+        # namespace -> [hits, misses, puts, evictions] for this process
+        self.counters = {}
+        self.errors = 0
+        self._flushed_at = time.monotonic()
+        self._init_file()
+
+    def _init_file(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            # One transaction, so a worker starting alongside cannot see the
+            # triggers without the total they maintain
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_last_used ON cache_entries(last_used)')
+            # Total size of cache_entries, kept by the triggers below
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    bytes INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(size), 0) FROM cache_entries')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS cache_entries_size_insert AFTER INSERT ON cache_entries
+                BEGIN UPDATE cache_size SET bytes = bytes + NEW.size WHERE id = 0; END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS cache_entries_size_delete AFTER DELETE ON cache_entries
+                BEGIN UPDATE cache_size SET bytes = bytes - OLD.size WHERE id = 0; END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS cache_entries_size_update AFTER UPDATE OF size ON cache_entries
+                BEGIN UPDATE cache_size SET bytes = bytes + NEW.size - OLD.size WHERE id = 0; END
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    namespace TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_workers (
+                    pid INTEGER NOT NULL,
+                    namespace TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0,
+                    puts INTEGER NOT NULL DEFAULT 0,
+                    evictions INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (pid, namespace)
+                )
+            ''')
+            conn.commit()
+
+    def _conn(self):
+        """This thread's connection; reopened after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+            conn.execute(f'PRAGMA mmap_size = {SHARED_CACHE_MMAP_BYTES}')
+            # Losing the newest entries in a power cut is fine for a cache
+            conn.execute('PRAGMA synchronous = OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, namespace: str, index: int, amount: int = 1):
+        with self._stats_lock:
+            for counters in (self._pending, self.counters):
+                counters.setdefault(namespace, [0, 0, 0, 0])[index] += amount
+
+    def version(self, namespace: str) -> int:
+        """Current version of a namespace; 0 until it is first bumped."""
+        try:
+            row = self._conn().execute(
+                'SELECT version FROM cache_versions WHERE namespace = ?', (namespace,)).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return 0
+        return row[0] if row else 0
+
+    def bump(self, namespace: str) -> int:
+        """Start a new version of a namespace in every worker and drop the old entries."""
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('''
+                    INSERT INTO cache_versions (namespace, version) VALUES (?, 1)
+                    ON CONFLICT (namespace) DO UPDATE SET version = version + 1
+                ''', (namespace,))
+                version = conn.execute(
+                    'SELECT version FROM cache_versions WHERE namespace = ?', (namespace,)).fetchone()[0]
+                conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND version < ?', (namespace, version))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Shared cache bump of {namespace} failed: {e}")
+            return 0
+        return version
+
+    def get(self, namespace: str, key: str, version: int = 0):
+        """Cached value of key at version, or None on a miss."""
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute('''
+                SELECT value, expires_at, last_used FROM cache_entries
+                WHERE namespace = ? AND key = ? AND version = ?
+            ''', (namespace, key, version)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self._count(namespace, 1)
+                return None
+            value = pickle.loads(row[0])
+            if now - row[2] >= TOUCH_INTERVAL:
+                conn.execute('UPDATE cache_entries SET last_used = ? WHERE namespace = ? AND key = ?',
+                             (now, namespace, key))
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            self.errors += 1
+            self._count(namespace, 1)
+            return None
+        self._count(namespace, 0)
+        self._maybe_flush_stats()
+        return value
+
+    def put(self, namespace: str, key: str, value, version: int = 0, ttl: float = None):
+        """Store a value under key at version; values over max_bytes are not stored."""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            # An upsert rather than INSERT OR REPLACE: REPLACE deletes without
+            # firing the delete trigger, which would leave cache_size too high
+            conn.execute('''
+                INSERT INTO cache_entries
+                    (namespace, key, version, value, size, expires_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE SET
+                    version = excluded.version, value = excluded.value, size = excluded.size,
+                    expires_at = excluded.expires_at, last_used = excluded.last_used
+            ''', (namespace, key, version, blob, len(blob), now + ttl if ttl else None, now))
+            self._count(namespace, 2)
+            self._evict(conn, now)
+        except sqlite3.Error:
+            self.errors += 1
+        self._maybe_flush_stats()
+
+    def _evict(self, conn, now: float):
+        """Drop expired entries, then least recently used ones, once the file is over max_bytes."""
+        total = self._total(conn)
+        if total <= self.max_bytes:
+            return
+        for namespace, expired in conn.execute('''
+            SELECT namespace, COUNT(*) FROM cache_entries WHERE expires_at <= ? GROUP BY namespace
+        ''', (now,)).fetchall():
+            self._count(namespace, 3, expired)
+        conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+        total = self._total(conn)
+        target = self.max_bytes * EVICT_TARGET
+        while total > target:
+            rows = conn.execute('SELECT namespace, key, size FROM cache_entries ORDER BY last_used LIMIT ?',
+                                (EVICT_CHUNK,)).fetchall()
+            if not rows:
+                break
+            for namespace, key, size in rows:
+                conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (namespace, key))
+                self._count(namespace, 3)
+                total -= size
+                if total <= target:
+                    break
+
+    def _total(self, conn) -> int:
+        return conn.execute('SELECT bytes FROM cache_size WHERE id = 0').fetchone()[0]
+
+    def _maybe_flush_stats(self, force: bool = False):
+        now = time.monotonic()
+        with self._stats_lock:
+            if not force and now - self._flushed_at < STATS_FLUSH_INTERVAL:
+                return
+            pending, self._pending = self._pending, {}
+            self._flushed_at = now
+        if not pending:
+            return
+        try:
+            conn = self._conn()
+            wall = time.time()
+            for namespace, (hits, misses, puts, evictions) in pending.items():
+                conn.execute('''
+                    INSERT INTO cache_workers (pid, namespace, hits, misses, puts, evictions, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (pid, namespace) DO UPDATE SET
+                        hits = hits + excluded.hits, misses = misses + excluded.misses,
+                        puts = puts + excluded.puts, evictions = evictions + excluded.evictions,
+                        updated_at = excluded.updated_at
+                ''', (os.getpid(), namespace, hits, misses, puts, evictions, wall))
+            conn.execute('DELETE FROM cache_workers WHERE updated_at < ?', (wall - STALE_WORKER_SECONDS,))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self):
+        """Return this worker's counters, every worker's flushed counters and the file's size."""
+        self._maybe_flush_stats(force=True)
+        with self._stats_lock:
+            worker = {namespace: dict(zip(('hits', 'misses', 'puts', 'evictions'), counts))
+                      for namespace, counts in self.counters.items()}
+        result = {'pid': os.getpid(), 'worker': worker, 'errors': self.errors, 'max_bytes': self.max_bytes}
+        try:
+            conn = self._conn()
+            entries = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+            size = self._total(conn)
+            workers = {}
+            for pid, namespace, hits, misses, puts, evictions in conn.execute('''
+                SELECT pid, namespace, hits, misses, puts, evictions FROM cache_workers ORDER BY pid, namespace
+            '''):
+                workers.setdefault(str(pid), {})[namespace] = {
+                    'hits': hits, 'misses': misses, 'puts': puts, 'evictions': evictions,
+                    'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+                }
+            result.update({'entries': entries, 'bytes': size, 'workers': workers})
+        except sqlite3.Error:
+            self.errors += 1
+        return result
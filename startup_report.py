@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Startup-time report for the Flask app.
+
+Runs `import app` in a fresh interpreter with -X importtime and prints the
+slowest top-level imports, then starts another interpreter that imports the
+app and serves one request through the test client to measure time to first
+request. --json writes the numbers for tracking, and --max-seconds turns the
+report into a regression check.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TOP_IMPORTS = 15
+FIRST_REQUEST_PATH = '/'
+
+# Run in the child: import the app, serve one request, report both timings
+FIRST_REQUEST_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+print(json.dumps({'status': response.status_code,
+                  'import_seconds': imported - start,
+                  'first_request_seconds': served - imported}))
+"""
+
+
+def import_breakdown():
+    """Return [(module, self_us, cumulative_us)] for the modules `import app` loads directly."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=REPO_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # Children are listed before their parent, indented by two spaces per
+    # level; depth-1 lines just before the 'app' line are what app.py imports
+    pending = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = (name.strip(), int(self_us), int(cumulative_us))
+        if depth == 1:
+            pending.append(entry)
+        elif depth == 0:
+            if entry[0] == 'app':
+                return pending + [entry]
+            pending = []
+    return []
+
+
+def first_request():
+    """Time a cold interpreter from launch to its first served request."""
+    launched = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', FIRST_REQUEST_SCRIPT, FIRST_REQUEST_PATH],
+                            cwd=REPO_DIR, capture_output=True, text=True)
+    total = time.perf_counter() - launched
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['total_seconds'] = total
+    return timings
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Report app import time and time to first request")
+    parser.add_argument('--json', help="write the report to this file")
+    parser.add_argument('--max-seconds', type=float,
+                        help="exit non-zero if launch to first request takes longer than this")
+    args = parser.parse_args()
+
+    modules = import_breakdown()
+    timings = first_request()
+
+    app_total = next((cumulative for name, _self, cumulative in modules if name == 'app'), 0)
+    print(f"import app: {app_total / 1000:.1f} ms cumulative")
+    print(f"{'module':<30} {'self ms':>9} {'total ms':>9}")
+    ranked = sorted((m for m in modules if m[0] != 'app'), key=lambda m: m[2], reverse=True)
+    for name, self_us, cumulative_us in ranked[:TOP_IMPORTS]:
+        print(f"{name:<30} {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}")
+    app_self = next((self_us for name, self_us, _c in modules if name == 'app'), 0)
+    print(f"{'(app.py module body)':<30} {app_self / 1000:>9.1f}")
+
+    print(f"\nimport app:      {timings['import_seconds'] * 1000:.1f} ms")
+    print(f"first request:   {timings['first_request_seconds'] * 1000:.1f} ms "
+          f"(GET {FIRST_REQUEST_PATH} -> {timings['status']})")
+    print(f"launch to first: {timings['total_seconds'] * 1000:.1f} ms")
+
+    if args.json:
+        report = {
+            'measured_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'imports': [{'module': name, 'self_us': s, 'cumulative_us': c} for name, s, c in modules],
+            **timings,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+    if args.max_seconds is not None and timings['total_seconds'] > args.max_seconds:
+        print(f"Startup regression: {timings['total_seconds']:.2f}s > {args.max_seconds:.2f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -142,6 +142,8 @@ class ShoppingCart {
 
         // Store current item data for modal use
         this.currentItem = itemData;
+        // Set menu choice groups come with the menu, so the modals need no fetch
+        this.currentChoices = JSON.parse(button.dataset.setChoices || '[]');
 
         // Check if item has multiple piece prices (items 4, 5, 6 specifically or any with both prices)
         if (itemData.price2p && itemData.price4p) {
@@ -149,8 +151,7 @@ class ShoppingCart {
         }
         // Check if it's a set menu item that needs curry selection
         else if (itemData.type === 'set_menu') {
-            const excludedIds = ['2', '4', '5', '6', '7', '8', '9', '17', '18'];
-            if (!excludedIds.includes(itemData.id)) {
+            if (this.getCurryChoice()) {
                 this.showCurryModal(itemData);
             } else {
                 this.showDrinkModal(itemData);
@@ -275,54 +276,39 @@ class ShoppingCart {
         modal.classList.add('show');
     }
 
-    async showCurryModal(itemData, isSecondCurry = false) {
+    getCurryChoice() {
+        // The curry choice group of the set being added, if it has one
+        return (this.currentChoices || []).find(choice => choice.group === 'curry') || null;
+    }
+
+    showCurryModal(itemData, isSecondCurry = false) {
         const modal = document.getElementById('curry-modal');
         const itemNameEl = modal.querySelector('.modal-item-name');
         const curryList = document.getElementById('curry-options-list');
+        const curryChoice = this.getCurryChoice();
+        const picks = curryChoice ? curryChoice.picks : 1;
 
         // Update modal title based on whether this is first or second curry selection
         if (isSecondCurry) {
             itemNameEl.textContent = itemData.name + ' - Select Second Curry';
         } else {
-            itemNameEl.textContent = itemData.name + (itemData.id === '1' || itemData.id === '8' ? ' - Select First Curry' : '');
+            itemNameEl.textContent = itemData.name + (picks > 1 ? ' - Select First Curry' : '');
         }
 
-        // Get restaurant location from the page
-        const menuElement = document.querySelector('.detailed-menu');
-        const location = menuElement ? menuElement.getAttribute('data-restaurant-location') : 'okinawa';
-        
-        // Determine curry categories based on location
-        // Nikko & Fuji: category 11 (Curry)
-        // Okinawa: category 17 (Indian Curries)
-        const categories = (location === 'nikko' || location === 'fuji') ? '11' : '17';
-
-        // Fetch curry items from appropriate categories
-        try {
-            const response = await fetch(`/api/menu-items?categories=${categories}`);
-            const data = await response.json();
-
-            // Clear previous options
-            curryList.innerHTML = '';
-
-            // Check if we got a valid array
-            if (Array.isArray(data) && data.length > 0) {
-                // Add curry options (exclude Pulao - id 43, as it's rice not curry)
-                data.forEach(curry => {
-                    if (curry.id !== '43') {  // Skip Pulao
-                        const button = document.createElement('button');
-                        button.className = 'curry-option';
-                        button.dataset.curryId = curry.id;
-                        button.dataset.curryName = curry.name;
-                        button.textContent = curry.name;
-                        curryList.appendChild(button);
-                    }
-                });
-            } else {
-                curryList.innerHTML = '<p>No curry options available.</p>';
-            }
-        } catch (error) {
-            console.error('Error loading curry options:', error);
-            curryList.innerHTML = '<p>Error loading curry options. Please try again.</p>';
+        // Options are the curries this location serves, embedded in the menu page
+        curryList.innerHTML = '';
+        const options = curryChoice ? curryChoice.options : [];
+        if (options.length > 0) {
+            options.forEach(curry => {
+                const button = document.createElement('button');
+                button.className = 'curry-option';
+                button.dataset.curryId = curry.id;
+                button.dataset.curryName = curry.name_en;
+                button.textContent = curry.name_en;
+                curryList.appendChild(button);
+            });
+        } else {
+            curryList.innerHTML = '<p>No curry options available.</p>';
         }
 
         modal.classList.add('show');
@@ -349,8 +335,7 @@ class ShoppingCart {
         this.closeAllModals();
         
         if (itemData.type === 'set_menu') {
-            const excludedIds = ['2', '4', '5', '6', '7', '8', '9', '17', '18'];
-            if (!excludedIds.includes(itemData.id)) {
+            if (this.getCurryChoice()) {
                 this.currentItem = itemData; // Update current item with price selection
                 this.showCurryModal(itemData);
             } else {
@@ -375,9 +360,11 @@ class ShoppingCart {
         button.classList.add('selected');
 
         const itemData = { ...this.currentItem };
+        const curryChoice = this.getCurryChoice();
+        const needsTwoCurries = curryChoice && curryChoice.picks > 1;
         
-        // Check if this is the first curry selection for items that need 2 curries (id 1 and 8)
-        if ((itemData.id === '1' || itemData.id === '8') && !itemData.selectedCurry) {
+        // Check if this is the first curry selection for sets that need 2 curries
+        if (needsTwoCurries && !itemData.selectedCurry) {
             // This is the first curry
             itemData.selectedCurry = button.dataset.curryName;
             itemData.selectedCurryId = button.dataset.curryId;
@@ -388,7 +375,7 @@ class ShoppingCart {
             
             // Show curry modal again for second selection
             this.showCurryModal(itemData, true); // Pass true to indicate second selection
-        } else if ((itemData.id === '1' || itemData.id === '8') && itemData.selectedCurry) {
+        } else if (needsTwoCurries && itemData.selectedCurry) {
             // This is the second curry
             itemData.selectedCurry2 = button.dataset.curryName;
             itemData.selectedCurryId2 = button.dataset.curryId;
@@ -764,20 +751,20 @@ class ShoppingCart {
                 customer_info: {}
             };
 
-            // Send order to backend
-            const response = await fetch('/api/create-order', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(orderData)
+            // Send order to backend (retried on network errors with the same key);
+            // while offline the order waits here and is sent once the connection is back
+            const result = await this.submitOrder(orderData, () => {
+                if (checkoutBtn) {
+                    checkoutBtn.innerHTML = `<i class="fas fa-wifi"></i> ${isJapanese ? 'オフラインです。接続を待っています...' : 'Offline - waiting for connection...'}`;
+                }
             });
 
-            const result = await response.json();
-
             if (result.success) {
+                localStorage.removeItem('tajPendingOrder');
                 // Show QR code modal
-                this.showOrderQRModal(result.order_number, result.qr_code_url, total);
+                // The server re-prices the cart from the menu
+                const confirmedTotal = typeof result.total_amount === 'number' ? result.total_amount : total;
+                this.showOrderQRModal(result.order_number, result.qr_code_url, confirmedTotal);
                 
                 // Clear cart after successful order
                 this.clearCart();
@@ -801,6 +788,69 @@ class ShoppingCart {
         }
     }
 
+    // One Idempotency-Key per order body: pressing the button again after a failed
+    // attempt, or reloading, reuses it so the server never creates the order twice.
+    // The signature covers everything the server compares (every item field,
+    // quantities and options included, and the location), so a changed cart gets a new key
+    getOrderIdempotencyKey(orderData) {
+        const signature = JSON.stringify([orderData.items, orderData.restaurant_location]);
+        const pending = JSON.parse(localStorage.getItem('tajPendingOrder') || 'null');
+        if (pending && pending.signature === signature) {
+            return pending.key;
+        }
+        const key = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem('tajPendingOrder', JSON.stringify({ key, signature }));
+        return key;
+    }
+
+    waitForConnection() {
+        return new Promise(resolve => window.addEventListener('online', resolve, { once: true }));
+    }
+
+    async submitOrder(orderData, onOffline) {
+        const idempotencyKey = this.getOrderIdempotencyKey(orderData);
+        const retryDelays = [1000, 2000, 4000];
+
+        for (let attempt = 0; ; attempt++) {
+            if (navigator.onLine === false) {
+                if (onOffline) onOffline();
+                await this.waitForConnection();
+            }
+            try {
+                const response = await fetch('/api/create-order', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'Idempotency-Key': idempotencyKey
+                    },
+                    body: JSON.stringify(orderData)
+                });
+                // Server errors may have happened after the order was stored; the key makes retrying safe
+                const retryable = response.status >= 500 || response.status === 429;
+                // Rejected for good (e.g. 422, key already used for another order):
+                // the next attempt must not reuse this key
+                if (response.status >= 400 && !retryable) {
+                    localStorage.removeItem('tajPendingOrder');
+                }
+                if (!retryable || attempt >= retryDelays.length) {
+                    return await response.json();
+                }
+                // Busy: wait as long as the server asks (capped) before the next attempt
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+                if (response.status === 429 && retryAfter > 0) {
+                    await new Promise(resolve => setTimeout(resolve, Math.min(retryAfter, 10) * 1000));
+                    continue;
+                }
+            } catch (error) {
+                if (attempt >= retryDelays.length) throw error;
+                console.warn('Order request failed, retrying', error);
+            }
+            await new Promise(resolve => setTimeout(resolve, retryDelays[attempt]));
+        }
+    }
+
     getCurrentRestaurantLocation() {
         // Extract restaurant location from URL path
         const path = window.location.pathname;
@@ -429,6 +429,15 @@ function addFadeInAnimation() {
 // Initialize animations CSS
 addFadeInAnimation();
 
+// Service worker: keeps the menu and cart usable offline (see offline.py)
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.warn('Service worker registration failed:', error);
+        });
+    });
+}
+
 // Export functions for global use
 window.TAJ = {
     scrollToSection,
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Versioned static asset URLs.
+
+asset_url(filename) links a static file with a hash of its contents
+(?v=...). init_static_assets(app) makes it available to templates and
+serves such URLs as immutable, so browsers (and the service worker, see
+offline.py) can cache them for good; a changed file gets a new URL.
+"""
+
+import hashlib
+import os
+import threading
+
+from flask import request, url_for
+
+# Cache lifetime of hashed (?v=) static URLs
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# filename -> (mtime, hash), recomputed when the file changes
+_asset_hashes = {}
+_asset_hashes_lock = threading.Lock()
+
+
+def asset_hash(static_folder: str, filename: str) -> str:
+    """Short hash of a static file's contents; empty if the file is missing."""
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return ''
+    with _asset_hashes_lock:
+        cached = _asset_hashes.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    with _asset_hashes_lock:
+        _asset_hashes[filename] = (mtime, digest)
+    return digest
+
+
+def asset_url(filename: str) -> str:
+    """URL of a static file, versioned by its contents."""
+    from flask import current_app
+
+    version = asset_hash(current_app.static_folder, filename)
+    if not version:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=version)
+
+
+def cache_headers(response):
+    """Serve hashed static URLs as immutable."""
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def init_static_assets(app):
+    """Register the asset_url template global and the immutable cache headers."""
+    app.add_template_global(asset_url, 'asset_url')
+    app.after_request(cache_headers)
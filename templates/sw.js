@@ -0,0 +1,161 @@
+// Taj service worker (served from /sw.js, see offline.py).
+// Precaches the hashed static assets, keeps a menu snapshot per location and
+// falls back to cached pages, so the menu and cart work offline or on a flaky
+// connection.
+const STATIC_CACHE = 'taj-static-{{ version }}';
+const PAGE_CACHE = 'taj-pages';
+const MENU_CACHE = 'taj-menu';
+const PRECACHE_URLS = {{ precache_urls|tojson }};
+// Past this, a slow response is treated as offline and the cached copy is used
+const NETWORK_TIMEOUT_MS = 3000;
+// Pages kept for offline use: the homepage, restaurant pages and their menus
+const OFFLINE_PAGE_PATTERN = /^\/(taj-[^/]+(\/menu)?)?$/;
+const CATEGORY_PATTERN = /^\/api\/menu\/([^/]+)\/categories\/(\d+)$/;
+
+// location -> snapshot refresh in progress
+const snapshotRefreshes = {};
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(STATIC_CACHE)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key.startsWith('taj-static-') && key !== STATIC_CACHE)
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (url.pathname.startsWith('/static/')) {
+        // Hashed URLs never change; other static files are refreshed in the background
+        event.respondWith(url.searchParams.has('v') ? cacheFirst(request) : staleWhileRevalidate(request));
+        return;
+    }
+
+    const category = url.pathname.match(CATEGORY_PATTERN);
+    if (category) {
+        event.respondWith(menuCategory(request, category[1], Number(category[2])));
+        return;
+    }
+
+    if (url.pathname.startsWith('/api/gallery-images/')) {
+        event.respondWith(staleWhileRevalidate(request));
+        return;
+    }
+
+    if (request.mode === 'navigate' && OFFLINE_PAGE_PATTERN.test(url.pathname)) {
+        const menuPage = url.pathname.match(/^\/taj-([^/]+)\/menu$/);
+        if (menuPage) {
+            event.waitUntil(refreshSnapshot(menuPage[1]));
+        }
+        event.respondWith(networkFirst(request));
+    }
+});
+
+function withTimeout(promise, ms) {
+    return new Promise((resolve, reject) => {
+        const timer = setTimeout(() => reject(new Error('Network timeout')), ms);
+        promise.then(
+            value => { clearTimeout(timer); resolve(value); },
+            error => { clearTimeout(timer); reject(error); }
+        );
+    });
+}
+
+async function cacheFirst(request) {
+    const cached = await caches.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok) {
+        const cache = await caches.open(STATIC_CACHE);
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(request) {
+    const cache = await caches.open(PAGE_CACHE);
+    const cached = await cache.match(request);
+    const network = fetch(request).then(response => {
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    });
+    if (cached) {
+        network.catch(() => {});
+        return cached;
+    }
+    return network;
+}
+
+async function networkFirst(request) {
+    const cache = await caches.open(PAGE_CACHE);
+    const network = fetch(request).then(response => {
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    });
+    try {
+        return await withTimeout(network, NETWORK_TIMEOUT_MS);
+    } catch (error) {
+        const cached = await cache.match(request);
+        // Without a cached copy, keep waiting for the network
+        return cached || network;
+    }
+}
+
+// Re-fetch a location's menu snapshot only if its version (the ETag) changed
+function refreshSnapshot(location) {
+    snapshotRefreshes[location] = (async () => {
+        const url = `/api/menu/${location}/snapshot`;
+        const cache = await caches.open(MENU_CACHE);
+        const cached = await cache.match(url);
+        const etag = cached && cached.headers.get('ETag');
+        try {
+            const response = await withTimeout(
+                fetch(url, {cache: 'no-store', headers: etag ? {'If-None-Match': etag} : {}}),
+                NETWORK_TIMEOUT_MS);
+            if (response.status === 200) {
+                await cache.put(url, response);
+            }
+        } catch (error) {
+            // Offline: keep the snapshot we have
+        }
+    })();
+    return snapshotRefreshes[location];
+}
+
+// Menu categories load as the menu page scrolls; answer them from the
+// snapshot, and from the network only if there is no snapshot yet
+async function menuCategory(request, location, categoryId) {
+    await snapshotRefreshes[location];
+    const snapshot = await caches.open(MENU_CACHE).then(cache => cache.match(`/api/menu/${location}/snapshot`));
+    if (snapshot) {
+        const menu = await snapshot.json();
+        const category = menu.categories.find(entry => entry.id === categoryId);
+        if (category) {
+            return new Response(JSON.stringify({category_id: categoryId, items: category.items}), {
+                headers: {'Content-Type': 'application/json'}
+            });
+        }
+    }
+    return fetch(request);
+}
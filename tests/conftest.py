@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import MenuDatabase  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A MenuDatabase in a temporary directory, with its shards and cache file beside it."""
+    monkeypatch.chdir(tmp_path)
+    return MenuDatabase(str(tmp_path / "taj_menu.db"))
+
+
+@pytest.fixture
+def app_module(db, monkeypatch):
+    """app.py, imported without warming up and serving from the temporary database."""
+    monkeypatch.setenv('WARMUP', '0')
+    import app as app_module
+    monkeypatch.setattr(app_module, 'db', db)
+    return app_module
@@ -0,0 +1,25 @@
+from admission import AdmissionController
+
+LIMITS = {'create_order': ((1 / 60, 2), (1 / 60, 5))}
+
+
+def test_busy_rejections_do_not_use_client_tokens():
+    admission = AdmissionController(LIMITS, max_writers=1)
+    assert admission.admit('create_order', 'guest') is None
+
+    for _ in range(3):
+        assert admission.admit('create_order', 'guest') is not None
+    admission.release()
+
+    assert admission.admit('create_order', 'guest') is None
+    assert admission.stats()['endpoints']['create_order']['rejected_busy'] == 3
+
+
+def test_endpoint_rejections_do_not_use_client_tokens():
+    admission = AdmissionController({'create_order': ((1 / 60, 2), (1 / 60, 1))}, max_writers=4)
+    assert admission.admit('create_order', 'kiosk') is None
+
+    assert admission.admit('create_order', 'guest') is not None
+
+    bucket = admission.client_buckets[('guest', 'create_order')]
+    assert bucket.tokens >= 2 - 1e-3
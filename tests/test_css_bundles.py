@@ -0,0 +1,41 @@
+import glob
+import os
+import shutil
+
+from css_bundles import (BUNDLE_DIR, CSS_URL_RE, SOURCE_CSS, STATIC_URL_PATH, absolute_urls,
+                         build_css_bundles)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC = os.path.join(ROOT, 'static')
+
+
+def test_relative_urls_become_static_paths():
+    css = ("a { background: url('../images/a.jpg'); }\n"
+           "b { background: url(../fonts/b.ttf) url(\"data:image/png;base64,AA\") url(https://x/y.png); }")
+
+    rewritten = absolute_urls(css, SOURCE_CSS)
+
+    assert "url('/static/images/a.jpg')" in rewritten
+    assert "url(/static/fonts/b.ttf)" in rewritten
+    assert 'url("data:image/png;base64,AA")' in rewritten
+    assert 'url(https://x/y.png)' in rewritten
+
+
+def test_every_bundle_url_exists(tmp_path):
+    static_dir = tmp_path / 'static'
+    (static_dir / 'css').mkdir(parents=True)
+    shutil.copy(os.path.join(STATIC, SOURCE_CSS), static_dir / SOURCE_CSS)
+    shutil.copytree(os.path.join(STATIC, 'js'), static_dir / 'js')
+
+    build_css_bundles(os.path.join(ROOT, 'templates'), str(static_dir))
+
+    outputs = glob.glob(str(static_dir / BUNDLE_DIR / '*.css'))
+    assert any(path.endswith('.critical.css') for path in outputs)
+    urls = set()
+    for path in outputs:
+        with open(path, encoding='utf-8') as f:
+            urls.update(match.group(2) for match in CSS_URL_RE.finditer(f.read()))
+    assert urls
+    for url in urls:
+        assert url.startswith(STATIC_URL_PATH + '/'), url
+        assert os.path.exists(os.path.join(STATIC, url[len(STATIC_URL_PATH) + 1:])), url
@@ -0,0 +1,33 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+
+import menu_io
+from database import LEGACY_SET_CURRY_PICKS, MenuDatabase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_into_a_fresh_database_seeds_set_choices(db, tmp_path, monkeypatch):
+    # An export from before choice groups: the live menu without its choice rows
+    export = tmp_path / 'menu.jsonl'
+    live = tmp_path / 'live.db'
+    shutil.copy(os.path.join(ROOT, 'taj_menu.db'), live)
+    source = sqlite3.connect(MenuDatabase(str(live)).db_path)
+    with open(export, 'w', encoding='utf-8') as f:
+        for table in menu_io.TABLE_ORDER:
+            for row in menu_io.iter_table(source, table):
+                if table != 'set_items' or not row['is_choice']:
+                    f.write(json.dumps({'table': table, **row}) + '\n')
+    source.close()
+
+    monkeypatch.setattr(sys, 'argv', ['menu_io.py', 'import', str(export)])
+    assert menu_io.main() == 0
+
+    with sqlite3.connect(db.db_path) as conn:
+        seeded = dict(conn.execute(
+            "SELECT set_id, MAX(quantity) FROM set_items WHERE choice_group = 'curry' GROUP BY set_id"))
+    assert seeded == {set_id: picks for set_id, picks in LEGACY_SET_CURRY_PICKS.items() if set_id in seeded}
+    assert 1 in seeded
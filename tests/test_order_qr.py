@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from order_qr import InvalidOrderQR, sign_order, verify_order
+
+QR_KEY = b'test-signing-key'
+
+
+def test_signed_code_verifies():
+    payload = sign_order(QR_KEY, 'TAJ-20300115-ABCD1234', 'nikko')
+
+    assert verify_order(QR_KEY, payload, 'nikko')[:2] == ('TAJ-20300115-ABCD1234', 'nikko')
+
+
+@pytest.mark.parametrize('payload', [
+    'TAJ-20300115-ABCD1234',
+    'TAJ-20300115-ABCD1234.nikko.notatime.signature',
+    'not an order.nikko.1.signature',
+])
+def test_malformed_code_is_rejected(payload):
+    with pytest.raises(InvalidOrderQR) as error:
+        verify_order(QR_KEY, payload)
+    assert error.value.reason == 'malformed'
+
+
+def test_tampered_code_is_rejected():
+    order_number, _location, issued_at, signature = sign_order(
+        QR_KEY, 'TAJ-20300115-ABCD1234', 'nikko').split('.')
+
+    for payload in (f"{order_number}.fuji.{issued_at}.{signature}",
+                    f"TAJ-20300115-ABCD9999.nikko.{issued_at}.{signature}",
+                    sign_order(b'another-key', order_number, 'nikko')):
+        with pytest.raises(InvalidOrderQR) as error:
+            verify_order(QR_KEY, payload)
+        assert error.value.reason == 'bad_signature'
+
+
+def test_code_from_another_branch_is_rejected():
+    payload = sign_order(QR_KEY, 'TAJ-20300115-ABCD1234', 'nikko')
+
+    with pytest.raises(InvalidOrderQR) as error:
+        verify_order(QR_KEY, payload, 'fuji')
+    assert error.value.reason == 'wrong_location'
+
+
+def test_expired_code_is_rejected():
+    payload = sign_order(QR_KEY, 'TAJ-20300115-ABCD1234', 'nikko', issued_at=int(time.time()) - 3601)
+
+    assert verify_order(QR_KEY, payload, 'nikko', max_age=3700)
+    with pytest.raises(InvalidOrderQR) as error:
+        verify_order(QR_KEY, payload, 'nikko', max_age=3600)
+    assert error.value.reason == 'expired'
+
+
+def test_location_with_a_separator_is_not_signed():
+    with pytest.raises(ValueError):
+        sign_order(QR_KEY, 'TAJ-20300115-ABCD1234', 'ni.kko')
+
+
+def test_store_order_rejects_an_unknown_location(app_module):
+    order = {'items': [{'type': 'menu_item', 'id': 1, 'quantity': 1, 'price': 500}],
+             'total_amount': 500, 'restaurant_location': 'ni.kko'}
+
+    _body, status = app_module.store_order(order)
+
+    assert status == 400
@@ -0,0 +1,42 @@
+import pytest
+
+from database import IdempotencyKeyReused
+
+ITEMS = [{'type': 'menu_item', 'id': 1, 'quantity': 2, 'price': 500, 'name': 'Butter Chicken'}]
+
+
+def order_data(items=ITEMS, location='nikko'):
+    return {'items': items, 'total_amount': 1000, 'restaurant_location': location}
+
+
+def count_orders(db):
+    return sum(len(db.get_orders_by_status(status)) for status in ('new', 'pending'))
+
+
+# Idempotency keys
+
+def test_replayed_key_returns_the_original_order(db):
+    first = db.create_order(order_data(), idempotency_key='key-1')
+    again = db.create_order(order_data(), idempotency_key='key-1')
+
+    assert again == first
+    assert count_orders(db) == 1
+
+
+def test_reused_key_with_a_different_order_is_rejected(db):
+    db.create_order(order_data(), idempotency_key='key-1')
+
+    with pytest.raises(IdempotencyKeyReused):
+        db.create_order(order_data(items=[dict(ITEMS[0], quantity=3)]), idempotency_key='key-1')
+    assert count_orders(db) == 1
+
+
+def test_store_order_answers_422_on_a_reused_key(app_module):
+    body, status = app_module.store_order(order_data(), 'key-1')
+    assert status == 200
+    replay, status = app_module.store_order(order_data(), 'key-1')
+    assert status == 200
+    assert replay['order_number'] == body['order_number']
+
+    _body, status = app_module.store_order(order_data(items=[dict(ITEMS[0], quantity=3)]), 'key-1')
+    assert status == 422
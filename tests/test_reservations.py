@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+import time
+
+from reservations import RESERVATION_SLOT_CAPACITY, RESERVATION_SLOTS, SlotFull
+
+
+def reservation(seats, slot=RESERVATION_SLOTS[0], email='guest@example.com'):
+    return {
+        'reservation_type': 'table',
+        'restaurant_location': 'nikko',
+        'day': '2030-01-15',
+        'slot': slot,
+        'seats': seats,
+        'email': email,
+    }
+
+
+def book_in_one_batch(db, bookings):
+    """Queue every booking behind a blocked write, so the writer commits them in one batch."""
+    writer = db._writer(db.db_path)
+    running = threading.Event()
+    release = threading.Event()
+
+    def block(conn):
+        running.set()
+        release.wait(5)
+
+    blocker = writer.submit(block)
+    assert running.wait(5)
+    outcomes = [None] * len(bookings)
+
+    def book(index):
+        try:
+            outcomes[index] = db.create_reservation(bookings[index])
+        except SlotFull as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=book, args=(index,)) for index in range(len(bookings))]
+    for thread in threads:
+        thread.start()
+    while writer.jobs.qsize() < len(bookings):
+        time.sleep(0.001)
+    batches = writer.batches
+    release.set()
+    blocker.result()
+    for thread in threads:
+        thread.join()
+    assert writer.batches - batches == 2  # the blocker's batch, then every booking together
+    return outcomes
+
+
+def slot_row(db, slot):
+    with sqlite3.connect(db.db_path) as conn:
+        return conn.execute('''
+            SELECT capacity, booked FROM reservation_slots
+            WHERE restaurant_location = 'nikko' AND day = '2030-01-15' AND slot = ?
+        ''', (slot,)).fetchone()
+
+
+def test_full_slot_rolls_back_only_its_own_write(db):
+    db.set_slot_capacity('nikko', '2030-01-15', RESERVATION_SLOTS[0], 4)
+    outcomes = book_in_one_batch(db, [reservation(2), reservation(2), reservation(2)])
+
+    full = [outcome for outcome in outcomes if isinstance(outcome, SlotFull)]
+    assert len(full) == 1
+    assert full[0].available == 0
+    assert slot_row(db, RESERVATION_SLOTS[0]) == (4, 4)
+    assert len(db.get_reservations('nikko', '2030-01-15', '2030-01-15')) == 2
+
+
+def test_full_slot_leaves_no_slot_row_behind(db):
+    # The slot row is created inside the failing write, so the savepoint must undo it
+    outcomes = book_in_one_batch(db, [reservation(RESERVATION_SLOT_CAPACITY + 1, slot=RESERVATION_SLOTS[1]),
+                                      reservation(2)])
+
+    assert isinstance(outcomes[0], SlotFull)
+    assert outcomes[0].available == RESERVATION_SLOT_CAPACITY
+    assert slot_row(db, RESERVATION_SLOTS[1]) is None
+    assert slot_row(db, RESERVATION_SLOTS[0]) == (RESERVATION_SLOT_CAPACITY, 2)
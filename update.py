@@ -1,58 +1,183 @@
 #!/usr/bin/env python3
-import json, os, sqlite3, csv, sys
+import json, os, sqlite3, csv, sys, time
 
 DB = "taj_menu.db"
 PLAN_FILE = "image_update_plan.json"
+MISSING_CSV = "skipped_missing_files.csv"
+# rows per write transaction; small chunks keep the write lock short on a live db
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "200"))
+# how long a chunk waits for the live app to release the write lock
+BUSY_TIMEOUT_MS = 5000
+# pause between chunks so app writers can get in
+CHUNK_PAUSE = 0.05
+# formats tried, in order, when the planned file is missing
+ALT_EXTENSIONS = (".webp", ".jpg", ".jpeg", ".png", ".avif")
 
-def main(apply=False):
+
+class DirectoryIndex:
+    """One os.scandir per image folder, then all lookups are dict hits."""
+
+    def __init__(self):
+        self.folders = {}
+
+    def folder(self, directory):
+        if directory not in self.folders:
+            names = {}
+            try:
+                with os.scandir(directory or ".") as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            names[entry.name] = entry.name
+            except FileNotFoundError:
+                pass
+            self.folders[directory] = names
+        return self.folders[directory]
+
+    def resolve(self, filesystem_path):
+        """Return the existing path for filesystem_path, trying other formats of the same image."""
+        directory, filename = os.path.split(filesystem_path)
+        names = self.folder(directory)
+        if filename in names:
+            return filesystem_path
+        base = os.path.splitext(filename)[0]
+        for ext in ALT_EXTENSIONS:
+            if base + ext in names:
+                return os.path.join(directory, base + ext)
+        return None
+
+
+def load_plan():
     with open(PLAN_FILE, "r", encoding="utf-8") as f:
         data = json.load(f)
-
-    plan = data.get("plan", [])
     # plan entries are [item_id, "/static/images/..", "static/images/.."]
-    to_apply = []
-    missing = []
+    return data.get("plan", [])
 
+
+def resolve_plan(plan):
+    index = DirectoryIndex()
+    resolved = []
+    missing = []
     for item_id, db_path, rel in plan:
         # prefer the filesystem relative path (third element)
         filesystem_path = rel
         if not os.path.isabs(filesystem_path):
             filesystem_path = os.path.normpath(filesystem_path)
-        if os.path.exists(filesystem_path):
-            to_apply.append((item_id, db_path, filesystem_path))
+        found = index.resolve(filesystem_path)
+        if found is None:
+            missing.append((item_id, db_path, filesystem_path, None))
+        elif found != filesystem_path:
+            print(f"will use alt: {found} for id {item_id}")
+            resolved.append((item_id, "/" + found.replace("\\", "/"), found))
         else:
-            # try alternative: change ext to .webp if the plan points to avif/png/jpg
-            base, ext = os.path.splitext(filesystem_path)
-            alt = base + ".webp"
-            if os.path.exists(alt):
-                print(f"will use alt: {alt} for id {item_id}")
-                to_apply.append((item_id, "/"+alt.replace("\\","/"), alt))
+            resolved.append((item_id, db_path, filesystem_path))
+    return resolved, missing
+
+
+def current_image_urls(conn, item_ids):
+    urls = {}
+    ids = list(item_ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for item_id, image_url in conn.execute(
+                f"SELECT id, image_url FROM menu_items WHERE id IN ({placeholders})", chunk):
+            urls[item_id] = image_url
+    return urls
+
+
+def diff_plan(conn, resolved):
+    """Split resolved entries into changes (with the url seen now), unchanged and unknown ids."""
+    # an id planned more than once keeps its last entry, as sequential updates would
+    latest = {}
+    for item_id, db_path, fs in resolved:
+        if item_id in latest:
+            print(f"id {item_id} planned more than once, using {db_path}")
+        latest[item_id] = db_path
+
+    urls = current_image_urls(conn, latest)
+    changes, unchanged, unknown = [], [], []
+    for item_id, db_path in latest.items():
+        if item_id not in urls:
+            unknown.append(item_id)
+        elif urls[item_id] == db_path:
+            unchanged.append(item_id)
+        else:
+            changes.append((item_id, urls[item_id], db_path))
+    return changes, unchanged, unknown
+
+
+def apply_changes(conn, changes):
+    """Apply changes in short chunked transactions.
+
+    Each row is only updated if its image_url still holds the value the diff
+    saw, so edits made through the admin page meanwhile are reported as
+    conflicts instead of being overwritten.
+    """
+    applied, conflicts = 0, []
+    for start in range(0, len(changes), CHUNK_SIZE):
+        chunk = changes[start:start + CHUNK_SIZE]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE menu_items SET image_url=?, updated_at = CURRENT_TIMESTAMP "
+                "WHERE id=? AND image_url IS ?",
+                [(new, item_id, old) for item_id, old, new in chunk])
+            after = current_image_urls(conn, [item_id for item_id, _, _ in chunk])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for item_id, old, new in chunk:
+            if after.get(item_id) == new:
+                applied += 1
             else:
-                missing.append((item_id, db_path, filesystem_path, alt if os.path.exists(alt) else None))
+                conflicts.append((item_id, old, after.get(item_id), new))
+        print(f"  chunk {start // CHUNK_SIZE + 1}: {len(chunk)} rows")
+        time.sleep(CHUNK_PAUSE)
+    return applied, conflicts
 
-    print(f"Found {len(to_apply)} files present, {len(missing)} missing")
+
+def main(apply=False):
+    plan = load_plan()
+    resolved, missing = resolve_plan(plan)
+
+    print(f"Found {len(resolved)} files present, {len(missing)} missing")
 
     # write missing to CSV for manual review
-    with open("skipped_missing_files.csv", "w", newline="", encoding="utf-8") as fh:
+    with open(MISSING_CSV, "w", newline="", encoding="utf-8") as fh:
         w = csv.writer(fh)
         w.writerow(["item_id","db_path","requested_fs_path","alt_webp_exists"])
         for r in missing:
             w.writerow(r)
 
-    if not apply:
-        print("Dry run. To apply run: APPLY=1 python3 apply_plan_safe.py")
-        for item_id, db_path, fs in to_apply[:20]:
-            print(f"Would update id {item_id} -> {db_path}")
-        return
-
-    # Apply updates
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    for item_id, db_path, fs in to_apply:
-        cur.execute("UPDATE menu_items SET image_url=?, updated_at = CURRENT_TIMESTAMP WHERE id=?", (db_path, item_id))
-    conn.commit()
-    conn.close()
-    print("Applied", len(to_apply), "updates. See skipped_missing_files.csv for missing ones.")
+    # autocommit mode: transactions are opened explicitly per chunk
+    conn = sqlite3.connect(DB, isolation_level=None)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    try:
+        changes, unchanged, unknown = diff_plan(conn, resolved)
+        print(f"{len(changes)} to change, {len(unchanged)} already up to date, {len(unknown)} unknown item ids")
+
+        if not apply:
+            print("Dry run. To apply run: APPLY=1 python3 update.py")
+            for item_id, old, new in changes:
+                print(f"~ id {item_id}: {old or '(none)'} -> {new}")
+            for item_id in unknown:
+                print(f"! id {item_id}: not in menu_items")
+            return
+
+        applied, conflicts = apply_changes(conn, changes)
+    finally:
+        conn.close()
+
+    if applied:
+        # Bumps the shared menu version, so app workers stop serving the old
+        # image paths within MENU_VERSION_CHECK_INTERVAL, as after menu_io.py import
+        from database import MenuDatabase
+        MenuDatabase(DB).invalidate_menu_cache()
+
+    for item_id, expected, found, new in conflicts:
+        print(f"conflict id {item_id}: expected {expected}, found {found}; left as is (wanted {new})")
+    print("Applied", applied, "updates,", len(conflicts), "conflicts. See", MISSING_CSV, "for missing ones.")
 
 if __name__ == "__main__":
     apply_flag = os.environ.get("APPLY","0") in ("1","true","True")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Startup warm-up and the readiness endpoint.
+
+After a restart, the first customers used to pay for compiling templates,
+filling the menu caches and reading cold SQLite pages. init_warmup(app,
+steps, probe) runs the warm-up steps once per worker process, on a
+background thread. It also adds /healthz/ready, which answers 503 until the
+steps have finished:
+
+    GET /healthz/ready
+    200 {"ready": true, "warmup": {...}, "database": {"latency_ms": 0.4, "stores": {...}}}
+
+A step that fails is logged and reported, but the worker still becomes
+ready. A database probe that fails or is slower than
+READY_MAX_DB_LATENCY_MS makes the worker not ready.
+"""
+
+import os
+import threading
+import time
+
+from flask import jsonify
+
+# WARMUP=0 skips the warm-up; workers are ready at once
+WARMUP = os.environ.get('WARMUP', '1') != '0'
+# Slower database round trips than this report the worker as not ready
+READY_MAX_DB_LATENCY_MS = float(os.environ.get('READY_MAX_DB_LATENCY_MS', '500'))
+
+
+class Warmup:
+    def __init__(self, app, steps):
+        self.app = app
+        # [(name, step)]; each step returns a short summary of what it loaded
+        self.steps = steps
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.finished_at = None
+        self.results = {}
+
+    def start(self):
+        """Run the steps on a background thread."""
+        with self.lock:
+            self.started_at = time.time()
+            self.finished_at = None
+            self.results = {}
+        threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    def run(self):
+        start = time.perf_counter()
+        # Steps may use url_for and current_app
+        with self.app.test_request_context():
+            for name, step in self.steps:
+                step_start = time.perf_counter()
+                try:
+                    result = {'result': step()}
+                except Exception as e:
+                    print(f"Warm-up step {name} failed: {e}")
+                    result = {'error': str(e)}
+                result['ms'] = round((time.perf_counter() - step_start) * 1000, 1)
+                with self.lock:
+                    self.results[name] = result
+        with self.lock:
+            self.finished_at = time.time()
+        print(f"Warm-up finished in {(time.perf_counter() - start) * 1000:.0f} ms (pid {os.getpid()})")
+
+    def skip(self):
+        with self.lock:
+            self.started_at = self.finished_at = time.time()
+
+    def restart_if_unfinished(self):
+        """A worker forked mid warm-up has no warm-up thread; start it again there."""
+        if self.started_at is not None and self.finished_at is None:
+            self.start()
+
+    def status(self):
+        with self.lock:
+            return {
+                'finished': self.finished_at is not None,
+                'seconds': round((self.finished_at or time.time()) - self.started_at, 2) if self.started_at else None,
+                'steps': dict(self.results),
+            }
+
+
+def init_warmup(app, steps, probe):
+    """Start warming up and register /healthz/ready.
+
+    probe() runs a database round trip and returns {store: milliseconds}.
+    """
+    warmup = Warmup(app, steps)
+
+    @app.route('/healthz/ready')
+    def healthz_ready():
+        """Readiness: warm-up finished and the database answers quickly"""
+        status = warmup.status()
+        try:
+            stores = probe()
+            latency = max(stores.values()) if stores else 0
+            database = {'ok': latency <= READY_MAX_DB_LATENCY_MS, 'latency_ms': latency, 'stores': stores}
+        except Exception as e:
+            database = {'ok': False, 'error': str(e)}
+        ready = status['finished'] and database['ok']
+        response = jsonify({'ready': ready, 'pid': os.getpid(), 'warmup': status, 'database': database})
+        response.status_code = 200 if ready else 503
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    if WARMUP:
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=warmup.restart_if_unfinished)
+        warmup.start()
+    else:
+        warmup.skip()
+    return warmup